@@ -21,10 +21,12 @@ __docformat__ = 'reStructuredText'
 
 import persistent.dict
 from decimal import Decimal
+from BTrees.OOBTree import OOBTree
 
 import zope.interface
 from zope import annotation
 from zope.container.interfaces import INameChooser
+from zope.intid.interfaces import IIntIds
 from zope.keyreference.interfaces import IKeyReference
 from zope.security import proxy
 from zope.component import queryAdapter, getAdapters, getUtility
@@ -34,13 +36,17 @@ from schooltool.app.interfaces import ISchoolToolApplication
 from schooltool.gradebook import GradebookMessage as _
 from schooltool.requirement import requirement, scoresystem
 from schooltool.gradebook import interfaces
+from schooltool.gradebook.preferences import getGradebookPreferences
 from schooltool.term.interfaces import IDateManager
 from schooltool.course.interfaces import ISection
+from schooltool.schoolyear.interfaces import ISchoolYear
 
 ACTIVITIES_KEY = 'schooltool.gradebook.activities'
 CATEGORY_WEIGHTS_KEY = 'schooltool.gradebook.categoryweights'
 COURSE_ACTIVITIES_KEY = 'schooltool.gradebook.course_activities'
 COURSE_DEPLOYED_WORKSHEETS_KEY = 'schooltool.gradebook.course_deployed'
+LINKED_COLUMN_SOURCES_KEY = 'schooltool.gradebook.linked_column_sources'
+INTID_SOURCE_PREFIX = u'intid'
 
 
 def ensureAtLeastOneWorksheet(worksheets, factory=None, title=None):
@@ -60,22 +66,54 @@ def ensureAtLeastOneWorksheet(worksheets, factory=None, title=None):
 
 
 def createSourceString(sourceObj):
+    """Create the source string of a linked column.
+
+    The source string holds the int ids of the worksheet and the activity,
+    or 'ave' when the linked column shows the worksheet average.
+    """
+    intids = getUtility(IIntIds)
+    sourceObj = proxy.removeSecurityProxy(sourceObj)
     if interfaces.IActivity.providedBy(sourceObj):
-        act_hash = unicode(hash(IKeyReference(sourceObj)))
+        act_id = unicode(intids.register(sourceObj))
         worksheet = sourceObj.__parent__
     else:
-        act_hash = 'ave'
+        act_id = u'ave'
         worksheet = sourceObj
-    section = worksheet.__parent__.__parent__
-    sectionContainer = section.__parent__
-    return '%s_%s_%s_%s' % (sectionContainer.__name__, section.__name__,
-        unicode(hash(IKeyReference(worksheet))), act_hash)
+    return u'%s_%s_%s' % (INTID_SOURCE_PREFIX, intids.register(worksheet),
+                          act_id)
 
 
-def getSourceObj(source):
-    if source is None:
+def isIntIdSource(source):
+    return source is not None and source.startswith(INTID_SOURCE_PREFIX + '_')
+
+
+def getIntIdSourceObj(source):
+    items = source.split('_')
+    if len(items) != 3 or items[0] != INTID_SOURCE_PREFIX:
         return None
+    intids = getUtility(IIntIds)
+    try:
+        worksheet = intids.queryObject(int(items[1]))
+        if not interfaces.IWorksheet.providedBy(worksheet):
+            return None
+        if items[2] == 'ave':
+            return worksheet
+        activity = intids.queryObject(int(items[2]))
+    except ValueError:
+        return None
+    if (not interfaces.IActivity.providedBy(activity) or
+        activity.__parent__ is not worksheet):
+        return None
+    return activity
 
+
+def getLegacySourceObj(source):
+    """Find the source of a linked column by hashes of key references.
+
+    Source strings used to be made of the names of the section container
+    and the section, and hashes of the key references of the worksheet and
+    the activity.
+    """
     items = source.split('_')
     scid = items[0]
     ws_hash = items[-2]
@@ -105,17 +143,63 @@ def getSourceObj(source):
     return None
 
 
-def isHiddenSource(source):
+def getLinkedColumnSourceIndex(app):
+    """Get the index of legacy source strings to int id source strings."""
+    ann = annotation.interfaces.IAnnotations(app)
+    if LINKED_COLUMN_SOURCES_KEY not in ann:
+        ann[LINKED_COLUMN_SOURCES_KEY] = OOBTree()
+    return ann[LINKED_COLUMN_SOURCES_KEY]
+
+
+def queryLinkedColumnSourceIndex(app):
+    ann = annotation.interfaces.IAnnotations(app)
+    return ann.get(LINKED_COLUMN_SOURCES_KEY)
+
+
+def getSourceObj(source):
+    if source is None:
+        return None
+    if isIntIdSource(source):
+        return getIntIdSourceObj(source)
+    app = ISchoolToolApplication(None)
+    index = queryLinkedColumnSourceIndex(app)
+    if index is not None and source in index:
+        return getIntIdSourceObj(index[source])
+    return getLegacySourceObj(source)
+
+
+def getSourceWorksheet(source):
+    """Get the worksheet of the source of a linked column, None if gone."""
     obj = getSourceObj(source)
     if obj is None:
-        return True
+        return None
     if interfaces.IActivityWorksheet.providedBy(obj):
-        worksheet = obj
-    else:
-        worksheet = obj.__parent__
+        return obj
+    return obj.__parent__
+
+
+def isHiddenSource(source):
+    worksheet = getSourceWorksheet(source)
+    if worksheet is None:
+        return True
     return worksheet.hidden
 
 
+def queryWorksheetSchoolYear(worksheet):
+    section = ISection(worksheet, None)
+    if section is None:
+        return None
+    return ISchoolYear(section, None)
+
+
+def queryLinkedColumnGraph(worksheet):
+    """Get the linked column graph of the school year of the worksheet."""
+    schoolyear = queryWorksheetSchoolYear(worksheet)
+    if schoolyear is None:
+        return None
+    return interfaces.ILinkedColumnGraph(schoolyear, None)
+
+
 def today():
     today = getUtility(IDateManager).today
     return today
@@ -148,11 +232,9 @@ class Worksheets(requirement.Requirement):
     def getCurrentSectionWorksheets(self, person):
         if self.annotations_current_worksheet_key is None:
             return None
-        person = proxy.removeSecurityProxy(person)
-        ann = annotation.interfaces.IAnnotations(person)
-        if self.annotations_current_worksheet_key not in ann:
-            ann[self.annotations_current_worksheet_key] = persistent.dict.PersistentDict()
-        return ann[self.annotations_current_worksheet_key]
+        prefs = getGradebookPreferences(person)
+        return prefs.getCurrentWorksheets(
+            self.annotations_current_worksheet_key)
 
     @property
     def worksheets(self):
@@ -163,8 +245,18 @@ class Worksheets(requirement.Requirement):
         return [w for k, w in self.items()]
 
     def values(self):
-        worksheets = super(Worksheets, self).values()
-        return [w for w in worksheets if not w.hidden]
+        """The worksheets that are not hidden.
+
+        They are cached until the worksheets change, hiding or showing a
+        worksheet counts as a change of its container.
+        """
+        cached = getattr(self, '_v_visible', None)
+        if cached is None or cached[0] != self._version:
+            worksheets = super(Worksheets, self).values()
+            cached = self._v_visible = (
+                self._version,
+                tuple([w for w in worksheets if not w.hidden]))
+        return cached[1]
 
     def resetCurrentWorksheet(self, person):
         person = proxy.removeSecurityProxy(person)
@@ -183,10 +275,12 @@ class Worksheets(requirement.Requirement):
         return worksheet
 
     def setCurrentWorksheet(self, person, worksheet):
-        current = self.getCurrentSectionWorksheets(person)
-        worksheet = proxy.removeSecurityProxy(worksheet)
+        if self.annotations_current_worksheet_key is None:
+            return
+        prefs = getGradebookPreferences(person)
         section_id = hash(IKeyReference(self.__parent__))
-        current[section_id] = worksheet
+        prefs.setCurrentWorksheet(self.annotations_current_worksheet_key,
+                                  section_id, worksheet)
 
     def getCurrentActivities(self, person):
         worksheet = self.getCurrentWorksheet(person)
@@ -215,7 +309,34 @@ class GenericWorksheet(requirement.Requirement):
                               annotation.interfaces.IAttributeAnnotatable)
 
     deployed = False
-    hidden = False
+    _hidden = False
+
+    def __setstate__(self, state):
+        # Worksheets stored before hiding them was tracked keep the flag
+        # in their hidden attribute
+        if 'hidden' in state:
+            state['_hidden'] = state.pop('hidden')
+        super(GenericWorksheet, self).__setstate__(state)
+
+    def _getHidden(self):
+        return self._hidden
+
+    def _setHidden(self, hidden):
+        if hidden == self._hidden:
+            return
+        self._hidden = hidden
+        # The visible worksheets of the container and the linked columns
+        # using the worksheet change
+        parent = self.__parent__
+        if parent is None:
+            return
+        if isinstance(parent, requirement.Requirement):
+            parent._changed()
+        graph = queryLinkedColumnGraph(self)
+        if graph is not None:
+            graph.sourcesChanged()
+
+    hidden = property(_getHidden, _setHidden)
 
 
 class WorksheetAnnotatableMixin(object):
@@ -224,7 +345,8 @@ class WorksheetAnnotatableMixin(object):
     def getCategoryWeights(self):
         ann = annotation.interfaces.IAnnotations(self)
         if CATEGORY_WEIGHTS_KEY not in ann:
-            ann[CATEGORY_WEIGHTS_KEY] = persistent.dict.PersistentDict()
+            # Don't write when reading
+            return persistent.dict.PersistentDict()
         return ann[CATEGORY_WEIGHTS_KEY]
 
     def setCategoryWeight(self, category, weight):
@@ -239,12 +361,38 @@ class Worksheet(GenericWorksheet, WorksheetAnnotatableMixin):
                               annotation.interfaces.IAttributeAnnotatable)
 
     def values(self):
+        """The activities, without the linked columns of hidden sources.
+
+        They are cached until the activities change or the link graphs of
+        the school years of the worksheet and the sources change.  Without
+        link graphs they are not cached.
+        """
+        cached = getattr(self, '_v_visible', None)
+        if cached is not None:
+            version, graphs, states, activities = cached
+            if (version == self._version and
+                [graph.getState() for graph in graphs] == states):
+                return activities
         activities = []
+        graphs = []
         for activity in super(Worksheet, self).values():
             if interfaces.ILinkedColumnActivity.providedBy(activity):
-                if isHiddenSource(activity.source):
+                if not graphs:
+                    graphs.append(queryLinkedColumnGraph(self))
+                source = getSourceWorksheet(activity.source)
+                if source is None:
+                    continue
+                graph = queryLinkedColumnGraph(source)
+                if graph not in graphs:
+                    graphs.append(graph)
+                if source.hidden:
                     continue
             activities.append(activity)
+        activities = tuple(activities)
+        if None not in graphs:
+            self._v_visible = (self._version, graphs,
+                               [graph.getState() for graph in graphs],
+                               activities)
         return activities
 
     def canAverage(self):
@@ -0,0 +1,284 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Stored worksheet averages
+
+The totals and averages of the students in a worksheet are stored in the
+grade matrix of the worksheet, so that gradebooks and reports can read
+them instead of computing them.  When grades, activities or worksheets
+change, the stored averages of the worksheet and of the worksheets that
+depend on it through linked columns are dropped, and recomputed when the
+transaction commits.  Averages that are not stored are computed when read.
+"""
+__docformat__ = 'reStructuredText'
+
+import logging
+import weakref
+from collections import OrderedDict
+
+import transaction
+from ZODB.POSException import ConflictError
+from zope.component import adapts
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+from zope.security import proxy
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.requirement.interfaces import IEvaluation, IEvaluations
+from schooltool.requirement.interfaces import IEvaluationsModifiedEvent
+from schooltool.requirement.interfaces import ICustomScoreSystem
+from schooltool.schoolyear.subscriber import ObjectEventAdapterSubscriber
+from schooltool.task.tasks import RemoteTask
+
+from schooltool.gradebook import interfaces
+from schooltool.gradebook.linkgraph import queryDependentWorksheets
+from schooltool.gradebook.matrix import queryIntId
+
+
+logger = logging.getLogger(__name__)
+
+def updateWorksheetAverages(worksheet, students=None):
+    """Compute and store the averages of the students in the worksheet.
+
+    All the students of the section if students is None.  Students that
+    are not in the section are skipped.
+    """
+    worksheet = proxy.removeSecurityProxy(worksheet)
+    if (not interfaces.IActivityWorksheet.providedBy(worksheet) or
+        getattr(worksheet.__parent__, '__parent__', None) is None):
+        # The worksheet was removed
+        return
+    matrix = interfaces.IGradeMatrix(worksheet, None)
+    gradebook = interfaces.IGradebook(worksheet, None)
+    if matrix is None or gradebook is None:
+        return
+    gradebook = proxy.removeSecurityProxy(gradebook)
+    if students is None:
+        students = [proxy.removeSecurityProxy(student)
+                    for student in gradebook.students]
+    else:
+        students = [student for student in students
+                    if gradebook.snapshot.hasStudent(student)]
+    averages = gradebook.computeWorksheetTotalAverages(worksheet, students)
+    for student, average in zip(students, averages):
+        student_id = queryIntId(student)
+        if student_id is not None:
+            matrix.setAverage(student_id, average)
+
+
+def dropWorksheetAverages(worksheet, students=None):
+    """Drop the stored averages of the students in the worksheet."""
+    matrix = interfaces.IGradeMatrix(worksheet, None)
+    if matrix is None:
+        return
+    if students is None:
+        matrix.clearAverages()
+    else:
+        for student in students:
+            matrix.removeAverage(queryIntId(student))
+
+
+class AveragesUpdate(object):
+    """Stored averages to recompute when the transaction commits.
+
+    Worksheets are kept in the order they were last invalidated in, which
+    puts the worksheets after the worksheets they depend on.
+    """
+
+    def __init__(self):
+        self.worksheets = OrderedDict()
+
+    def add(self, worksheet, students=None):
+        pending = self.worksheets.pop(worksheet, set())
+        if students is None or pending is None:
+            pending = None
+        else:
+            pending.update(students)
+        self.worksheets[worksheet] = pending
+
+    def __call__(self):
+        for worksheet, students in self.worksheets.items():
+            try:
+                updateWorksheetAverages(worksheet, students)
+            except ConflictError:
+                raise
+            except Exception:
+                # Failing to store averages must not lose the changes that
+                # invalidated them; the averages are computed when read.
+                logger.exception('Could not update the stored averages'
+                                 ' of worksheet %r', worksheet)
+                dropWorksheetAverages(worksheet, students)
+
+
+# Pending updates by transaction
+_updates = weakref.WeakKeyDictionary()
+
+
+def queueAveragesUpdate(worksheet, students=None):
+    txn = transaction.get()
+    update = _updates.get(txn)
+    if update is None:
+        update = _updates[txn] = AveragesUpdate()
+        txn.addBeforeCommitHook(update)
+    update.add(worksheet, students)
+
+
+def invalidateWorksheetAverages(worksheet, students=None):
+    """Drop the stored averages of the students in the worksheet.
+
+    The averages of the worksheets depending on the worksheet are dropped
+    too, they are all recomputed when the transaction commits.  Averages
+    of all the students are dropped if students is None.
+    """
+    worksheet = proxy.removeSecurityProxy(worksheet)
+    if students is not None:
+        students = [proxy.removeSecurityProxy(student)
+                    for student in students]
+    worksheets = [worksheet] + queryDependentWorksheets(worksheet)
+    for worksheet in worksheets:
+        if interfaces.IGradeMatrix(worksheet, None) is None:
+            continue
+        dropWorksheetAverages(worksheet, students)
+        queueAveragesUpdate(worksheet, students)
+
+
+def iterSectionWorksheets(app):
+    for sections in app['schooltool.course.section'].values():
+        for section in sections.values():
+            for worksheet in interfaces.IActivities(section).values():
+                if interfaces.IActivityWorksheet.providedBy(worksheet):
+                    yield worksheet
+
+
+def rebuildWorksheetAverages(app):
+    """Recompute the stored averages of all the section worksheets."""
+    # Drop all averages first, so that linked worksheet averages are not
+    # computed from averages that are not rebuilt yet
+    for worksheet in iterSectionWorksheets(app):
+        matrix = interfaces.IGradeMatrix(worksheet, None)
+        if matrix is not None:
+            matrix.clearAverages()
+    for worksheet in iterSectionWorksheets(app):
+        updateWorksheetAverages(worksheet)
+
+
+def invalidateScoreSystemAverages(app, scoresystem):
+    """Drop the stored averages of the worksheets using the score system.
+
+    Custom score systems are edited in place, so the averages computed
+    with their old values are recomputed when the transaction commits.
+    """
+    scoresystem = proxy.removeSecurityProxy(scoresystem)
+    for worksheet in iterSectionWorksheets(app):
+        for activity in worksheet.values():
+            used = proxy.removeSecurityProxy(
+                getattr(activity, 'scoresystem', None))
+            if used is scoresystem:
+                invalidateWorksheetAverages(worksheet)
+                break
+
+
+class RebuildWorksheetAveragesTask(RemoteTask):
+    """Repair the stored averages of all the section worksheets."""
+
+    def execute(self, request):
+        rebuildWorksheetAverages(ISchoolToolApplication(None))
+
+
+def invalidateEvaluation(evaluations, evaluation):
+    activity = evaluation.requirement
+    if interfaces.IActivity.providedBy(activity):
+        invalidateWorksheetAverages(activity.__parent__,
+                                    [evaluations.__parent__])
+
+
+class EvaluationAddedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute averages when evaluations are added."""
+    adapts(IObjectAddedEvent, IEvaluation)
+
+    def __call__(self):
+        evaluations = self.event.newParent
+        if IEvaluations.providedBy(evaluations):
+            invalidateEvaluation(evaluations, self.object)
+
+
+class EvaluationRemovedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute averages when evaluations are removed."""
+    adapts(IObjectRemovedEvent, IEvaluation)
+
+    def __call__(self):
+        evaluations = self.event.oldParent
+        if IEvaluations.providedBy(evaluations):
+            invalidateEvaluation(evaluations, self.object)
+
+
+class EvaluationsModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute averages when a batch of evaluations is added."""
+    adapts(IEvaluationsModifiedEvent, IEvaluations)
+
+    def __call__(self):
+        for evaluation in self.event.evaluations:
+            invalidateEvaluation(self.object, evaluation)
+
+
+class ActivityAddedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute the averages of worksheets when activities are added."""
+    adapts(IObjectAddedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        worksheet = self.event.newParent
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            invalidateWorksheetAverages(worksheet)
+
+
+class ActivityRemovedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute the averages of worksheets when activities are removed."""
+    adapts(IObjectRemovedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        worksheet = self.event.oldParent
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            invalidateWorksheetAverages(worksheet)
+
+
+class ActivityModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute the averages of worksheets when activities are edited."""
+    adapts(IObjectModifiedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        worksheet = self.object.__parent__
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            invalidateWorksheetAverages(worksheet)
+
+
+class WorksheetModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute the averages of edited worksheets."""
+    adapts(IObjectModifiedEvent, interfaces.IActivityWorksheet)
+
+    def __call__(self):
+        invalidateWorksheetAverages(self.object)
+
+
+class ScoreSystemModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Recompute the averages graded with an edited score system."""
+    adapts(IObjectModifiedEvent, ICustomScoreSystem)
+
+    def __call__(self):
+        invalidateScoreSystemAverages(ISchoolToolApplication(None),
+                                      self.object)
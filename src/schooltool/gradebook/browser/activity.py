@@ -24,6 +24,8 @@ from StringIO import StringIO
 
 from zope.cachedescriptors.property import Lazy
 from zope.container.interfaces import INameChooser
+from zope.event import notify
+from zope.lifecycleevent import ObjectModifiedEvent
 from zope.browserpage.viewpagetemplatefile import ViewPageTemplateFile
 from zope.i18n import translate
 from zope.i18n.interfaces.locales import ICollator
@@ -55,6 +57,7 @@ from schooltool.export import export
 from schooltool.gradebook import GradebookMessage as _
 from schooltool.gradebook import interfaces
 from schooltool.gradebook.activity import createSourceString, getSourceObj
+from schooltool.gradebook.activity import isIntIdSource
 from schooltool.gradebook.activity import Activity, LinkedColumnActivity
 from schooltool.gradebook.activity import LinkedActivity
 from schooltool.gradebook.activity import Worksheet
@@ -660,6 +663,7 @@ class WeightCategoriesView(object):
                     if value is not None:
                         value = value / 100
                     self.context.setCategoryWeight(category, value)
+                notify(ObjectModifiedEvent(self.context))
                 self.request.response.redirect(self.nextURL())
 
     def rows(self):
@@ -770,12 +774,14 @@ class WorksheetsExportView(export.ExcelExportView):
         factory = getUtility(IPersonFactory)
         sorting_key = lambda x: factory.getSortingKey(x, collator)
         students = sorted(gradebook.students, key=sorting_key)
+        worksheet_scores = gradebook.getWorksheetScores(worksheet, students)
         for row, student in enumerate(students):
+            scores = worksheet_scores[row]
             cells = [export.Text(IDemographics(student).get('ID', ''))]
             for column in self.name_sorting_columns:
                 cells.append(export.Text(getattr(student, column.name)))
             for activity in activities:
-                score = gradebook.getScore(student, activity)
+                score = scores.get(activity.__name__)
                 if not score:
                     value = ''
                 else:
@@ -915,11 +921,12 @@ class LinkedColumnBase(BrowserView):
     def getRequestSource(self):
         for key in self.request:
             parts = key.split('_')
-            if len(parts) > 3:
+            if isIntIdSource(key) or len(parts) > 3:
                 try:
                     sourceObj = getSourceObj(key)
                     if sourceObj is not None:
-                        return key
+                        # Store legacy sources in the int id format
+                        return createSourceString(sourceObj)
                 except:
                     pass
         return None
@@ -940,6 +947,7 @@ class LinkedColumnBase(BrowserView):
             target.label = label
             target.category = category
             target.source = source
+            notify(ObjectModifiedEvent(target))
 
 
 class AddLinkedColumnView(LinkedColumnBase):
@@ -63,7 +63,9 @@ def printGradebook(contents):
     tabs_table_rows.append(worksheet_tabs(contents))
 
     grades_table_rows = []
-    gradebook_rows = queryHTML('//table[@class="schooltool_gradebook"][2]//tr', contents)
+    gradebook_rows = queryHTML(
+        '//table[@class="schooltool_gradebook"][2]'
+        '//tr[not(@class="averages-row")]', contents)
     for row_number, row in enumerate(gradebook_rows):
         # we don't care about these rows
         # first (0): activity description
@@ -22,12 +22,11 @@ Gradebook Views
 __docformat__ = 'reStructuredText'
 
 import pytz
+import hashlib
 from collections import OrderedDict
 import datetime
 from decimal import Decimal
-from decimal import InvalidOperation
 import urllib
-from lxml import html
 
 from zope.container.interfaces import INameChooser
 from zope.browserpage.viewpagetemplatefile import ViewPageTemplateFile
@@ -59,16 +58,16 @@ import schooltool.skin.flourish.form
 import schooltool.contact.contact
 from schooltool.app.interfaces import ISchoolToolApplication
 from schooltool.app.interfaces import IApplicationPreferences
-from schooltool.app.interfaces import IRelationshipStateContainer
 from schooltool.app.membership import Membership
-from schooltool.app.states import ACTIVE
 from schooltool.common.inlinept import InheritTemplate
 from schooltool.common.inlinept import InlineViewPageTemplate
 from schooltool.contact.interfaces import IContact
 from schooltool.course.interfaces import ISection
 from schooltool.course.interfaces import ILearner, IInstructor
 from schooltool.gradebook import interfaces
+from schooltool.gradebook import comments
 from schooltool.gradebook.activity import ensureAtLeastOneWorksheet
+from schooltool.gradebook.averages import RebuildWorksheetAveragesTask
 from schooltool.gradebook.activity import createSourceString, getSourceObj
 from schooltool.gradebook.activity import Worksheet, LinkedColumnActivity
 from schooltool.gradebook.gradebook import (getCurrentSectionTaught,
@@ -76,6 +75,8 @@ from schooltool.gradebook.gradebook import (getCurrentSectionTaught,
     setCurrentSectionAttended)
 from schooltool.gradebook.gradebook import getCurrentEnrollmentMode
 from schooltool.gradebook.gradebook import setCurrentEnrollmentMode
+from schooltool.gradebook.stamp import getChangeStamp
+from schooltool.gradebook.stamp import getScoreSystemsVersion
 from schooltool.person.interfaces import IPerson
 from schooltool.person.interfaces import IPersonFactory
 from schooltool.requirement.scoresystem import UNSCORED, ScoreValidationError
@@ -101,10 +102,15 @@ RANGED_SCORE_SYSTEM = 'r'
 COMMENT_SCORE_SYSTEM = 'c'
 SUMMARY_TITLE = _('Summary')
 
+# Rows and columns of the gradebook table rendered with the page, the rest
+# is loaded through the table_window view.
+ROW_WINDOW_SIZE = 100
+COLUMN_WINDOW_SIZE = 40
+
 
 def getColumnKeys(gradebook):
     column_keys =  [('total', _("Total")), ('average', _("Ave."))]
-    journal_data = interfaces.ISectionJournalData(ISection(gradebook), None)
+    journal_data = gradebook.snapshot.journal_data
     if journal_data is not None:
         column_keys = ([('absences', _("Abs.")), ('tardies', _("Trd."))] +
             column_keys)
@@ -116,9 +122,50 @@ def convertAverage(average, scoresystem):
     if (scoresystem is None or
         not IDiscreteValuesScoreSystem.providedBy(scoresystem)):
         return '%.1f%%' % average
-    for score in scoresystem.scores:
-        if average >= score[3]:
-            return score[0]
+    return scoresystem.lookup.convertPercent(average)
+
+
+class ColumnStatistics(object):
+    """Count, total, minimum and maximum of the numeric scores of a column.
+
+    Unscored and non numeric scores are ignored.
+    """
+
+    def __init__(self, max):
+        self.max = max
+        self.count = 0
+        self.total = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, score):
+        if not score:
+            return
+        value = score.value
+        if isinstance(value, float):
+            value = Decimal(str(value))
+        elif not isinstance(value, (int, long, Decimal)):
+            return
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def possible(self):
+        """Points that could have been scored by the counted scores."""
+        if not self.count:
+            return 0
+        return self.count * int(self.max)
+
+    @property
+    def average(self):
+        """Average of the scores in percent of the possible points."""
+        if not self.possible:
+            return None
+        return (100 * self.total) / Decimal(self.possible)
 
 
 class GradebookStartup(object):
@@ -255,8 +302,25 @@ class GradebookBase(BrowserView):
         activities = self.context.__parent__.__parent__
         return not activities.worksheets
 
-    @property
-    def scores(self):
+    def getScoreSystemInfo(self, scoresystem):
+        """Describe a score system for validating scores in the browser.
+
+        Discrete score systems list their labels, ranged score systems give
+        their minimum and maximum; scores above the maximum are extra
+        credit.
+        """
+        if IDiscreteValuesScoreSystem.providedBy(scoresystem):
+            return {'type': DISCRETE_SCORE_SYSTEM,
+                    'labels': [score[0] for score in scoresystem.scores]}
+        elif IRangedValuesScoreSystem.providedBy(scoresystem):
+            return {'type': RANGED_SCORE_SYSTEM,
+                    'min': unicode(scoresystem.min),
+                    'max': unicode(scoresystem.max)}
+        return {'type': COMMENT_SCORE_SYSTEM}
+
+    @Lazy
+    def score_systems(self):
+        """Score system info of the activities of the current worksheet."""
         results = {}
         person = IPerson(self.request.principal)
         gradebook = proxy.removeSecurityProxy(self.context)
@@ -264,17 +328,22 @@ class GradebookBase(BrowserView):
         for activity in gradebook.getWorksheetActivities(worksheet):
             if interfaces.ILinkedColumnActivity.providedBy(activity):
                 continue
-            ss = activity.scoresystem
-            if IDiscreteValuesScoreSystem.providedBy(ss):
-                result = [DISCRETE_SCORE_SYSTEM] + [score[0]
-                    for score in ss.scores]
-            elif IRangedValuesScoreSystem.providedBy(ss):
-                result = [RANGED_SCORE_SYSTEM, ss.min, ss.max]
-            else:
-                result = [COMMENT_SCORE_SYSTEM]
+            results[activity.__name__] = self.getScoreSystemInfo(
+                gradebook.snapshot.getScoreSystem(activity))
+        return results
+
+    @property
+    def scores(self):
+        results = {}
+        for name, info in self.score_systems.items():
+            result = [info['type']]
+            if info['type'] == DISCRETE_SCORE_SYSTEM:
+                result.extend(info['labels'])
+            elif info['type'] == RANGED_SCORE_SYSTEM:
+                result.extend([info['min'], info['max']])
             resultStr = ', '.join(["'%s'" % unicode(value)
                 for value in result])
-            results[activity.__name__] = resultStr
+            results[name] = resultStr
         return results
 
     def breakJSString(self, origstr):
@@ -430,7 +499,7 @@ class SectionFinder(GradebookBase):
             columnPreferences = gradebook.getColumnPreferences(person)
         column_keys_dict = dict(getColumnKeys(gradebook))
 
-        journal_data = interfaces.ISectionJournalData(ISection(gradebook), None)
+        journal_data = gradebook.snapshot.journal_data
         prefs = columnPreferences.get('absences', {})
         if journal_data is None:
             self.absences_hide = True
@@ -497,6 +566,280 @@ class JSONScoresBase(object):
         return json
 
 
+class CachingCollator(object):
+    """A collator that remembers the keys of the texts it has seen."""
+
+    def __init__(self, collator, keys):
+        self.collator = collator
+        self.keys = keys
+
+    def key(self, text):
+        try:
+            return self.keys[text]
+        except KeyError:
+            key = self.keys[text] = self.collator.key(text)
+            return key
+
+    def cmp(self, one, other):
+        return cmp(self.key(one), self.key(other))
+
+
+COLLATORS_KEY = 'schooltool.gradebook.collators'
+
+
+def getCachingCollator(request):
+    """Get the caching collator of the locale of the request.
+
+    Collators are not thread safe, they are only shared within a request.
+    """
+    locale = request.locale
+    annotations = getattr(request, 'annotations', None)
+    if annotations is None:
+        return CachingCollator(ICollator(locale), {})
+    collators = annotations.setdefault(COLLATORS_KEY, {})
+    locale_id = (locale.id.language, locale.id.territory, locale.id.variant)
+    collator = collators.get(locale_id)
+    if collator is None:
+        collator = collators[locale_id] = CachingCollator(
+            ICollator(locale), {})
+    return collator
+
+
+# Sort key of grades that are not numbers
+NO_SORT_KEY = -9999999.9
+
+_unset = object()
+
+
+class GradebookColumn(object):
+    """The grades of an activity in the rows of a gradebook table model.
+
+    Display values and hidden values are kept in lists parallel to the
+    rows of the model, filled in when first asked for.  Sort keys and
+    statistics are computed from the scores of the rows.
+    """
+
+    def __init__(self, model, activity_info):
+        self.model = model
+        self.info = activity_info
+        scoresystem = activity_info['object'].scoresystem
+        self.is_comment = ICommentScoreSystem.providedBy(scoresystem)
+        self.is_discrete = IDiscreteValuesScoreSystem.providedBy(scoresystem)
+        size = len(model.rows)
+        self.values = [_unset] * size
+        self.hidden_values = [_unset] * size
+
+    def value(self, index):
+        value = self.values[index]
+        if value is _unset:
+            row = self.model.rows[index]
+            value, hidden_value = self.model.getGradeValue(
+                row['student'], self.info, row['scores'])
+            self.values[index] = value
+            self.hidden_values[index] = hidden_value
+        return value
+
+    @Lazy
+    def sort_keys(self):
+        """Sort keys of the numeric scores, NO_SORT_KEY for the others.
+
+        Keys are read from the scores, grade cells are not built.
+        """
+        name = self.info['object'].__name__
+        keys = []
+        for row in self.model.rows:
+            score = row['scores'].get(name)
+            value = score and score.value
+            if isinstance(value, (int, long, float, Decimal)):
+                keys.append(float(value))
+            else:
+                keys.append(NO_SORT_KEY)
+        return keys
+
+    @Lazy
+    def statistics(self):
+        """Statistics of the numeric scores, None for comments and
+        discrete scores."""
+        if self.is_comment or self.is_discrete:
+            return None
+        name = self.info['object'].__name__
+        statistics = ColumnStatistics(self.info['max'])
+        for row in self.model.rows:
+            statistics.add(row['scores'].get(name))
+        return statistics
+
+    @property
+    def average(self):
+        statistics = self.statistics
+        if statistics is None or not statistics.possible:
+            return ''
+        return convertAverage(statistics.average, None)
+
+    def grade(self, index):
+        value = self.value(index)
+        return {
+            'activity': self.info['hash'],
+            'editable': self.info['scorable'],
+            'value': value,
+            'is_comment': self.is_comment,
+            'is_discrete': self.is_discrete,
+            'max': self.info['max'],
+            'hidden_value': self.hidden_values[index],
+            }
+
+
+class GradebookTableModel(object):
+    """Column oriented model of the gradebook table of a worksheet.
+
+    Rows hold the students with their totals and averages, grade columns
+    are built when sorting, averages or rendering ask for them.
+    """
+
+    def __init__(self, rows, activity_info, getGradeValue, collator,
+                 journal_data=None, roster=None):
+        self.rows = rows
+        self.activity_info = activity_info
+        self.getGradeValue = getGradeValue
+        self.collator = collator
+        self.journal_data = journal_data
+        self.roster = roster
+        self._columns = {}
+
+    def column(self, activity_info):
+        name = activity_info['hash']
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = GradebookColumn(
+                self, activity_info)
+        return column
+
+    def findColumn(self, name):
+        for activity_info in self.activity_info:
+            if name == unicode(activity_info['hash']):
+                return self.column(activity_info)
+        return None
+
+    @Lazy
+    def student_keys(self):
+        if self.roster is not None:
+            key = self.roster.getSortingKey
+        else:
+            key = getUtility(IPersonFactory).getSortingKey
+        return [key(row['student']['object'], self.collator)
+                for row in self.rows]
+
+    def name_keys(self, first, second):
+        key = self.collator.key
+        return [(key(row['student'][first]), key(row['student'][second]))
+                for row in self.rows]
+
+    def summary_keys(self, name):
+        if name == 'total':
+            return [float(row['raw_total']) for row in self.rows]
+        elif name == 'average':
+            # Unscored averages go first
+            return [row['raw_average'] is not UNSCORED and
+                    (1, row['raw_average']) or (0,)
+                    for row in self.rows]
+        elif self.journal_data is None:
+            return [0] * len(self.rows)
+        return [row['raw_%s' % name] for row in self.rows]
+
+    def sort_keys(self, key):
+        """Sort keys of the rows for a column, None if not known."""
+        if key == 'student':
+            return self.student_keys
+        elif key == 'last_name':
+            return self.name_keys('last_name', 'first_name')
+        elif key == 'first_name':
+            return self.name_keys('first_name', 'last_name')
+        elif key in ('total', 'average', 'absences', 'tardies'):
+            keys = self.summary_keys(key)
+        else:
+            column = self.findColumn(key)
+            if column is None:
+                keys = [NO_SORT_KEY] * len(self.rows)
+            else:
+                keys = column.sort_keys
+        return zip(keys, self.student_keys)
+
+    def order(self, key, reverse=False):
+        """Indexes of the rows sorted by a column."""
+        keys = self.sort_keys(key)
+        return sorted(range(len(self.rows)), key=keys.__getitem__,
+                      reverse=reverse)
+
+
+class ConditionalGetMixin(object):
+    """Answer conditional GET requests of unchanged views with 304.
+
+    Views provide getETagParts, the ETag is a hash of them.
+    """
+
+    def getETagParts(self):
+        """Return the parts of the ETag, None if the view can't be cached."""
+        return None
+
+    def getGradebookETagParts(self, gradebook, person):
+        gradebook = proxy.removeSecurityProxy(gradebook)
+        return [
+            getChangeStamp(gradebook.context),
+            self.request.principal.id,
+            self.request.getHeader('Accept-Language', ''),
+            queryUtility(IDateManager).today,
+            flourish.canEdit(self.context),
+            sorted(gradebook.getColumnPreferences(person).items()),
+            getScoreSystemsVersion(),
+            ]
+
+    def showsJournalData(self, gradebook):
+        """Journal attendance does not bump the change stamps, views that
+        show it can't be cached."""
+        gradebook = proxy.removeSecurityProxy(gradebook)
+        return gradebook.snapshot.journal_data is not None
+
+    def etag(self):
+        if self.request.method != 'GET':
+            return None
+        parts = self.getETagParts()
+        if parts is None:
+            return None
+        return '"%s"' % hashlib.md5(repr(parts)).hexdigest()
+
+    def setETag(self, etag=None):
+        response = self.request.response
+        if etag is None:
+            # The publisher sets the status to 200 after rendering, 599
+            # means no status was set by the view
+            if response.getStatus() not in (200, 599):
+                return
+            etag = self.etag()
+        if etag is not None:
+            response.setHeader('ETag', etag)
+            response.setHeader('Cache-Control', 'private, no-cache')
+
+    def notModified(self):
+        match = self.request.getHeader('If-None-Match')
+        if not match:
+            return False
+        etag = self.etag()
+        if etag is None:
+            return False
+        if etag not in [tag.strip() for tag in match.split(',')]:
+            return False
+        self.request.response.setStatus(304)
+        self.setETag(etag)
+        return True
+
+    def __call__(self, *args, **kw):
+        if self.notModified():
+            return ''
+        result = super(ConditionalGetMixin, self).__call__(*args, **kw)
+        # Preferences may have been updated, the ETag is computed after
+        self.setETag()
+        return result
+
+
 class GradebookOverview(SectionFinder, JSONScoresBase):
     """Gradebook Overview/Table"""
 
@@ -504,61 +847,46 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
     needs_comments = False
     column_averages = None
     total_column_averages = None
-
-    def getTodayState(self, student, section):
-        relationships = Membership.bind(member=student).all().relationships
-        for link_info in relationships:
-            if link_info.target is section:
-                today = link_info.state.today
-                if today is not None:
-                    meaning, code = today
-                    state = self.app_states.states.get(code)
-                    if state is not None:
-                        return state.title
-                else:
-                    all = link_info.state.all()
-                    if all:
-                        date, meaning, code = all[0]
-                        state = self.app_states.states.get(code)
-                        if state is not None:
-                            return '%s - %s' % (state.title, date)
+    row_window = slice(None)
+    column_window = slice(None)
+    row_total = None
+    table_model = None
 
     @Lazy
-    def app_states(self):
-        app = ISchoolToolApplication(None)
-        return IRelationshipStateContainer(app)['section-membership']
+    def roster(self):
+        return proxy.removeSecurityProxy(self.context).snapshot.roster
 
     @property
     def students_info(self):
         result = []
-        students = self.students
-        section = proxy.removeSecurityProxy(self.context).section
+        roster = self.roster
         today = queryUtility(IDateManager).today
-        active_students = students.on(today).any(ACTIVE)
+        active_students = roster.getActiveStudents(today)
+        students = roster.students
         current_mode = getCurrentEnrollmentMode(self.person)
         if current_mode == 'gradebook-enrollment-mode-enrolled':
-            students = active_students
+            students = roster.getStudents(today)
+        persons_url = absoluteURL(ISchoolToolApplication(None)['persons'],
+                                  self.request)
+        gradebook_url = absoluteURL(self.context, self.request)
         for student in students:
             css_class = ['popup_link']
-            insecure_student = proxy.removeSecurityProxy(student)
-            title = insecure_student.title
-            if insecure_student not in active_students:
+            title = student.title
+            if student not in active_students:
                 css_class.append('inactive-student')
-                state = self.getTodayState(insecure_student, section)
+                state = roster.getStateTitle(student)
                 if state is not None:
                     title = '%s (%s)' % (title, state)
             result.append({
                     'title': title,
                     'css_class': ' '.join(css_class),
-                    'first_name': insecure_student.first_name,
-                    'last_name': insecure_student.last_name,
-                    'username': insecure_student.username,
-                    'id': insecure_student.username,
-                    'url': absoluteURL(insecure_student, self.request),
-                    'gradeurl': '%s/%s' % (
-                        absoluteURL(self.context, self.request),
-                        insecure_student.username),
-                    'object': insecure_student,
+                    'first_name': student.first_name,
+                    'last_name': student.last_name,
+                    'username': student.username,
+                    'id': student.username,
+                    'url': '%s/%s' % (persons_url, student.username),
+                    'gradeurl': '%s/%s' % (gradebook_url, student.username),
+                    'object': student,
                     })
         return result
 
@@ -619,7 +947,11 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
 
         """Handle changes to scores."""
         evaluator = getName(IPerson(self.request.principal))
-        for student in self.students_info:
+        students_info = self.students_info
+        worksheet_scores = gradebook.getWorksheetScores(
+            worksheet, [student['object'] for student in students_info])
+        changes = []
+        for student, scores in zip(students_info, worksheet_scores):
             for activity in gradebook.activities:
                 # Create a hash and see whether it is in the request
                 act_hash = activity.__name__
@@ -640,20 +972,24 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
                         self.message = _(
                             'Invalid scores (highlighted in red) were not saved.')
                         continue
-                    score = gradebook.getScore(student['object'], activity)
+                    if act_hash in scores:
+                        score = scores[act_hash]
+                    else:
+                        score = gradebook.getScore(student['object'], activity)
                     # Delete the score
                     if score and cell_score_value is UNSCORED:
-                        self.context.removeEvaluation(student['object'], activity,
-                                                      evaluator=evaluator)
-                        self.changed = True
+                        changes.append(
+                            (student['object'], activity, UNSCORED))
                     # Do nothing
                     elif not score and cell_score_value is UNSCORED:
                         continue
                     # Replace the score or add new one
                     elif not score or cell_score_value != score.value:
-                        self.changed = True
-                        self.context.evaluate(
-                            student['object'], activity, cell_score_value, evaluator)
+                        changes.append(
+                            (student['object'], activity, cell_score_value))
+        if changes:
+            self.changed = True
+            self.context.evaluateMany(changes, evaluator)
 
     def getCurrentWorksheet(self):
         return self.context.getCurrentWorksheet(self.person)
@@ -774,7 +1110,7 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
         if results:
             results[0]['moveLeft'] = False
             results[-1]['moveRight'] = False
-        return results
+        return results[self.column_window]
 
     def scorableActivities(self):
         """Get a list of those activities that can be scored."""
@@ -795,9 +1131,12 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
         return[activity for activity in activities
                if not self.isFiltered(activity)]
 
-    def getStudentActivityValue(self, student_info, activity):
+    def getStudentActivityValue(self, student_info, activity, scores=None):
         gradebook = proxy.removeSecurityProxy(self.context)
-        score = gradebook.getScore(student_info['object'], activity)
+        if scores is not None and activity.__name__ in scores:
+            score = scores[activity.__name__]
+        else:
+            score = gradebook.getScore(student_info['object'], activity)
         if not score:
             value = ''
         else:
@@ -810,60 +1149,50 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
         return value
 
     def getCommentShorthand(self, comment):
-        result = ''
-        inside_markup = False
-        for char in comment:
-            if inside_markup:
-                if char == '>':
-                    inside_markup = False
-            else:
-                if char == '<':
-                    inside_markup = True
-                else:
-                    result += char
-        return html.fromstring(result).text.lstrip()[:4]
-
-    def table(self, worksheet=None):
-        """Generate the table of grades."""
+        return comments.getCommentShorthand(comment)
+
+    def getStoredCommentShorthand(self, activity, comment, scores=None):
+        """Use the rendering stored with the score if it is up to date."""
+        score = None
+        if scores is not None:
+            score = scores.get(activity.__name__)
+        rendering = getattr(score, 'comment', None)
+        if rendering is not None and score.value == comment:
+            return rendering.shorthand
+        return self.getCommentShorthand(comment)
+
+    def getGradeValue(self, student_info, activity_info, scores=None):
+        """Return the display value and the hidden value of a grade."""
+        activity = activity_info['object']
+        hidden_value = ''
+        value = self.getStudentActivityValue(student_info, activity, scores)
+        if ICommentScoreSystem.providedBy(activity.scoresystem):
+            hidden_value = value
+            if value:
+                value = self.getStoredCommentShorthand(
+                    activity, value, scores)
+        source = activity_info['linked_source']
+        if source is not None:
+            if value and interfaces.IActivityWorksheet.providedBy(source):
+                value = '%.1f' % value
+        return value, hidden_value
+
+    def getRows(self, worksheet):
+        """Collect the scores, totals and averages of every student.
+
+        Grade cells are not built here, see table().
+        """
         gradebook = proxy.removeSecurityProxy(self.context)
-        if worksheet is None:
-            worksheet = gradebook.getCurrentWorksheet(self.person)
-
         section = ISection(worksheet, None)
         journal_data = interfaces.ISectionJournalData(section, None)
         rows = []
-        for student_info in self.students_info:
-            grades = []
-            for activity_info in self.filtered_activity_info:
-                activity = activity_info['object']
-                is_comment = False
-                hidden_value = ''
-                value = self.getStudentActivityValue(student_info, activity)
-                if ICommentScoreSystem.providedBy(activity.scoresystem):
-                    is_comment = True
-                    hidden_value = value
-                    if value:
-                        value = self.getCommentShorthand(value)
-                source = activity_info['linked_source']
-                if source is not None:
-                    if value and interfaces.IActivityWorksheet.providedBy(source):
-                        value = '%.1f' % value
-                is_discrete = IDiscreteValuesScoreSystem.providedBy(
-                    activity.scoresystem)
-                grade = {
-                    'activity': activity_info['hash'],
-                    'editable': activity_info['scorable'],
-                    'value': value,
-                    'is_comment': is_comment,
-                    'is_discrete': is_discrete,
-                    'max': activity_info['max'],
-                    'hidden_value': hidden_value,
-                    }
-                grades.append(grade)
-
-            raw_total, raw_average = gradebook.getWorksheetTotalAverage(
-                worksheet, student_info['object'])
-
+        students_info = self.students_info
+        students = [student_info['object'] for student_info in students_info]
+        worksheet_scores = gradebook.getWorksheetScores(worksheet, students)
+        worksheet_averages = gradebook.getWorksheetTotalAverages(
+            worksheet, students)
+        for student_info, scores, (raw_total, raw_average) in zip(
+            students_info, worksheet_scores, worksheet_averages):
             total = "%.1f" % raw_total
 
             if raw_average is UNSCORED:
@@ -886,7 +1215,7 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
 
             rows.append(
                 {'student': student_info,
-                 'grades': grades,
+                 'scores': scores,
                  'absences': unicode(absences),
                  'tardies': unicode(tardies),
                  'total': total,
@@ -896,82 +1225,56 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
                  'raw_absences': absences,
                  'raw_tardies': tardies,
                 })
+        return rows
+
+    @property
+    def window_activity_info(self):
+        return self.filtered_activity_info[self.column_window]
 
-        # Do the sorting
+    def getRequestWindow(self, name, size):
+        """Return the slice of rows or columns asked for in the request."""
+        try:
+            start = max(int(self.request.get('%s_start' % name, 0)), 0)
+            count = max(int(self.request.get('%s_count' % name, size)), 0)
+        except (ValueError, TypeError):
+            start, count = 0, size
+        return slice(start, start + count)
+
+    def getTableModel(self, worksheet):
+        section = ISection(worksheet, None)
+        journal_data = interfaces.ISectionJournalData(section, None)
+        return GradebookTableModel(
+            self.getRows(worksheet), self.filtered_activity_info,
+            self.getGradeValue, getCachingCollator(self.request),
+            journal_data, self.roster)
+
+    def table(self, worksheet=None):
+        """Generate the table of grades.
+
+        Sorting and averages cover all the students and activities, but
+        grade cells are built only for the rows and columns in
+        row_window and column_window.
+        """
+        gradebook = proxy.removeSecurityProxy(self.context)
+        if worksheet is None:
+            worksheet = gradebook.getCurrentWorksheet(self.person)
+
+        model = self.table_model = self.getTableModel(worksheet)
         key, reverse = self.sortKey
-        collator = ICollator(self.request.locale)
-        factory = getUtility(IPersonFactory)
-        sorting_key = lambda x: factory.getSortingKey(x, collator)
-        def generateStudentKey(row):
-            return sorting_key(row['student']['object'])
-        def generateKey(row):
-            if key == 'student':
-                return generateStudentKey(row)
-            elif key == 'last_name':
-                return (collator.key(row['student']['last_name']),
-                        collator.key(row['student']['first_name']))
-            elif key == 'first_name':
-                return (collator.key(row['student']['first_name']),
-                        collator.key(row['student']['last_name']))
-            elif key == 'total':
-                return (float(row['total']), generateStudentKey(row))
-            elif key == 'average':
-                if row['raw_average'] is UNSCORED:
-                    return ('', generateStudentKey(row))
-                else:
-                    return (row['average'], generateStudentKey(row))
-            elif key in ['absences', 'tardies']:
-                if journal_data is None:
-                    return (0, generateStudentKey(row))
-                else:
-                    return (int(row[key]), generateStudentKey(row))
-            else: # sorting by activity
-                value = -9999999.9
-                for grade in row['grades']:
-                    if key == unicode(grade['activity']):
-                        try:
-                            value = float(grade['value'])
-                        except:
-                            pass
-                        break
-                return (value, generateStudentKey(row))
-        result = sorted(rows, key=generateKey, reverse=reverse)
-        self.column_averages = self.getColumnAverages(result)
+        order = model.order(key, reverse)
+        self.row_total = len(order)
+        columns = [model.column(info) for info in self.window_activity_info]
+        if model.rows:
+            self.column_averages = [column.average for column in columns]
+        else:
+            self.column_averages = []
         self.total_column_averages = self.getTotalColumnAverages(
-            result, journal_data)
-        return result
-
-    def getColumnAverages(self, table):
+            model.rows, model.journal_data)
         result = []
-        columns = OrderedDict()
-        for student_info in table:
-            for i, grade in enumerate(student_info['grades']):
-                if i not in columns:
-                    columns[i] = {
-                        'grades': [],
-                        'is_comment': grade['is_comment'],
-                        'is_discrete': grade['is_discrete'],
-                        'max': grade['max'],
-                    }
-                columns[i]['grades'].append(grade['value'])
-        for column in columns.values():
-            average = ''
-            if not column['is_comment'] and not column['is_discrete']:
-                average_grades = []
-                count = 0
-                for grade in column['grades']:
-                    # XXX: why decimals are str and not Decimal?
-                    if grade != '':
-                        try:
-                            average_grades.append(Decimal(grade))
-                            count += int(column['max'])
-                        except (InvalidOperation,):
-                            # ignore invalid grades
-                            pass
-                if count:
-                    average = convertAverage(
-                        (100 * sum(average_grades))/Decimal(count), None)
-            result.append(average)
+        for index in order[self.row_window]:
+            row = model.rows[index]
+            row['grades'] = [column.grade(index) for column in columns]
+            result.append(row)
         return result
 
     def getTotalColumnAverages(self, table, journal_data):
@@ -1037,7 +1340,7 @@ class GradebookOverview(SectionFinder, JSONScoresBase):
         return not self.deployed and not self.average_hide
 
 
-class FlourishGradebookOverview(GradebookOverview,
+class FlourishGradebookOverview(ConditionalGetMixin, GradebookOverview,
                                 flourish.page.WideContainerPage):
     """flourish Gradebook Overview/Table"""
 
@@ -1166,6 +1469,43 @@ class FlourishGradebookOverview(GradebookOverview,
         """Everything else handled by old skin method."""
         GradebookOverview.update(self)
 
+        """Render only the first window of the table."""
+        self.row_window = self.getRequestWindow('rows', ROW_WINDOW_SIZE)
+        self.column_window = self.getRequestWindow(
+            'columns', COLUMN_WINDOW_SIZE)
+
+    @property
+    def column_total(self):
+        return len(self.filtered_activity_info)
+
+    @property
+    def popup_menus_url(self):
+        worksheet = proxy.removeSecurityProxy(self.context).context
+        return '%s/popup_menus?stamp=%s' % (
+            absoluteURL(self.context, self.request),
+            getChangeStamp(worksheet))
+
+    def getETagParts(self):
+        if self.request.form:
+            return None
+        return self.getOverviewETagParts()
+
+    def getOverviewETagParts(self):
+        person = IPerson(self.request.principal, None)
+        if person is None:
+            return None
+        gradebook = proxy.removeSecurityProxy(self.context)
+        if self.showsJournalData(gradebook):
+            return None
+        current_section = getCurrentSectionTaught(person)
+        return self.getGradebookETagParts(gradebook, person) + [
+            getName(gradebook.getCurrentWorksheet(person)),
+            current_section is not None and getName(current_section),
+            gradebook.getSortKey(person),
+            gradebook.getDueDateFilter(person),
+            getCurrentEnrollmentMode(person),
+            ]
+
     def handleTermChange(self):
         return False
 
@@ -1429,13 +1769,15 @@ class GradeActivity(object):
                         'hash': activity.__name__,
                          'obj': activity}
 
+    @Lazy
+    def roster(self):
+        return proxy.removeSecurityProxy(self.context).snapshot.roster
+
     @property
     def grades(self):
         gradebook = proxy.removeSecurityProxy(self.context)
-        collator = ICollator(self.request.locale)
-        factory = getUtility(IPersonFactory)
-        sorting_key = lambda x: factory.getSortingKey(x, collator)
-        for student in sorted(self.context.students, key=sorting_key):
+        collator = getCachingCollator(self.request)
+        for student in self.roster.sorted(collator):
             reqValue = self.request.get(student.username)
             score = gradebook.getScore(student, self.activity['obj'])
             if not score:
@@ -1462,8 +1804,9 @@ class GradeActivity(object):
             activity = self.activity['obj']
             evaluator = getName(IPerson(self.request.principal))
             gradebook = proxy.removeSecurityProxy(self.context)
+            changes = []
             # Iterate through all students
-            for student in self.context.students:
+            for student in self.roster.students:
                 id = student.username
                 if id in self.request:
 
@@ -1484,15 +1827,17 @@ class GradeActivity(object):
                     score = gradebook.getScore(student, activity)
                     # Delete the score
                     if score and request_score_value is UNSCORED:
-                        self.context.removeEvaluation(student, activity,
-                                                      evaluator=evaluator)
+                        changes.append((student, activity, UNSCORED))
                     # Do nothing
                     elif not score and request_score_value is UNSCORED:
                         continue
                     # Replace the score or add new one
                     elif not score or request_score_value != score.value:
-                        self.context.evaluate(
-                            student, activity, request_score_value, evaluator)
+                        changes.append(
+                            (student, activity, request_score_value))
+
+            if changes:
+                self.context.evaluateMany(changes, evaluator)
 
             if not len(self.messages):
                 self.request.response.redirect(self.doneURL())
@@ -1508,7 +1853,7 @@ class FlourishGradeActivity(GradeActivity, flourish.page.Page):
 
 def getScoreSystemDiscreteValues(ss):
     if IDiscreteValuesScoreSystem.providedBy(ss):
-        return (ss.scores[-1][2], ss.scores[0][2])
+        return (ss.lookup.minimum, ss.lookup.maximum)
     elif IRangedValuesScoreSystem.providedBy(ss):
         return (ss.min, ss.max)
     return (0, 0)
@@ -1600,12 +1945,34 @@ class MyGradesView(SectionFinder):
         return self.context.getCurrentWorksheet(self.person)
 
 
-class FlourishMyGradesView(MyGradesView, flourish.page.Page):
+class FlourishMyGradesView(ConditionalGetMixin, MyGradesView,
+                           flourish.page.Page):
     """Flourish student view of own grades."""
 
     has_header = False
     page_class = 'page grid'
 
+    def getETagParts(self):
+        if self.request.form:
+            return None
+        person = IPerson(self.request.principal, None)
+        if person is None:
+            return None
+        gradebook = proxy.removeSecurityProxy(self.context)
+        if self.showsJournalData(gradebook):
+            return None
+        instructors = list(ISection(gradebook).instructors)
+        if instructors:
+            # Column preferences of the first instructor are used
+            parts = self.getGradebookETagParts(gradebook, instructors[0])
+        else:
+            parts = self.getGradebookETagParts(gradebook, person)
+        current_section = getCurrentSectionAttended(person)
+        return parts + [
+            getName(gradebook.getCurrentWorksheet(person)),
+            current_section is not None and getName(current_section),
+            ]
+
     def handleYearChange(self):
         if 'currentYear' in self.request:
             currentSection = ISection(proxy.removeSecurityProxy(self.context))
@@ -1743,12 +2110,14 @@ class LinkedActivityGradesUpdater(object):
             raise LookupError(msg % external_activity.title)
         worksheet = linked_activity.__parent__
         gradebook = interfaces.IGradebook(worksheet)
+        changes = []
         for student in gradebook.students:
             external_grade = external_activity.getGrade(student)
             if external_grade is not None:
                 score = external_grade * linked_activity.points
                 score = Decimal("%.2f" % score)
-                gradebook.evaluate(student, linked_activity, score, evaluator)
+                changes.append((student, linked_activity, score))
+        gradebook.evaluateMany(changes, evaluator)
 
 
 class UpdateLinkedActivityGrades(LinkedActivityGradesUpdater):
@@ -2012,19 +2381,20 @@ class GradeStudent(z3cform.EditForm):
 
     def applyChanges(self, data):
         super(GradeStudent, self).applyChanges(data)
+        gradebook = proxy.removeSecurityProxy(self.context)
+        gradebook.saveChanges(gradebook.evaluator)
         self.request.response.redirect(self.nexturl)
 
     def prevNextStudent(self):
         gradebook = proxy.removeSecurityProxy(self.context.gradebook)
-        section = ISection(gradebook)
-        student = self.context.student
+        student = proxy.removeSecurityProxy(self.context.student)
 
         prev, next = None, None
 
-        collator = ICollator(self.request.locale)
-        factory = getUtility(IPersonFactory)
-        sorting_key = lambda x: factory.getSortingKey(x, collator)
-        members = sorted(section.members, key=sorting_key)
+        collator = getCachingCollator(self.request)
+        roster = gradebook.snapshot.roster
+        today = queryUtility(IDateManager).today
+        members = roster.sorted(collator, roster.getStudents(today))
         if len(members) < 2:
             return prev, next
         for index, member in enumerate(members):
@@ -2092,8 +2462,29 @@ class FlourishGradeStudent(GradeStudent, flourish.form.Form):
             action)
 
 
+def getRecentHistory(evaluations, activity, size):
+    """Get the current evaluation of the activity and its latest history.
+
+    At most ``size`` records are returned, most recent first, all of them
+    if ``size`` is None.  Return the records and whether there are more.
+    """
+    current = evaluations.get(activity, None)
+    if size is None:
+        history = evaluations.iterHistory(activity, reverse=True)
+        return [current] + list(history), False
+    # One more record than needed tells whether there are more
+    history = list(evaluations.iterHistory(activity, reverse=True,
+                                           count=size))
+    return ([current] + history)[:size], len(history) >= size
+
+
 class FlourishStudentGradeHistory(flourish.page.Page):
 
+    # Number of the most recent records shown for each activity, unless
+    # the history request parameter asks for another number or for all
+    history_size = 10
+    truncated = False
+
     @property
     def title(self):
         gradebook = proxy.removeSecurityProxy(self.context.gradebook)
@@ -2119,6 +2510,19 @@ class FlourishStudentGradeHistory(flourish.page.Page):
         prefs = IApplicationPreferences(app)
         return prefs.timeformat
 
+    def getHistorySize(self):
+        """Get the number of records to show, None to show all of them."""
+        size = self.request.get('history')
+        if size == 'all':
+            return None
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return self.history_size
+        if size < 1:
+            return self.history_size
+        return size
+
     def buildHistoryTable(self):
         persons = ISchoolToolApplication(None)['persons']
         gradebook = proxy.removeSecurityProxy(self.context.gradebook)
@@ -2127,20 +2531,24 @@ class FlourishStudentGradeHistory(flourish.page.Page):
         timezone = self.timezone
         timeformat = self.timeformat
 
+        size = self.getHistorySize()
+
         # XXX: this is nearly a copy of MyGradesView.update
         self.table = []
         count = 0
         for activity in gradebook.getWorksheetActivities(worksheet):
             evaluations = IEvaluations(student)
             evaluations = proxy.removeSecurityProxy(evaluations)
-            current = evaluations.get(activity, None)
-            history = evaluations.getHistory(activity)
-            if (current is None and
-                not history):
+            if (activity not in evaluations and
+                not evaluations.hasHistory(activity)):
                 continue
 
+            records, more = getRecentHistory(evaluations, activity, size)
+            if more:
+                self.truncated = True
+
             grade_records = []
-            for evaluation in [current] + list(reversed(history)):
+            for evaluation in records:
                 if evaluation is None:
                     record = {
                         'comment': True,
@@ -2264,9 +2672,17 @@ class StudentGradebookView(object):
         return activity.due_date < cutoff
 
 
-class FlourishStudentGradebookView(flourish.page.Page):
+class FlourishStudentGradebookView(ConditionalGetMixin, flourish.page.Page):
     """A flourish view of the student gradebook."""
 
+    def getETagParts(self):
+        if self.request.form:
+            return None
+        person = IPerson(self.request.principal, None)
+        if person is None or self.showsJournalData(self.context.gradebook):
+            return None
+        return self.getGradebookETagParts(self.context.gradebook, person)
+
     @property
     def title(self):
         return self.context.student.title
@@ -2395,54 +2811,291 @@ class SectionGradebookLinkViewlet(flourish.page.LinkViewlet):
         return can_view
 
 
-class JSONViewBase(flourish.page.Page):
+class JSONViewBase(ConditionalGetMixin, flourish.page.Page):
+
+    # Whether the result depends only on the worksheet, the request and the
+    # preferences of the user
+    cacheable = False
 
     def result(self):
         raise NotImplementedError('subclasses must provide result()')
 
+    def getETagParts(self):
+        if not self.cacheable:
+            return None
+        person = IPerson(self.request.principal, None)
+        if person is None:
+            return None
+        return self.getGradebookETagParts(self.context, person) + [
+            sorted(self.request.form.items()),
+            ]
+
     def translate(self, message):
         return translate(message, context=self.request)
 
     def __call__(self):
+        if self.notModified():
+            return ''
         response = self.request.response
         response.setHeader('Content-Type', 'application/json')
         encoder = flourish.tal.JSONEncoder()
         json = encoder.encode(self.result())
+        self.setETag()
         return json
 
 
 class FlourishGradebookValidateScoreView(JSONViewBase):
+    """Validate scores of activities of the worksheet.
+
+    The gradebook validates typed scores in the browser from the score
+    system info of the activities.  This view validates a single
+    ``activity_id`` and ``score``, or a batch of cells given as parallel
+    ``activity`` and ``score`` lists, which are answered in ``cells``.
+    """
+
+    def getRequestList(self, name):
+        value = self.request.get(name, [])
+        if not isinstance(value, list):
+            value = [value]
+        return value
 
-    def result(self):
+    def validate(self, activity_id, score):
         result = {'is_valid': True, 'is_extracredit': False}
-        activity_id = self.request.get('activity_id')
-        score = self.request.get('score')
-        if score and activity_id:
-            person = IPerson(self.request.principal)
-            worksheet = self.context.getCurrentWorksheet(person)
-            activity = worksheet.get(activity_id)
-            if activity is not None:
-                scoresystem = activity.scoresystem
-                score = self.request.get('score')
-                try:
-                    score = scoresystem.fromUnicode(score)
-                except (ScoreValidationError,):
-                    result['is_valid'] = False
-                else:
-                    if IDiscreteValuesScoreSystem.providedBy(scoresystem):
-                        result['score'] = score
-                    if (IRangedValuesScoreSystem.providedBy(scoresystem) and
-                        score > scoresystem.getBestScore()):
-                        result['is_extracredit'] = True
+        if not score or not activity_id:
+            return result
+        gradebook = proxy.removeSecurityProxy(self.context)
+        activity = gradebook.snapshot.getActivity(gradebook.context,
+                                                  activity_id)
+        if (activity is None or
+            interfaces.ILinkedColumnActivity.providedBy(activity)):
+            return result
+        scoresystem = gradebook.snapshot.getScoreSystem(activity)
+        try:
+            score = scoresystem.fromUnicode(score)
+        except (ScoreValidationError,):
+            result['is_valid'] = False
+        else:
+            if IDiscreteValuesScoreSystem.providedBy(scoresystem):
+                result['score'] = score
+            if (IRangedValuesScoreSystem.providedBy(scoresystem) and
+                score > scoresystem.getBestScore()):
+                result['is_extracredit'] = True
+        return result
+
+    def result(self):
+        if 'activity' not in self.request:
+            return self.validate(self.request.get('activity_id'),
+                                 self.request.get('score'))
+        cells = []
+        for activity_id, score in zip(self.getRequestList('activity'),
+                                      self.getRequestList('score')):
+            result = self.validate(activity_id, score)
+            result['activity'] = activity_id
+            cells.append(result)
+        return {'cells': cells}
+
+
+class FlourishGradebookSaveScoresView(JSONViewBase):
+    """Save the changed cells of a worksheet in one batch.
+
+    Expects parallel ``activity``, ``student`` and ``score`` lists with
+    the activity names, student usernames and the new score of every
+    changed cell.  Returns the updated totals and averages of the
+    affected students and the averages of the affected columns.
+    """
+
+    @Lazy
+    def person(self):
+        return IPerson(self.request.principal)
+
+    @Lazy
+    def average_scoresystem(self):
+        gradebook = proxy.removeSecurityProxy(self.context)
+        columnPreferences = gradebook.getColumnPreferences(self.person)
+        name = columnPreferences.get('average', {}).get('scoresystem', '')
+        scoresystems = IScoreSystemContainer(ISchoolToolApplication(None))
+        return scoresystems.get(name)
+
+    def getRequestList(self, name):
+        value = self.request.get(name, [])
+        if not isinstance(value, list):
+            value = [value]
+        return value
+
+    def getCells(self):
+        gradebook = proxy.removeSecurityProxy(self.context)
+        snapshot = gradebook.snapshot
+        worksheet = gradebook.context
+        persons = ISchoolToolApplication(None)['persons']
+        cells = zip(self.getRequestList('activity'),
+                    self.getRequestList('student'),
+                    self.getRequestList('score'))
+        for activity_name, username, value in cells:
+            activity = snapshot.getActivity(worksheet, activity_name)
+            student = persons.get(username)
+            if (activity is None or student is None or
+                not snapshot.hasStudent(student) or
+                interfaces.ILinkedColumnActivity.providedBy(activity)):
+                continue
+            yield activity, student, value
+
+    def getColumnStudents(self):
+        gradebook = proxy.removeSecurityProxy(self.context)
+        roster = gradebook.snapshot.roster
+        current_mode = getCurrentEnrollmentMode(self.person)
+        if current_mode == 'gradebook-enrollment-mode-enrolled':
+            today = queryUtility(IDateManager).today
+            return list(roster.getStudents(today))
+        return list(roster.students)
+
+    def result(self):
+        gradebook = proxy.removeSecurityProxy(self.context)
+        worksheet = gradebook.context
+        changes = []
+        errors = []
+        students = OrderedDict()
+        activities = OrderedDict()
+        for activity, student, value in self.getCells():
+            try:
+                cell_score_value = activity.scoresystem.fromUnicode(value)
+            except (ValidationError, ValueError):
+                errors.append({'activity': activity.__name__,
+                               'student': student.username})
+                continue
+            score = gradebook.getScore(student, activity)
+            if not score and cell_score_value is UNSCORED:
+                continue
+            if not score or cell_score_value != score.value:
+                changes.append((student, activity, cell_score_value))
+                students[student.username] = student
+                activities[activity.__name__] = activity
+        if changes:
+            evaluator = getName(self.person)
+            gradebook.evaluateMany(changes, evaluator)
+
+        rows = {}
+        averages = gradebook.getWorksheetTotalAverages(
+            worksheet, students.values())
+        for username, (raw_total, raw_average) in zip(students, averages):
+            if raw_average is UNSCORED:
+                average = self.translate(_('N/A'))
+            else:
+                average = convertAverage(raw_average,
+                                         self.average_scoresystem)
+            rows[username] = {'total': '%.1f' % raw_total,
+                              'average': average}
+
+        columns = {}
+        column_students = None
+        for name, activity in activities.items():
+            scoresystem = activity.scoresystem
+            if (ICommentScoreSystem.providedBy(scoresystem) or
+                IDiscreteValuesScoreSystem.providedBy(scoresystem)):
+                continue
+            if column_students is None:
+                column_students = self.getColumnStudents()
+            column = ColumnStatistics(scoresystem.getBestScore())
+            for score in gradebook.getActivityScores(activity,
+                                                     column_students):
+                column.add(score)
+            average = ''
+            if column.possible:
+                average = convertAverage(column.average, None)
+            columns[name] = average
+
+        return {'rows': rows, 'columns': columns, 'errors': errors}
+
+
+class FlourishGradebookTableWindowView(JSONViewBase, FlourishGradebookOverview):
+    """A window of rows and columns of the gradebook table.
+
+    The window is given by the ``rows_start``, ``rows_count``,
+    ``columns_start`` and ``columns_count`` request parameters.
+    """
+
+    def getETagParts(self):
+        parts = self.getOverviewETagParts()
+        if parts is None:
+            return None
+        return parts + [sorted(self.request.form.items())]
+
+    def update(self):
+        self.person = IPerson(self.request.principal)
+        gradebook = proxy.removeSecurityProxy(self.context)
+        self.processColumnPreferences()
+        self.sortKey = gradebook.getSortKey(self.person)
+        self.row_window = self.getRequestWindow('rows', ROW_WINDOW_SIZE)
+        self.column_window = self.getRequestWindow(
+            'columns', COLUMN_WINDOW_SIZE)
+
+    def getActivities(self):
+        result = []
+        for info in self.activities():
+            activity = info['object']
+            result.append({
+                'hash': info['hash'],
+                'cssClass': info['cssClass'],
+                'scores': info['scores'],
+                'shortTitle': info['shortTitle'],
+                'longTitle': info['longTitle'],
+                'description': getattr(activity, 'description', None) or '',
+                'max': unicode(info['max']),
+                })
         return result
 
+    def getTotals(self, row):
+        totals = []
+        for name in ('absences', 'tardies', 'total', 'average'):
+            if getattr(self, 'show_%s_column' % name):
+                totals.append(self.translate(row[name]))
+        return totals
+
+    def getRowsInfo(self, table):
+        names = [column.name for column in self.name_sorting_columns]
+        result = []
+        for row in table:
+            student = row['student']
+            result.append({
+                'id': student['id'],
+                'title': student['title'],
+                'css_class': student['css_class'],
+                'names': [student[name] for name in names],
+                'grades': [{'value': grade['value'],
+                            'is_comment': grade['is_comment'],
+                            'hidden_value': grade['hidden_value']}
+                           for grade in row['grades']],
+                'totals': self.getTotals(row),
+                })
+        return result
+
+    def result(self):
+        self.update()
+        table = self.table()
+        return {
+            'rows_start': self.row_window.start,
+            'rows_total': self.row_total,
+            'columns_start': self.column_window.start,
+            'columns_total': self.column_total,
+            'activities': self.getActivities(),
+            'rows': self.getRowsInfo(table),
+            'column_averages': self.column_averages,
+            }
+
 
 class FlourishActivityPopupMenuView(JSONViewBase, JSONScoresBase):
 
-    @property
+    cacheable = True
+
+    @Lazy
     def readonly(self):
         return not flourish.canEdit(self.context)
 
+    @Lazy
+    def activity_names(self):
+        gradebook = proxy.removeSecurityProxy(self.context)
+        return [activity.__name__ for activity in
+                gradebook.snapshot.getActivities(gradebook.context)]
+
     def options(self, info, worksheet):
         options = []
         url = '%s/gradebook' % absoluteURL(worksheet, self.request)
@@ -2488,12 +3141,14 @@ class FlourishActivityPopupMenuView(JSONViewBase, JSONScoresBase):
                     })
         return options
 
-    def result(self):
+    def getMenu(self, activity_id):
         result = {}
-        activity_id = self.request.get('activity_id')
-        worksheet = proxy.removeSecurityProxy(self.context).context
-        if activity_id is not None and activity_id in worksheet:
-            activity = worksheet[activity_id]
+        gradebook = proxy.removeSecurityProxy(self.context)
+        worksheet = gradebook.context
+        activity = None
+        if activity_id is not None:
+            activity = gradebook.snapshot.getActivity(worksheet, activity_id)
+        if activity is not None:
             info = self.getActivityInfo(activity)
             can_modify = not self.readonly and not worksheet.deployed
             info.update({
@@ -2501,7 +3156,7 @@ class FlourishActivityPopupMenuView(JSONViewBase, JSONScoresBase):
                     'moveLeft': can_modify,
                     'moveRight': can_modify,
                     })
-            keys = worksheet.keys()
+            keys = self.activity_names
             if keys[0] == activity.__name__:
                 info['moveLeft'] = False
             if keys[-1] == activity.__name__:
@@ -2510,6 +3165,9 @@ class FlourishActivityPopupMenuView(JSONViewBase, JSONScoresBase):
             result['options'] = self.options(info, worksheet)
         return result
 
+    def result(self):
+        return self.getMenu(self.request.get('activity_id'))
+
     # XXX: All of this has been copied from the gradebook view
     def getLinkedActivityInfo(self, activity):
         source = getSourceObj(activity.source)
@@ -2586,16 +3244,20 @@ class FlourishActivityPopupMenuView(JSONViewBase, JSONScoresBase):
 
 class FlourishStudentPopupMenuView(JSONViewBase):
 
-    @property
+    cacheable = True
+
+    @Lazy
     def readonly(self):
         return not flourish.canEdit(self.context)
 
+    @Lazy
+    def gradebook_url(self):
+        return absoluteURL(self.context, self.request)
+
     def options(self, student):
         url = absoluteURL(student, self.request)
         readonly = self.readonly
-        gradeurl = '%s/%s' % (
-            absoluteURL(self.context, self.request),
-            student.username)
+        gradeurl = '%s/%s' % (self.gradebook_url, student.username)
         options = []
         options.append({
             'label': self.translate(_('Student')),
@@ -2616,20 +3278,24 @@ class FlourishStudentPopupMenuView(JSONViewBase):
             })
         return options
 
-    def result(self):
-        student_id = self.request.get('student_id')
+    def getMenu(self, student_id):
         result = {}
         if student_id is not None:
-            app = ISchoolToolApplication(None)
-            student = app['persons'].get(student_id)
-            if student is not None and student in self.context.students:
+            roster = proxy.removeSecurityProxy(self.context).snapshot.roster
+            student = roster.getStudent(student_id)
+            if student is not None:
                 result['header'] = student.title
                 result['options'] = self.options(student)
         return result
 
+    def result(self):
+        return self.getMenu(self.request.get('student_id'))
+
 
 class FlourishNamePopupMenuView(JSONViewBase):
 
+    cacheable = True
+
     def options(self, worksheet, column_id='student'):
         options = [
             {
@@ -2643,26 +3309,34 @@ class FlourishNamePopupMenuView(JSONViewBase):
     def name_sorting_columns(self):
         return getUtility(IPersonFactory).columns()
 
-    def result(self):
-        column_id = self.request.get('column_id')
+    def getMenu(self, column_id):
         for column in self.name_sorting_columns:
             if column.name == column_id:
                 break
+        else:
+            return {}
         worksheet = proxy.removeSecurityProxy(self.context).context
-        self.deployed = worksheet.deployed
-        self.processColumnPreferences()
         result = {
             'header': self.translate(column.title),
             'options': self.options(worksheet, column_id),
             }
         return result
 
+    def update(self):
+        worksheet = proxy.removeSecurityProxy(self.context).context
+        self.deployed = worksheet.deployed
+        self.processColumnPreferences()
+
+    def result(self):
+        self.update()
+        return self.getMenu(self.request.get('column_id'))
+
     # XXX: Copied (and modified) from the gradebook view
     def processColumnPreferences(self):
         gradebook = proxy.removeSecurityProxy(self.context)
         person = IPerson(self.request.principal)
         columnPreferences = gradebook.getColumnPreferences(person)
-        journal_data = interfaces.ISectionJournalData(ISection(gradebook), None)
+        journal_data = gradebook.snapshot.journal_data
         self.journal_present = journal_data is not None
         prefs = columnPreferences.get('absences', {})
         if journal_data is None:
@@ -2682,6 +3356,8 @@ class FlourishNamePopupMenuView(JSONViewBase):
 
 class FlourishTotalPopupMenuView(JSONViewBase):
 
+    cacheable = True
+
     titles = {
         'total': _('Total'),
         'average': _('Ave.'),
@@ -2714,16 +3390,18 @@ class FlourishTotalPopupMenuView(JSONViewBase):
                     })
         return options
 
-    def result(self):
+    def getMenu(self, column_id):
         result = {}
-        column_id = self.request.get('column_id')
         if column_id in self.titles:
             result['header'] = self.translate(self.titles[column_id])
             result['options'] = self.options(column_id)
         return result
 
+    def result(self):
+        return self.getMenu(self.request.get('column_id'))
+
     # XXX: Copied (and modified) from the gradebook view
-    @property
+    @Lazy
     def _scoresystems(self):
         gradebook = proxy.removeSecurityProxy(self.context)
         person = IPerson(self.request.principal)
@@ -2748,6 +3426,47 @@ class FlourishTotalPopupMenuView(JSONViewBase):
         return results
 
 
+class FlourishGradebookPopupMenusView(JSONViewBase):
+    """The popup menus of all the headers of the gradebook of a worksheet.
+
+    The gradebook loads them once per change stamp of the worksheet and
+    opens its menus without asking the popup menu views.
+    """
+
+    cacheable = True
+
+    def getMenus(self, view, keys):
+        menus = {}
+        for key in keys:
+            menu = view.getMenu(key)
+            if menu:
+                menus[key] = menu
+        return menus
+
+    def result(self):
+        gradebook = proxy.removeSecurityProxy(self.context)
+        worksheet = gradebook.context
+        activity_view = FlourishActivityPopupMenuView(self.context,
+                                                      self.request)
+        student_view = FlourishStudentPopupMenuView(self.context,
+                                                    self.request)
+        name_view = FlourishNamePopupMenuView(self.context, self.request)
+        name_view.update()
+        total_view = FlourishTotalPopupMenuView(self.context, self.request)
+        students = gradebook.snapshot.roster.students
+        return {
+            'stamp': getChangeStamp(worksheet),
+            'activity': self.getMenus(activity_view,
+                                      activity_view.activity_names),
+            'student': self.getMenus(
+                student_view, [student.username for student in students]),
+            'name': self.getMenus(
+                name_view, [column.name
+                            for column in name_view.name_sorting_columns]),
+            'total': self.getMenus(total_view, total_view.titles.keys()),
+            }
+
+
 class PrintableWorksheetViewlet(ReportLinkViewlet):
 
     def render(self, *args, **kw):
@@ -2921,7 +3640,6 @@ class EnrollmentModesSelector(flourish.viewlet.Viewlet):
         mode = getCurrentEnrollmentMode(self.person)
         if mode is None:
             mode = self.content.default_mode
-            setCurrentEnrollmentMode(self.person, mode)
         return mode
 
     def update(self):
@@ -2988,3 +3706,18 @@ class ColumnPreferencesMenuOptions(flourish.viewlet.Viewlet):
                 'label': label,
                 })
         return result
+
+
+class FlourishRebuildWorksheetAveragesView(flourish.page.Page):
+    """A flourish view for rebuilding the stored worksheet averages"""
+
+    def update(self):
+        if 'CANCEL' in self.request:
+            self.request.response.redirect(self.nextURL())
+        elif 'SUBMIT' in self.request:
+            task = RebuildWorksheetAveragesTask()
+            task.schedule(self.request)
+            self.request.response.redirect(self.nextURL())
+
+    def nextURL(self):
+        return '%s/manage' % absoluteURL(self.context, self.request)
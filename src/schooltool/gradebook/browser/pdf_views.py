@@ -20,7 +20,6 @@ PDF Views
 """
 
 from datetime import datetime
-from decimal import Decimal
 
 from zope.cachedescriptors.property import Lazy
 from zope.browserpage.viewpagetemplatefile import ViewPageTemplateFile
@@ -46,9 +45,12 @@ from schooltool.skin.flourish.report import buildHTMLParagraphs
 from schooltool.gradebook import GradebookMessage as _
 from schooltool.gradebook.browser.gradebook import GradebookOverview
 from schooltool.gradebook.browser.gradebook import convertAverage
+from schooltool.gradebook.browser.gradebook import getCachingCollator
 from schooltool.gradebook.browser.report_card import (ABSENT_HEADING,
     TARDY_HEADING, ABSENT_ABBREVIATION, TARDY_ABBREVIATION, ABSENT_KEY,
     TARDY_KEY, AVERAGE_KEY, AVERAGE_HEADING)
+from schooltool.gradebook.comments import COMMENT_PARA_CLASS
+from schooltool.gradebook.comments import queryCommentRendering
 from schooltool.gradebook.interfaces import ICourseDeployedWorksheets
 from schooltool.gradebook.interfaces import IGradebookRoot, IActivities
 from schooltool.gradebook.interfaces import IGradebook
@@ -56,7 +58,6 @@ from schooltool.gradebook.interfaces import ISectionJournal
 from schooltool.gradebook.interfaces import ISectionJournalData
 from schooltool.gradebook.interfaces import IJournalScoreSystemPreferences
 from schooltool.requirement.interfaces import IEvaluations
-from schooltool.requirement.interfaces import IDiscreteValuesScoreSystem
 from schooltool.requirement.interfaces import IScoreSystemContainer
 from schooltool.requirement.scoresystem import UNSCORED
 
@@ -156,6 +157,28 @@ class BaseStudentPDFView(BasePDFView):
         termName, worksheetName, activityName = layout.source.split('|')
         return activityName == AVERAGE_KEY
 
+    @Lazy
+    def worksheet_averages(self):
+        return {}
+
+    def getWorksheetAverages(self, gradebook, worksheet):
+        """Get the totals and averages of the worksheet by student.
+
+        They are computed once for all the reported students that are in
+        the section of the worksheet.
+        """
+        worksheet = removeSecurityProxy(worksheet)
+        averages = self.worksheet_averages.get(worksheet)
+        if averages is None:
+            students = [removeSecurityProxy(student)
+                        for student in self.collectStudents()]
+            students = [student for student in students
+                        if gradebook.snapshot.hasStudent(student)]
+            averages = dict(zip(students, gradebook.getWorksheetTotalAverages(
+                worksheet, students)))
+            self.worksheet_averages[worksheet] = averages
+        return averages
+
     def getAverageScore(self, student, section, layout):
         termName, worksheetName, activityName = layout.source.split('|')
         activities = IActivities(section)
@@ -173,7 +196,9 @@ class BaseStudentPDFView(BasePDFView):
         scoresystems = IScoreSystemContainer(ISchoolToolApplication(None))
         average_scoresystem = scoresystems.get(prefs.get('scoresystem', ''))
 
-        total, average = gradebook.getWorksheetTotalAverage(worksheet, student)
+        averages = self.getWorksheetAverages(gradebook, worksheet)
+        total, average = averages.get(removeSecurityProxy(student),
+                                      (0, UNSCORED))
         if average is UNSCORED:
             return None
         return convertAverage(average, average_scoresystem)
@@ -608,29 +633,8 @@ class FailingReportPDFView(flourish.report.PlainPDFPage):
                 break
         else:
             return []
-        for student in gb.students:
-            score = gb.getScore(student, activity)
-            if not score:
-                continue
-            failure = False
-            if IDiscreteValuesScoreSystem.providedBy(score.scoreSystem):
-                for definition in score.scoreSystem.scores:
-                    if definition[0] == self.score:
-                        passing_value = definition[2]
-                    if definition[0] == score.value:
-                        this_value = definition[2]
-                if score.scoreSystem._isMaxPassingScore:
-                    if this_value > passing_value:
-                        failure = True
-                elif this_value < passing_value:
-                    failure = True
-            else:
-                passing_value = Decimal(self.score)
-                this_value = score.value
-                if this_value < passing_value:
-                    failure = True
-            if failure:
-                data.append([student, score.value])
+        for student, score in gb.getFailingStudents(activity, self.score):
+            data.append([student, score.value])
         return data
 
     def students(self):
@@ -1194,9 +1198,9 @@ class WorksheetGrid(schooltool.table.pdf.GridContentBlock):
 
     def updateRows(self):
         self.rows = []
-        collator = ICollator(self.request.locale)
-        factory = getUtility(IPersonFactory)
-        sorting_key = lambda x: factory.getSortingKey(x['object'], collator)
+        roster = self.gradebook_overview.roster
+        collator = getCachingCollator(self.request)
+        sorting_key = lambda x: roster.getSortingKey(x['object'], collator)
         for info in sorted(self.gradebook_overview.students_info,
                            key=sorting_key):
             self.rows.append(schooltool.table.pdf.GridRow(
@@ -1428,13 +1432,18 @@ class ReportCardStudentCommentsViewlet(ReportCardStudentGradesMixin,
                         continue
                     heading = self.pdf_view.getLayoutActivityHeading(
                         outline_activity, truncate=False)
-                    html2rml = getMultiAdapter(
-                        (unicode(score.value), self.request),
-                        name='html2rml')
-                    html2rml.para_class = 'report_card_comment'
+                    rendering = queryCommentRendering(self.student, activity)
+                    if (rendering is not None and
+                        rendering.rml is not None):
+                        value = rendering.rml
+                    else:
+                        value = getMultiAdapter(
+                            (unicode(score.value), self.request),
+                            name='html2rml')
+                        value.para_class = COMMENT_PARA_CLASS
                     activity_result = {
                         'heading': heading,
-                        'value': html2rml,
+                        'value': value,
                         }
                     result.append(activity_result)
         return result
@@ -0,0 +1,55 @@
+/* Open the popup menus of the gradebook headers from the menus of the
+   whole worksheet, loaded once per change stamp of the worksheet.
+   Requests to the popup menu views are answered here once the menus are
+   loaded; the views are still asked about anything else. */
+function GradebookPopupMenus(url)
+{
+    this.url = url;
+    this.menus = null;
+}
+
+// Sections of the menus and the parameters of the popup menu views
+GradebookPopupMenus.prototype.views = {
+    activity_popup_menu: ['activity', 'activity_id'],
+    student_popup_menu: ['student', 'student_id'],
+    name_popup_menu: ['name', 'column_id'],
+    total_popup_menu: ['total', 'column_id']
+};
+
+GradebookPopupMenus.prototype.load = function()
+{
+    var self = this;
+    $.ajax({
+        url: self.url,
+        dataType: 'json',
+        success: function(menus) {
+            self.menus = menus;
+        }
+    });
+};
+
+GradebookPopupMenus.prototype.find = function(request)
+{
+    if (this.menus === null)
+        return null;
+    var name = request.path.split('/').pop();
+    if (!this.views.hasOwnProperty(name))
+        return null;
+    var section = this.menus[this.views[name][0]];
+    var key = request.params[this.views[name][1]];
+    if (!section || key === undefined || !section.hasOwnProperty(key))
+        return null;
+    return section[key];
+};
+
+GradebookPopupMenus.prototype.bind = function()
+{
+    var self = this;
+    $.ajaxTransport('+*', function(options) {
+        var menu = self.find(parseGradebookRequest(options));
+        if (menu === null)
+            return undefined;
+        return answerGradebookRequest(menu);
+    });
+    self.load();
+};
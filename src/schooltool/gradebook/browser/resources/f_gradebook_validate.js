@@ -0,0 +1,107 @@
+/* Validate typed scores in the browser from the score system info of the
+   worksheet activities, instead of asking the validate_score view about
+   every cell.  Requests to validate_score are answered here when the
+   activity is known; the view is still asked about anything else. */
+function GradebookScoreValidator(score_systems)
+{
+    this.score_systems = score_systems;
+    this.lookups = {};
+}
+
+GradebookScoreValidator.prototype.number_re =
+    /^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$/;
+
+GradebookScoreValidator.prototype.lookup = function(activity_id, info)
+{
+    // Labels match case insensitively, the first label wins
+    var lookup = this.lookups[activity_id];
+    if (lookup === undefined) {
+        lookup = this.lookups[activity_id] = {};
+        $.each(info.labels, function(index, label) {
+            var key = label.toLowerCase();
+            if (!lookup.hasOwnProperty(key))
+                lookup[key] = label;
+        });
+    }
+    return lookup;
+};
+
+GradebookScoreValidator.prototype.validate = function(activity_id, score)
+{
+    var result = {is_valid: true, is_extracredit: false};
+    if (!score || !activity_id)
+        return result;
+    var info = this.score_systems[activity_id];
+    if (info === undefined)
+        return null;
+    if (info.type == 'd') {
+        var lookup = this.lookup(activity_id, info);
+        var key = score.toLowerCase();
+        if (lookup.hasOwnProperty(key))
+            result.score = lookup[key];
+        else
+            result.is_valid = false;
+    } else if (info.type == 'r') {
+        var value = $.trim(score);
+        if (!this.number_re.test(value)) {
+            result.is_valid = false;
+        } else {
+            var number = parseFloat(value);
+            if (number < parseFloat(info.min))
+                result.is_valid = false;
+            else if (number > parseFloat(info.max))
+                result.is_extracredit = true;
+        }
+    }
+    return result;
+};
+
+GradebookScoreValidator.prototype.bind = function()
+{
+    var self = this;
+    $.ajaxTransport('+*', function(options) {
+        var request = parseGradebookRequest(options);
+        if (!/(^|\/)validate_score$/.test(request.path))
+            return undefined;
+        var params = request.params;
+        if (params.activity !== undefined)
+            return undefined;
+        var result = self.validate(params.activity_id, params.score);
+        if (result === null)
+            return undefined;
+        return answerGradebookRequest(result);
+    });
+};
+
+/* Split the url and the parameters of a jQuery ajax request. */
+function parseGradebookRequest(options)
+{
+    var decode = function(text) {
+        return decodeURIComponent((text || '').replace(/\+/g, ' '));
+    };
+    var parse = function(query, params) {
+        if (!query)
+            return;
+        $.each(query.split('&'), function(index, pair) {
+            var parts = pair.split('=');
+            params[decode(parts[0])] = decode(parts.slice(1).join('='));
+        });
+    };
+    var url = options.url.split('?');
+    var params = {};
+    parse(url[1], params);
+    if (typeof options.data == 'string')
+        parse(options.data, params);
+    return {path: url[0], params: params};
+}
+
+/* A jQuery transport answering an ajax request with a JSON result. */
+function answerGradebookRequest(result)
+{
+    return {
+        send: function(headers, complete) {
+            complete(200, 'success', {text: JSON.stringify(result)});
+        },
+        abort: function() {}
+    };
+}
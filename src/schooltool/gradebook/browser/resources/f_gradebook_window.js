@@ -0,0 +1,170 @@
+/* Load further rows and columns of the gradebook table through the
+   table_window view as the teacher scrolls the grid. */
+function GradebookWindow(url, rows_total, columns_total)
+{
+    this.url = url;
+    this.rows_total = rows_total;
+    this.columns_total = columns_total;
+    this.loading = false;
+}
+
+GradebookWindow.prototype.bodies = function()
+{
+    return {
+        students: $('#students-part tbody'),
+        grades: $('#grades-part tbody'),
+        totals: $('#totals-part tbody')
+    };
+};
+
+GradebookWindow.prototype.rowsLoaded = function()
+{
+    return $('#students-part tbody tr.window-row').length;
+};
+
+GradebookWindow.prototype.columnsLoaded = function()
+{
+    return $('#grades-part thead tr:first th').not('.placeholder').length;
+};
+
+GradebookWindow.prototype.load = function(data, callback)
+{
+    var self = this;
+    if (self.loading)
+        return;
+    self.loading = true;
+    $.ajax({
+        url: self.url,
+        data: data,
+        dataType: 'json',
+        success: function(result) {
+            self.loading = false;
+            callback.call(self, result);
+        },
+        error: function() {
+            self.loading = false;
+        }
+    });
+};
+
+GradebookWindow.prototype.gradeCell = function(grade)
+{
+    var td = $('<td/>').text(grade.value);
+    if (grade.is_comment)
+        td.addClass('comment-cell').attr('hidden_value', grade.hidden_value);
+    return td;
+};
+
+GradebookWindow.prototype.appendRows = function(result)
+{
+    var self = this;
+    var bodies = self.bodies();
+    $.each(result.rows, function(index, row) {
+        var students_tr = $('<tr class="window-row"/>');
+        $.each(row.names, function(n, name) {
+            var td = $('<td/>').attr('id', row.id);
+            if (n == row.names.length - 1)
+                td.attr('colspan', 2);
+            td.append($('<a class="popup_link" href=""/>')
+                      .attr('title', row.title)
+                      .addClass(row.css_class)
+                      .text(name));
+            students_tr.append(td);
+        });
+        var grades_tr = $('<tr/>');
+        $.each(row.grades, function(g, grade) {
+            grades_tr.append(self.gradeCell(grade));
+        });
+        grades_tr.append('<td class="placeholder">&nbsp;</td>');
+        var totals_tr = $('<tr/>');
+        $.each(row.totals, function(t, total) {
+            totals_tr.append($('<td/>').text(total));
+        });
+        self.insertRow(bodies.students, students_tr);
+        self.insertRow(bodies.grades, grades_tr);
+        self.insertRow(bodies.totals, totals_tr);
+    });
+};
+
+GradebookWindow.prototype.insertRow = function(tbody, tr)
+{
+    // Keep the column averages row last.
+    var averages = tbody.children('tr.averages-row');
+    if (averages.length)
+        averages.before(tr);
+    else
+        tbody.append(tr);
+};
+
+GradebookWindow.prototype.appendColumns = function(result)
+{
+    var self = this;
+    var head = $('#grades-part thead tr');
+    var titles = $(head[0]).children('th.placeholder');
+    var maxes = $(head[1]);
+    $.each(result.activities, function(index, activity) {
+        var th = $('<th/>').attr('id', activity.hash)
+                           .attr('data-scores', activity.scores);
+        if (activity.cssClass)
+            th.addClass(activity.cssClass);
+        th.append($('<a class="popup_link"/>')
+                  .attr('title', activity.longTitle)
+                  .attr('href', 'gradeActivity.html?activity=' + activity.hash)
+                  .text(activity.shortTitle));
+        if (activity.description)
+            th.append($('<span class="activity-description"/>')
+                      .text(activity.description));
+        titles.before(th);
+        maxes.append($('<th/>').text(activity.max));
+    });
+    var rows = $('#grades-part tbody tr').not('.averages-row');
+    $.each(result.rows, function(index, row) {
+        var placeholder = $(rows[index]).children('td.placeholder');
+        $.each(row.grades, function(g, grade) {
+            placeholder.before(self.gradeCell(grade));
+        });
+    });
+    var averages = $('#grades-part tbody tr.averages-row td.placeholder');
+    $.each(result.column_averages, function(index, average) {
+        averages.before($('<td/>').text(average));
+    });
+};
+
+GradebookWindow.prototype.loadRows = function()
+{
+    var loaded = this.rowsLoaded();
+    if (loaded >= this.rows_total)
+        return;
+    this.load({rows_start: loaded,
+               columns_start: 0,
+               columns_count: this.columnsLoaded()},
+              this.appendRows);
+};
+
+GradebookWindow.prototype.loadColumns = function()
+{
+    var loaded = this.columnsLoaded();
+    if (loaded >= this.columns_total)
+        return;
+    this.load({rows_start: 0,
+               rows_count: this.rowsLoaded(),
+               columns_start: loaded},
+              this.appendColumns);
+};
+
+GradebookWindow.prototype.bind = function()
+{
+    var self = this;
+    var near = 200;
+    $(window).scroll(function() {
+        if ($(window).scrollTop() + $(window).height() >
+            $(document).height() - near)
+            self.loadRows();
+    });
+    $('#grades-part').scroll(function() {
+        var part = $(this);
+        if (part.scrollLeft() + part.innerWidth() >
+            this.scrollWidth - near)
+            self.loadColumns();
+    });
+};
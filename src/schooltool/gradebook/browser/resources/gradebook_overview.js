@@ -12,7 +12,7 @@ function checkChanges()
     if (saveFlag == true)
         {
         button = document.getElementsByName('UPDATE_SUBMIT')[0];
-        button.click();
+        button.form.submit();
         }
     else
         return true;
@@ -139,6 +139,7 @@ function checkValid(e, name)
 	}
 
     edited = true;
+    markChanged(name);
     var element = document.getElementById(name);
     var elementCell = document.getElementById(name+'_cell');
     var value = element.value;
@@ -195,6 +196,73 @@ function setBackgroundColor(name, activity, value, errors_only)
     return true;    
 }
 
+var changedCells = {};
+
+function markChanged(name)
+{
+    if (name.split('_')[0] != 'fd')
+        changedCells[name] = true;
+}
+
+function saveChangedCells(form)
+{
+    // Post only the changed cells and update the affected totals and
+    // averages in place.  Falls back to submitting the whole form.
+    var activity = [], student = [], score = [];
+    for (var name in changedCells)
+    {
+        var index = name.indexOf('_');
+        activity.push(name.substring(0, index));
+        student.push(name.substring(index + 1));
+        score.push(document.getElementById(name).value);
+    }
+    setNotEdited();
+    if (activity.length == 0)
+        return false;
+    $.ajax({
+        type: 'POST',
+        url: form.action + '/save_scores',
+        data: {'activity:list': activity,
+               'student:list': student,
+               'score:list': score},
+        traditional: true,
+        dataType: 'json',
+        success: function(data) {
+            changedCells = {};
+            for (var username in data.rows)
+            {
+                var row = data.rows[username];
+                $(document.getElementById('total_' + username)).html(
+                    '<b>' + row.total + '</b>');
+                $(document.getElementById('average_' + username)).html(
+                    '<b>' + row.average + '</b>');
+            }
+            for (var act in data.columns)
+                $(document.getElementById('column_average_' + act)).html(
+                    data.columns[act]);
+            for (var i = 0; i < data.errors.length; i++)
+            {
+                var error = data.errors[i];
+                changedCells[error.activity + '_' + error.student] = true;
+                changeBackgroundColor(
+                    error.activity + '_' + error.student + '_cell',
+                    'error_bg');
+            }
+            for (var a = 0; a < numactivities; a++)
+                for (var s = 0; s < numstudents; s++)
+                {
+                    var cell = activities[a] + '_' + students[s];
+                    if (!changedCells[cell])
+                        changeBackgroundColor(cell + '_cell', 'default_bg');
+                }
+        },
+        error: function() {
+            form.submit();
+        }
+    });
+    return false;
+}
+
 function performFillDown(activity) {
     var fd = document.getElementById('fd_'+activity);
     if (fd.value=='') return false;
@@ -206,6 +274,7 @@ function performFillDown(activity) {
     for(j=0;j!=numstudents;j++) {
         name = activity+'_'+students[j];
         document.getElementById(name).value = fd.value;
+        markChanged(name);
         setBackgroundColor(name, activity, fd.value, false);
     }
     document.getElementById('fd_'+activity).value = '';
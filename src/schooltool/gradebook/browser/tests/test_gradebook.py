@@ -0,0 +1,1211 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tests for gradebook views.
+"""
+import unittest, doctest
+
+from zope.annotation.interfaces import IAttributeAnnotatable
+from zope.app.testing import setup
+from zope.interface import implements
+from zope.publisher.browser import TestRequest
+from zope.security.management import endInteraction
+
+
+def doctest_ConditionalGetMixin():
+    r"""Tests for ConditionalGetMixin
+
+    Gradebook views answer conditional requests from an ETag computed from
+    the parts returned by their getETagParts.
+
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     ConditionalGetMixin)
+        >>> class PageStub(object):
+        ...     status = 200
+        ...     def __init__(self, context, request):
+        ...         self.context = context
+        ...         self.request = request
+        ...     def __call__(self):
+        ...         if self.status is not None:
+        ...             self.request.response.setStatus(self.status)
+        ...         return 'Rendered'
+        >>> class ViewStub(ConditionalGetMixin, PageStub):
+        ...     parts = ['stamp 1']
+        ...     def getETagParts(self):
+        ...         return self.parts
+
+    The rendered page gets an ETag:
+
+        >>> request = TestRequest()
+        >>> view = ViewStub(None, request)
+        >>> view()
+        'Rendered'
+        >>> etag = request.response.getHeader('ETag')
+        >>> etag
+        '"..."'
+        >>> request.response.getHeader('Cache-Control')
+        'private, no-cache'
+
+    A request with a matching ETag is answered with 304 Not Modified
+    without rendering the page:
+
+        >>> request = TestRequest(HTTP_IF_NONE_MATCH=etag)
+        >>> view = ViewStub(None, request)
+        >>> view()
+        ''
+        >>> request.response.getStatus()
+        304
+        >>> request.response.getHeader('ETag') == etag
+        True
+
+    When the parts change, for example when the change stamp of the
+    worksheet is bumped, the page is rendered again:
+
+        >>> request = TestRequest(HTTP_IF_NONE_MATCH=etag)
+        >>> view = ViewStub(None, request)
+        >>> view.parts = ['stamp 2']
+        >>> view()
+        'Rendered'
+        >>> request.response.getStatus()
+        200
+        >>> request.response.getHeader('ETag') == etag
+        False
+
+    The publisher sets the status after the page is rendered, pages that
+    set no status get an ETag too:
+
+        >>> request = TestRequest()
+        >>> view = ViewStub(None, request)
+        >>> view.status = None
+        >>> view()
+        'Rendered'
+        >>> request.response.getHeader('ETag') == etag
+        True
+
+    Redirects and errors get no ETag:
+
+        >>> request = TestRequest()
+        >>> view = ViewStub(None, request)
+        >>> view.status = 302
+        >>> view()
+        'Rendered'
+        >>> print request.response.getHeader('ETag')
+        None
+
+    Views that can't be cached return no parts, they are always rendered
+    and get no ETag:
+
+        >>> request = TestRequest(HTTP_IF_NONE_MATCH=etag)
+        >>> view = ViewStub(None, request)
+        >>> view.parts = None
+        >>> view()
+        'Rendered'
+        >>> print request.response.getHeader('ETag')
+        None
+
+    Journal attendance changes don't bump the change stamps, so views
+    showing journal data of the section are not cached:
+
+        >>> class SnapshotStub(object):
+        ...     journal_data = None
+        >>> class GradebookStub(object):
+        ...     snapshot = SnapshotStub()
+        >>> gradebook = GradebookStub()
+        >>> view.showsJournalData(gradebook)
+        False
+        >>> gradebook.snapshot.journal_data = 'journal data'
+        >>> view.showsJournalData(gradebook)
+        True
+
+    """
+
+
+def doctest_ColumnStatistics():
+    r"""Tests for ColumnStatistics
+
+    Column averages are computed from the scores of the column, in percent
+    of the points that could have been scored.
+
+        >>> from decimal import Decimal
+        >>> from schooltool.requirement.scoresystem import UNSCORED
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     ColumnStatistics)
+        >>> class ScoreStub(object):
+        ...     def __init__(self, value):
+        ...         self.value = value
+        ...     def __nonzero__(self):
+        ...         return self.value is not UNSCORED
+
+        >>> column = ColumnStatistics(Decimal(50))
+        >>> column.possible, column.average
+        (0, None)
+        >>> print column.minimum, column.maximum
+        None None
+
+        >>> for value in [40, Decimal('45.5'), 12.5]:
+        ...     column.add(ScoreStub(value))
+        >>> column.count, column.total
+        (3, Decimal('98.0'))
+        >>> column.possible
+        150
+        >>> '%.3f' % column.average
+        '65.333'
+
+    The lowest and the highest scores are kept on the way:
+
+        >>> column.minimum, column.maximum
+        (Decimal('12.5'), Decimal('45.5'))
+
+    Missing, unscored and non numeric scores are ignored:
+
+        >>> column.add(None)
+        >>> column.add(ScoreStub(UNSCORED))
+        >>> column.add(ScoreStub(u'Great job'))
+        >>> column.count, column.total
+        (3, Decimal('98.0'))
+        >>> column.minimum, column.maximum
+        (Decimal('12.5'), Decimal('45.5'))
+
+    Scores above the best score are counted as they are:
+
+        >>> column.add(ScoreStub(55))
+        >>> column.count, column.total, column.maximum
+        (4, Decimal('153.0'), 55)
+
+    """
+
+
+def doctest_getRecentHistory():
+    r"""Tests for getRecentHistory
+
+    The grade history view reads the current evaluation of an activity and
+    the most recent records of its history.
+
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     getRecentHistory)
+        >>> class EvaluationsStub(object):
+        ...     def __init__(self, current, history):
+        ...         self.current = current
+        ...         self.history = history
+        ...     def get(self, activity, default=None):
+        ...         return self.current
+        ...     def iterHistory(self, activity, reverse=False, start=0,
+        ...                     count=None):
+        ...         print 'iterHistory(reverse=%s, count=%s)' % (reverse,
+        ...                                                       count)
+        ...         history = self.history[::-1] if reverse else self.history
+        ...         stop = None if count is None else start + count
+        ...         return iter(history[start:stop])
+
+        >>> evaluations = EvaluationsStub('now', ['first', None, 'last'])
+
+    Only one record more than shown is read, to tell whether there are
+    more:
+
+        >>> getRecentHistory(evaluations, 'activity', 2)
+        iterHistory(reverse=True, count=2)
+        (['now', 'last'], True)
+        >>> getRecentHistory(evaluations, 'activity', 4)
+        iterHistory(reverse=True, count=4)
+        (['now', 'last', None, 'first'], False)
+        >>> getRecentHistory(evaluations, 'activity', 3)
+        iterHistory(reverse=True, count=3)
+        (['now', 'last', None], True)
+
+    The whole history is read without a size:
+
+        >>> getRecentHistory(evaluations, 'activity', None)
+        iterHistory(reverse=True, count=None)
+        (['now', 'last', None, 'first'], False)
+
+    """
+
+
+def doctest_FlourishStudentGradeHistory_getHistorySize():
+    r"""Tests for FlourishStudentGradeHistory.getHistorySize
+
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     FlourishStudentGradeHistory)
+        >>> def getHistorySize(**form):
+        ...     view = FlourishStudentGradeHistory(None, TestRequest(form=form))
+        ...     return view.getHistorySize()
+
+    The most recent records are shown by default:
+
+        >>> getHistorySize()
+        10
+
+    The history request parameter asks for another number of records or
+    for all of them:
+
+        >>> getHistorySize(history='3')
+        3
+        >>> print getHistorySize(history='all')
+        None
+
+    Bad numbers are ignored:
+
+        >>> getHistorySize(history='0'), getHistorySize(history='many')
+        (10, 10)
+
+    """
+
+
+class ScoreStub(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __nonzero__(self):
+        return self.value is not None
+
+
+class ActivityStub(object):
+
+    label = None
+
+    def __init__(self, name, scoresystem=None):
+        self.__name__ = name
+        self.title = name.upper()
+        self.scoresystem = scoresystem
+
+
+class CollatorStub(object):
+
+    def key(self, text):
+        return text.lower()
+
+
+class RosterStub(object):
+
+    def __init__(self, students=()):
+        self.students = list(students)
+
+    def getStudent(self, username):
+        for student in self.students:
+            if student.username == username:
+                return student
+        return None
+
+    def getSortingKey(self, student, collator):
+        return collator.key(student)
+
+
+def buildActivityInfo(names, max=10):
+    return [{'hash': name,
+             'object': ActivityStub(name),
+             'linked_source': None,
+             'scorable': True,
+             'cssClass': 'scorable',
+             'scores': None,
+             'shortTitle': name,
+             'longTitle': name.upper(),
+             'max': max,
+             'updateGrades': ''}
+            for name in names]
+
+
+def buildRows(grades, activity_info):
+    """Rows of a gradebook table of students and their grades.
+
+    Totals and averages are computed from the grades, like the stored
+    averages of the worksheets.
+    """
+    from decimal import Decimal
+    from schooltool.requirement.scoresystem import UNSCORED
+    rows = []
+    for username, values in grades:
+        scores = dict([(name, ScoreStub(value))
+                       for name, value in values.items()])
+        points = dict([(name, value) for name, value in values.items()
+                       if not isinstance(value, basestring)])
+        raw_total = Decimal(str(sum(points.values())))
+        possible = sum([info['max'] for info in activity_info
+                        if info['hash'] in points])
+        if possible:
+            raw_average = 100 * raw_total / Decimal(possible)
+            average = '%.1f%%' % raw_average
+        else:
+            raw_average = UNSCORED
+            average = 'N/A'
+        rows.append({
+            'student': {'id': username,
+                        'username': username,
+                        'title': username.title(),
+                        'css_class': 'popup_link',
+                        'first_name': username.title(),
+                        'last_name': username.upper(),
+                        'object': username},
+            'scores': scores,
+            'absences': u'0',
+            'tardies': u'0',
+            'total': '%.1f' % raw_total,
+            'average': average,
+            'raw_total': raw_total,
+            'raw_average': raw_average,
+            'raw_absences': 0,
+            'raw_tardies': 0,
+            })
+    return rows
+
+
+def getGradeValue(student_info, activity_info, scores):
+    """Grade values of a table model, that tell when a cell is built."""
+    print 'cell %s %s' % (student_info['username'], activity_info['hash'])
+    score = scores.get(activity_info['hash'])
+    if not score:
+        return '', ''
+    return score.value, ''
+
+
+def doctest_GradebookTableModel():
+    r"""Tests for GradebookTableModel
+
+        >>> from decimal import Decimal
+        >>> from zope.interface import directlyProvides
+        >>> from schooltool.requirement.interfaces import ICommentScoreSystem
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     GradebookTableModel, NO_SORT_KEY)
+
+    The second activity is graded with comments:
+
+        >>> activity_info = buildActivityInfo(['a1', 'a2', 'a3'])
+        >>> class ScoreSystemStub(object):
+        ...     pass
+        >>> comments = ScoreSystemStub()
+        >>> directlyProvides(comments, ICommentScoreSystem)
+        >>> activity_info[1]['object'].scoresystem = comments
+
+        >>> rows = buildRows([
+        ...     ('carl', {'a1': 7, 'a2': u'Nice work'}),
+        ...     ('anna', {'a1': 10, 'a3': 4}),
+        ...     ('emil', {'a1': Decimal('10'), 'a3': 10}),
+        ...     ('bob', {}),
+        ...     ('dora', {'a1': 7, 'a3': 1.5}),
+        ...     ], activity_info)
+        >>> names = [('Carl', 'Zed'), ('Anna', 'Young'), ('Emil', 'Adams'),
+        ...          ('Bob', 'brown'), ('Anna', 'Adams')]
+        >>> for row, (first_name, last_name) in zip(rows, names):
+        ...     row['student']['first_name'] = first_name
+        ...     row['student']['last_name'] = last_name
+
+        >>> model = GradebookTableModel(
+        ...     rows, activity_info, getGradeValue, CollatorStub(),
+        ...     roster=RosterStub())
+        >>> def printOrder(key, reverse=False):
+        ...     print [rows[index]['student']['id']
+        ...            for index in model.order(key, reverse)]
+
+    Students are sorted by the sorting keys of the roster, or by their
+    names:
+
+        >>> printOrder('student')
+        ['anna', 'bob', 'carl', 'dora', 'emil']
+        >>> printOrder('student', reverse=True)
+        ['emil', 'dora', 'carl', 'bob', 'anna']
+        >>> printOrder('last_name')
+        ['dora', 'emil', 'bob', 'anna', 'carl']
+        >>> printOrder('first_name')
+        ['dora', 'anna', 'bob', 'carl', 'emil']
+
+    Totals and averages are sorted by their values, students without an
+    average go first.  The average of 100% is the highest one, even
+    though its display text sorts before the others:
+
+        >>> [(row['student']['id'], row['total'], row['average'])
+        ...  for row in rows]
+        [('carl', '7.0', '70.0%'), ('anna', '14.0', '70.0%'),
+         ('emil', '20.0', '100.0%'), ('bob', '0.0', 'N/A'),
+         ('dora', '8.5', '42.5%')]
+        >>> printOrder('total')
+        ['bob', 'carl', 'dora', 'anna', 'emil']
+        >>> printOrder('average')
+        ['bob', 'dora', 'anna', 'carl', 'emil']
+        >>> printOrder('average', reverse=True)
+        ['emil', 'carl', 'anna', 'dora', 'bob']
+
+    Activities are sorted by the values of the numeric scores, students
+    with equal scores by name.  Unscored students and non numeric scores
+    go first:
+
+        >>> printOrder('a1')
+        ['bob', 'carl', 'dora', 'anna', 'emil']
+        >>> printOrder('a1', reverse=True)
+        ['emil', 'anna', 'dora', 'carl', 'bob']
+        >>> printOrder('a3')
+        ['bob', 'carl', 'dora', 'anna', 'emil']
+        >>> model.findColumn('a3').sort_keys
+        [-9999999.9, 4.0, 10.0, -9999999.9, 1.5]
+        >>> model.findColumn('a2').sort_keys == [NO_SORT_KEY] * 5
+        True
+        >>> printOrder('a2')
+        ['anna', 'bob', 'carl', 'dora', 'emil']
+
+    Unknown columns keep the students sorted by name:
+
+        >>> printOrder('a9')
+        ['anna', 'bob', 'carl', 'dora', 'emil']
+
+    Absences and tardies are sorted only when the section has journal
+    data:
+
+        >>> for row, absences in zip(rows, [2, 0, 1, 2, 0]):
+        ...     row['raw_absences'] = absences
+        >>> printOrder('absences', reverse=True)
+        ['emil', 'dora', 'carl', 'bob', 'anna']
+        >>> model.journal_data = 'journal data'
+        >>> printOrder('absences')
+        ['anna', 'dora', 'emil', 'bob', 'carl']
+        >>> printOrder('absences', reverse=True)
+        ['carl', 'bob', 'emil', 'dora', 'anna']
+
+    Sorting did not build any grade cells.  Column averages are computed
+    from the scores of all the rows in percent of the points possible,
+    comment columns have none:
+
+        >>> [model.column(info).average for info in activity_info]
+        ['85.0%', '', '51.7%']
+        >>> statistics = model.findColumn('a3').statistics
+        >>> statistics.count, statistics.total, statistics.possible
+        (3, Decimal('15.5'), 30)
+        >>> statistics.minimum, statistics.maximum
+        (Decimal('1.5'), 10)
+        >>> print model.findColumn('a2').statistics
+        None
+
+    Grade cells are built when they are asked for:
+
+        >>> for item in sorted(model.findColumn('a2').grade(0).items()):
+        ...     print item
+        cell carl a2
+        ('activity', 'a2')
+        ('editable', True)
+        ('hidden_value', '')
+        ('is_comment', True)
+        ('is_discrete', False)
+        ('max', 10)
+        ('value', u'Nice work')
+        >>> model.findColumn('a2').grade(0)['value']
+        u'Nice work'
+
+    """
+
+
+def doctest_GradebookOverview_getRequestWindow():
+    r"""Tests for GradebookOverview.getRequestWindow
+
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     GradebookOverview)
+        >>> def getRequestWindow(**form):
+        ...     view = GradebookOverview(None, TestRequest(form=form))
+        ...     return view.getRequestWindow('rows', 100)
+
+    The window starts at the first row and has the default size unless
+    the request asks for another one:
+
+        >>> getRequestWindow()
+        slice(0, 100, None)
+        >>> getRequestWindow(rows_start='150')
+        slice(150, 250, None)
+        >>> getRequestWindow(rows_start='10', rows_count='5')
+        slice(10, 15, None)
+
+    Parameters of other windows are ignored:
+
+        >>> getRequestWindow(columns_start='10', columns_count='5')
+        slice(0, 100, None)
+
+    Negative numbers are clamped to zero:
+
+        >>> getRequestWindow(rows_start='-10', rows_count='5')
+        slice(0, 5, None)
+        >>> getRequestWindow(rows_start='10', rows_count='-5')
+        slice(10, 10, None)
+
+    The default window is used when the numbers can't be read:
+
+        >>> getRequestWindow(rows_start='ten', rows_count='5')
+        slice(0, 100, None)
+        >>> getRequestWindow(rows_start='10', rows_count='5.5')
+        slice(0, 100, None)
+        >>> getRequestWindow(rows_start=['1', '2'])
+        slice(0, 100, None)
+
+    """
+
+
+def doctest_FlourishGradebookTableWindowView():
+    r"""Tests for FlourishGradebookTableWindowView
+
+        >>> from zope.component import provideAdapter
+        >>> from schooltool.person.interfaces import IPerson
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     GradebookTableModel, FlourishGradebookTableWindowView)
+
+        >>> provideAdapter(lambda principal: 'teacher', (None, ), IPerson)
+
+        >>> class WorksheetStub(object):
+        ...     deployed = False
+        >>> class GradebookStub(object):
+        ...     context = WorksheetStub()
+        ...     sort_key = ('average', True)
+        ...     def getSortKey(self, person):
+        ...         return self.sort_key
+        ...     def getCurrentWorksheet(self, person):
+        ...         return self.context
+
+    Five students have grades in four activities, averages of the students
+    are the stored averages of the worksheet:
+
+        >>> activity_info = buildActivityInfo(['a1', 'a2', 'a3', 'a4'])
+        >>> rows = buildRows([
+        ...     ('anna', {'a1': 5, 'a2': 8, 'a3': 1}),
+        ...     ('bob', {'a1': 9, 'a2': 2}),
+        ...     ('carl', {'a1': 7, 'a2': 10, 'a3': 4}),
+        ...     ('dora', {'a2': 6}),
+        ...     ('emil', {'a1': 3, 'a2': 4, 'a3': 9, 'a4': 7}),
+        ...     ], activity_info)
+        >>> [(row['student']['id'], row['average']) for row in rows]
+        [('anna', '46.7%'), ('bob', '55.0%'), ('carl', '70.0%'),
+         ('dora', '60.0%'), ('emil', '57.5%')]
+
+        >>> class WindowViewStub(FlourishGradebookTableWindowView):
+        ...     journal_present = False
+        ...     name_sorting_columns = PersonFactoryStub().columns()
+        ...     filtered_activity_info = activity_info
+        ...     def processColumnPreferences(self):
+        ...         self.absences_hide = self.tardies_hide = True
+        ...         self.total_hide = False
+        ...         self.average_hide = False
+        ...         self.average_scoresystem = None
+        ...     def getTableModel(self, worksheet):
+        ...         return GradebookTableModel(
+        ...             buildRows(self.grades, activity_info),
+        ...             activity_info, getGradeValue, CollatorStub(),
+        ...             roster=RosterStub())
+        >>> WindowViewStub.grades = [
+        ...     (row['student']['id'],
+        ...      dict([(name, score.value)
+        ...            for name, score in row['scores'].items()]))
+        ...     for row in rows]
+
+        >>> gradebook = GradebookStub()
+        >>> def getWindow(**form):
+        ...     view = WindowViewStub(gradebook, TestRequest(form=form))
+        ...     return view.result()
+
+    The window of two rows and two columns in the middle of the table
+    builds only its own grade cells:
+
+        >>> result = getWindow(rows_start='1', rows_count='2',
+        ...                    columns_start='1', columns_count='2')
+        cell dora a2
+        cell dora a3
+        cell emil a2
+        cell emil a3
+
+    The rows are sorted by the averages of all the students, the window
+    tells where it starts and how big the whole table is:
+
+        >>> result['rows_start'], result['rows_total']
+        (1, 5)
+        >>> result['columns_start'], result['columns_total']
+        (1, 4)
+
+        >>> [activity['hash'] for activity in result['activities']]
+        ['a2', 'a3']
+        >>> for row in result['rows']:
+        ...     print ' '.join([row['id']] + row['names'] + row['totals']),
+        ...     print [grade['value'] for grade in row['grades']]
+        dora Dora DORA 6.0 60.0% [6, '']
+        emil Emil EMIL 23.0 57.5% [4, 9]
+
+    Column averages of the window cover the grades of every student:
+
+        >>> result['column_averages']
+        ['60.0%', '46.7%']
+
+    Sorting the other way round shows other students in the same window:
+
+        >>> gradebook.sort_key = ('average', False)
+        >>> result = getWindow(rows_start='1', rows_count='2',
+        ...                    columns_start='3', columns_count='2')
+        cell bob a4
+        cell emil a4
+        >>> [row['id'] for row in result['rows']]
+        ['bob', 'emil']
+        >>> [activity['hash'] for activity in result['activities']]
+        ['a4']
+        >>> result['columns_start'], result['columns_total']
+        (3, 4)
+        >>> result['column_averages']
+        ['70.0%']
+
+    Windows past the end of the table are empty:
+
+        >>> result = getWindow(rows_start='5', columns_start='4')
+        >>> result['rows'], result['activities'], result['column_averages']
+        ([], [], [])
+        >>> result['rows_total'], result['columns_total']
+        (5, 4)
+
+    Bad window parameters show the default window:
+
+        >>> gradebook.sort_key = ('student', False)
+        >>> result = getWindow(rows_start='first', rows_count='-2',
+        ...                    columns_start='x', columns_count='1')
+        cell anna a1
+        ...
+        cell emil a4
+        >>> result['rows_start'], result['columns_start']
+        (0, 0)
+        >>> [row['id'] for row in result['rows']]
+        ['anna', 'bob', 'carl', 'dora', 'emil']
+        >>> [activity['hash'] for activity in result['activities']]
+        ['a1', 'a2', 'a3', 'a4']
+
+    """
+
+
+class SnapshotStub(object):
+    """A snapshot of the activities and the roster of a worksheet."""
+
+    journal_data = None
+
+    def __init__(self, activities, roster=None):
+        self.activities = activities
+        self.roster = roster
+
+    def getActivities(self, worksheet):
+        return self.activities
+
+    def getActivity(self, worksheet, name):
+        for activity in self.activities:
+            if activity.__name__ == name:
+                return activity
+        return None
+
+    def getScoreSystem(self, activity):
+        return activity.scoresystem
+
+
+class ValidationGradebookStub(object):
+
+    def __init__(self, activities):
+        self.context = 'worksheet'
+        self.snapshot = SnapshotStub(activities)
+
+    def getCurrentWorksheet(self, person):
+        return self.context
+
+    def getWorksheetActivities(self, worksheet):
+        return self.snapshot.activities
+
+
+def buildValidationGradebook():
+    """A gradebook with activities of every kind of score system.
+
+    The last one is a linked column.
+    """
+    from zope.interface import directlyProvides
+    from schooltool.requirement.scoresystem import (
+        PercentScoreSystem, PassFail, CommentScoreSystem)
+    from schooltool.gradebook.interfaces import ILinkedColumnActivity
+    linked = ActivityStub('linked', PercentScoreSystem)
+    directlyProvides(linked, ILinkedColumnActivity)
+    return ValidationGradebookStub([
+        ActivityStub('percent', PercentScoreSystem),
+        ActivityStub('passfail', PassFail),
+        ActivityStub('comment', CommentScoreSystem),
+        linked])
+
+
+def printDict(result):
+    for key, value in sorted(result.items()):
+        print '%s: %r' % (key, value)
+
+
+def doctest_FlourishGradebookValidateScoreView():
+    r"""Tests for FlourishGradebookValidateScoreView
+
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     FlourishGradebookValidateScoreView)
+
+        >>> gradebook = buildValidationGradebook()
+        >>> def validate(**form):
+        ...     view = FlourishGradebookValidateScoreView(
+        ...         gradebook, TestRequest(form=form))
+        ...     return view.result()
+
+    A single score of an activity is validated by its score system:
+
+        >>> printDict(validate(activity_id='percent', score='55'))
+        is_extracredit: False
+        is_valid: True
+        >>> printDict(validate(activity_id='percent', score='-5'))
+        is_extracredit: False
+        is_valid: False
+        >>> printDict(validate(activity_id='percent', score='many'))
+        is_extracredit: False
+        is_valid: False
+
+    Scores above the best score are extra credit:
+
+        >>> printDict(validate(activity_id='percent', score='120'))
+        is_extracredit: True
+        is_valid: True
+
+    Valid scores of discrete score systems are answered with the label of
+    the score:
+
+        >>> printDict(validate(activity_id='passfail', score='pass'))
+        is_extracredit: False
+        is_valid: True
+        score: u'Pass'
+        >>> printDict(validate(activity_id='passfail', score='maybe'))
+        is_extracredit: False
+        is_valid: False
+
+        >>> printDict(validate(activity_id='comment', score='Good work'))
+        is_extracredit: False
+        is_valid: True
+
+    Empty scores, unknown activities and linked columns, which can't be
+    graded, are not validated:
+
+        >>> printDict(validate(activity_id='percent', score=''))
+        is_extracredit: False
+        is_valid: True
+        >>> printDict(validate(score='many'))
+        is_extracredit: False
+        is_valid: True
+        >>> printDict(validate(activity_id='unknown', score='many'))
+        is_extracredit: False
+        is_valid: True
+        >>> printDict(validate(activity_id='linked', score='many'))
+        is_extracredit: False
+        is_valid: True
+
+    A batch of cells is given in parallel activity and score lists, the
+    results are listed in the same order:
+
+        >>> result = validate(
+        ...     activity=['percent', 'passfail', 'percent', 'unknown',
+        ...               'linked', 'passfail'],
+        ...     score=['120', 'maybe', '-5', 'x', 'y', 'FAIL'])
+        >>> result.keys()
+        ['cells']
+        >>> for cell in result['cells']:
+        ...     printDict(cell)
+        ...     print '--'
+        activity: 'percent'
+        is_extracredit: True
+        is_valid: True
+        --
+        activity: 'passfail'
+        is_extracredit: False
+        is_valid: False
+        --
+        activity: 'percent'
+        is_extracredit: False
+        is_valid: False
+        --
+        activity: 'unknown'
+        is_extracredit: False
+        is_valid: True
+        --
+        activity: 'linked'
+        is_extracredit: False
+        is_valid: True
+        --
+        activity: 'passfail'
+        is_extracredit: False
+        is_valid: True
+        score: u'Fail'
+        --
+
+    A batch of one cell:
+
+        >>> result = validate(activity='percent', score='-1')
+        >>> for cell in result['cells']:
+        ...     printDict(cell)
+        activity: 'percent'
+        is_extracredit: False
+        is_valid: False
+
+    Scores missing from the batch are not validated:
+
+        >>> result = validate(activity=['percent', 'passfail'], score='-1')
+        >>> [cell['activity'] for cell in result['cells']]
+        ['percent']
+
+    """
+
+
+def doctest_GradebookBase_score_systems():
+    r"""Tests for GradebookBase.getScoreSystemInfo and score_systems
+
+    The gradebook embeds the info of the score systems of the activities
+    for validating the scores in the browser.
+
+        >>> from decimal import Decimal
+        >>> from zope.component import provideAdapter
+        >>> from schooltool.person.interfaces import IPerson
+        >>> from schooltool.requirement.scoresystem import (
+        ...     PercentScoreSystem, AmericanLetterScoreSystem,
+        ...     CommentScoreSystem, RangedValuesScoreSystem)
+        >>> from schooltool.gradebook.browser.gradebook import GradebookBase
+
+        >>> provideAdapter(lambda principal: 'teacher', (None, ), IPerson)
+        >>> gradebook = buildValidationGradebook()
+        >>> view = GradebookBase(gradebook, TestRequest())
+
+    Discrete score systems list their labels:
+
+        >>> printDict(view.getScoreSystemInfo(AmericanLetterScoreSystem))
+        labels: ['A', 'B', 'C', 'D', 'F']
+        type: 'd'
+
+    Ranged score systems give their minimum and maximum:
+
+        >>> printDict(view.getScoreSystemInfo(PercentScoreSystem))
+        max: u'100'
+        min: u'0'
+        type: 'r'
+        >>> ranged = RangedValuesScoreSystem(
+        ...     u'Points', min=Decimal('-2.5'), max=Decimal('12.5'))
+        >>> printDict(view.getScoreSystemInfo(ranged))
+        max: u'12.5'
+        min: u'-2.5'
+        type: 'r'
+
+    Any score is fine for comments:
+
+        >>> printDict(view.getScoreSystemInfo(CommentScoreSystem))
+        type: 'c'
+
+    The info is given for every activity of the current worksheet, except
+    the linked columns that can't be graded:
+
+        >>> for name, info in sorted(view.score_systems.items()):
+        ...     print name, sorted(info.items())
+        comment [('type', 'c')]
+        passfail [('labels', [u'Pass', u'Fail']), ('type', 'd')]
+        percent [('max', u'100'), ('min', u'0'), ('type', 'r')]
+
+        >>> for name, info in sorted(view.scores.items()):
+        ...     print name, info
+        comment 'c'
+        passfail 'd', 'Pass', 'Fail'
+        percent 'r', '0', '100'
+
+    """
+
+
+class URLStub(object):
+
+    def __init__(self, context, request):
+        self.context = context
+
+    def __call__(self):
+        return 'http://127.0.0.1/%s' % self.context.__name__
+
+
+class WorksheetStub(object):
+    implements(IAttributeAnnotatable)
+
+    __name__ = 'sheet1'
+    deployed = False
+
+
+class StudentStub(object):
+
+    def __init__(self, username, title):
+        self.__name__ = self.username = username
+        self.title = title
+
+
+class NameColumnStub(object):
+
+    def __init__(self, name, title):
+        self.name = name
+        self.title = title
+
+
+class PersonFactoryStub(object):
+
+    def columns(self):
+        return [NameColumnStub('first_name', u'First Name'),
+                NameColumnStub('last_name', u'Last Name')]
+
+
+class PrincipalStub(object):
+
+    id = 'sb.person.teacher'
+    title = 'Teacher'
+
+
+class PopupGradebookStub(object):
+    """A gradebook of a worksheet with two activities and two students."""
+
+    __name__ = 'gradebook'
+
+    def __init__(self):
+        from schooltool.requirement.scoresystem import (
+            PercentScoreSystem, CommentScoreSystem)
+        self.context = WorksheetStub()
+        roster = RosterStub([StudentStub('paul', u'Paul Carduner'),
+                             StudentStub('tom', u'Tom Hoffman')])
+        self.snapshot = SnapshotStub(
+            [ActivityStub('hw1', PercentScoreSystem),
+             ActivityStub('comment', CommentScoreSystem)],
+            roster)
+        self.preferences = {}
+
+    def getColumnPreferences(self, person):
+        return self.preferences
+
+
+def setUpPopupMenus():
+    """Register what the popup menu views look up."""
+    from zope.annotation.attribute import AttributeAnnotations
+    from zope.component import provideAdapter, provideUtility
+    from zope.interface import Interface
+    from zope.publisher.interfaces.browser import IBrowserRequest
+    from zope.schema.interfaces import IVocabularyFactory
+    from zope.schema.vocabulary import SimpleVocabulary, SimpleTerm
+    from zope.security.management import newInteraction
+    from zope.traversing.browser.interfaces import IAbsoluteURL
+    from schooltool.app.interfaces import ISchoolToolApplication
+    from schooltool.person.interfaces import IPerson, IPersonFactory
+    from schooltool.requirement.scoresystem import (
+        PassFail, AmericanLetterScoreSystem)
+    from schooltool.term.interfaces import IDateManager
+    from schooltool.gradebook.tests.stubs import DateManagerStub
+    provideAdapter(AttributeAnnotations)
+    provideAdapter(URLStub, (Interface, IBrowserRequest), IAbsoluteURL)
+    provideAdapter(lambda principal: 'teacher', (None, ), IPerson)
+    app = object()
+    provideAdapter(lambda context: app, (None, ), ISchoolToolApplication)
+    provideUtility(PersonFactoryStub(), IPersonFactory)
+    provideUtility(DateManagerStub(), IDateManager)
+    vocabulary = SimpleVocabulary([
+        SimpleTerm(PassFail, 'PassFail'),
+        SimpleTerm(AmericanLetterScoreSystem, 'AmericanLetterScoreSystem')])
+    provideUtility(lambda context: vocabulary, IVocabularyFactory,
+                   'schooltool.requirement.discretescoresystems')
+    # Teachers can edit the gradebook
+    newInteraction()
+
+
+def doctest_FlourishGradebookPopupMenusView():
+    r"""Tests for FlourishGradebookPopupMenusView
+
+    The gradebook loads the popup menus of all the headers of a worksheet
+    in one request.
+
+        >>> from pprint import pprint
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     FlourishGradebookPopupMenusView,
+        ...     FlourishActivityPopupMenuView, FlourishStudentPopupMenuView,
+        ...     FlourishNamePopupMenuView, FlourishTotalPopupMenuView)
+
+        >>> setUpPopupMenus()
+        >>> gradebook = PopupGradebookStub()
+        >>> def getResult(view_class, **form):
+        ...     request = TestRequest(form=form)
+        ...     request.setPrincipal(PrincipalStub())
+        ...     return view_class(gradebook, request).result()
+
+        >>> menus = getResult(FlourishGradebookPopupMenusView)
+        >>> sorted(menus.keys())
+        ['activity', 'name', 'stamp', 'student', 'total']
+        >>> menus['stamp']
+        0
+
+    There is a menu for every activity, student, name column and total
+    column:
+
+        >>> sorted(menus['activity'].keys())
+        ['comment', 'hw1']
+        >>> sorted(menus['student'].keys())
+        ['paul', 'tom']
+        >>> sorted(menus['name'].keys())
+        ['first_name', 'last_name']
+        >>> sorted(menus['total'].keys())
+        ['absences', 'average', 'tardies', 'total']
+
+        >>> pprint(menus['activity']['hw1'])
+        {'header': 'HW1',
+         'options': [{'label': u'Edit', 'url': 'http://127.0.0.1/hw1'},
+                     {'label': u'Score this',
+                      'url': 'http://127.0.0.1/sheet1/gradebook/gradeActivity.html?activity=hw1'},
+                     {'css_class': 'filldown', 'label': u'Fill down', 'url': '#'},
+                     {'label': u'Sort by',
+                      'url': 'http://127.0.0.1/sheet1/gradebook?sort_by=hw1'},
+                     {'label': u'Delete',
+                      'url': 'http://127.0.0.1/sheet1/gradebook?delete=hw1'},
+                     {'label': u'Move right',
+                      'url': 'http://127.0.0.1/sheet1/gradebook?move_right=hw1'}]}
+        >>> pprint(menus['student']['tom'])
+        {'header': u'Tom Hoffman',
+         'options': [{'label': u'Student', 'url': 'http://127.0.0.1/tom'},
+                     {'label': u'Score', 'url': 'http://127.0.0.1/gradebook/tom'},
+                     {'label': u'Score History',
+                      'url': 'http://127.0.0.1/gradebook/tom/history.html'},
+                     {'label': u'Report',
+                      'url': 'http://127.0.0.1/gradebook/tom/view.html'}]}
+
+    The menus are the same as the ones of the popup menu views of single
+    headers:
+
+        >>> for activity_id in ['hw1', 'comment']:
+        ...     print activity_id, (menus['activity'][activity_id] ==
+        ...         getResult(FlourishActivityPopupMenuView,
+        ...                   activity_id=activity_id))
+        hw1 True
+        comment True
+        >>> for student_id in ['paul', 'tom']:
+        ...     print student_id, (menus['student'][student_id] ==
+        ...         getResult(FlourishStudentPopupMenuView,
+        ...                   student_id=student_id))
+        paul True
+        tom True
+        >>> for column_id in ['first_name', 'last_name']:
+        ...     print column_id, (menus['name'][column_id] ==
+        ...         getResult(FlourishNamePopupMenuView, column_id=column_id))
+        first_name True
+        last_name True
+        >>> for column_id in ['absences', 'average', 'tardies', 'total']:
+        ...     print column_id, (menus['total'][column_id] ==
+        ...         getResult(FlourishTotalPopupMenuView, column_id=column_id))
+        absences True
+        average True
+        tardies True
+        total True
+
+    The single header views have no menus for unknown headers:
+
+        >>> getResult(FlourishActivityPopupMenuView, activity_id='unknown')
+        {}
+        >>> getResult(FlourishStudentPopupMenuView, student_id='unknown')
+        {}
+        >>> getResult(FlourishNamePopupMenuView, column_id='unknown')
+        {}
+        >>> getResult(FlourishTotalPopupMenuView)
+        {}
+
+    """
+
+
+def doctest_FlourishGradebookPopupMenusView_conditional_get():
+    r"""Conditional requests of FlourishGradebookPopupMenusView
+
+        >>> import json
+        >>> from BTrees.Length import Length
+        >>> from zope.annotation.interfaces import IAnnotations
+        >>> from schooltool.gradebook.stamp import WORKSHEET_CHANGE_STAMP_KEY
+        >>> from schooltool.gradebook.browser.gradebook import (
+        ...     FlourishGradebookPopupMenusView, FlourishTotalPopupMenuView)
+
+        >>> setUpPopupMenus()
+        >>> gradebook = PopupGradebookStub()
+        >>> def callView(view_class, etag=None, **form):
+        ...     if etag is None:
+        ...         request = TestRequest(form=form)
+        ...     else:
+        ...         request = TestRequest(form=form, HTTP_IF_NONE_MATCH=etag)
+        ...     request.setPrincipal(PrincipalStub())
+        ...     result = view_class(gradebook, request)()
+        ...     response = request.response
+        ...     return result, response.getStatus(), response.getHeader('ETag')
+
+    The menus are sent with an ETag:
+
+        >>> result, status, etag = callView(FlourishGradebookPopupMenusView)
+        >>> etag
+        '"..."'
+        >>> sorted(json.loads(result)['activity'].keys())
+        [u'comment', u'hw1']
+
+    They are not sent again while the worksheet stays the same:
+
+        >>> callView(FlourishGradebookPopupMenusView, etag)
+        ('', 304, '"..."')
+        >>> callView(FlourishGradebookPopupMenusView, etag)[2] == etag
+        True
+
+    Changing the column preferences changes the ETag:
+
+        >>> gradebook.preferences = {'average': {'scoresystem': 'PassFail'}}
+        >>> result, status, new_etag = callView(
+        ...     FlourishGradebookPopupMenusView, etag)
+        >>> status == 304, new_etag == etag
+        (False, False)
+        >>> callView(FlourishGradebookPopupMenusView, new_etag)[:2]
+        ('', 304)
+
+    When the change stamp of the worksheet is bumped, the menus are sent
+    again with a new stamp:
+
+        >>> annotations = IAnnotations(gradebook.context)
+        >>> annotations[WORKSHEET_CHANGE_STAMP_KEY] = Length(1)
+        >>> result, status, etag = callView(
+        ...     FlourishGradebookPopupMenusView, new_etag)
+        >>> status == 304, etag == new_etag
+        (False, False)
+        >>> json.loads(result)['stamp']
+        1
+
+    The popup menu views of single headers answer conditional requests of
+    the same header:
+
+        >>> result, status, etag = callView(
+        ...     FlourishTotalPopupMenuView, column_id='average')
+        >>> json.loads(result)['header']
+        u'Ave.'
+        >>> callView(FlourishTotalPopupMenuView, etag, column_id='average')
+        ('', 304, '"..."')
+        >>> result, status, total_etag = callView(
+        ...     FlourishTotalPopupMenuView, etag, column_id='total')
+        >>> json.loads(result)['header'], total_etag == etag
+        (u'Total', False)
+
+    """
+
+
+def setUp(test):
+    setup.placelessSetUp()
+
+
+def tearDown(test):
+    endInteraction()
+    setup.placelessTearDown()
+
+
+def test_suite():
+    return unittest.TestSuite((
+        doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                             optionflags=doctest.ELLIPSIS|
+                                         doctest.NORMALIZE_WHITESPACE|
+                                         doctest.REPORT_ONLY_FIRST_FAILURE),
+        ))
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -29,6 +29,7 @@ from schooltool.task.progress import normalized_progress
 
 from schooltool.gradebook.interfaces import IGradebookRoot, IActivities
 from schooltool.gradebook.interfaces import ISectionJournalData
+from schooltool.gradebook.snapshot import getSectionRoster
 from schooltool.requirement.interfaces import IEvaluations
 
 from schooltool.gradebook import GradebookMessage as _
@@ -80,7 +81,8 @@ class FlourishReportSheetsExportTermView(export.ExcelExportView):
         for ns, section in enumerate(sections):
             jd = ISectionJournalData(section, None)
             activities = IActivities(section)
-            students = sorted(section.members, key=lambda s: s.username)
+            students = sorted(getSectionRoster(section).students,
+                              key=lambda s: s.username)
 
             if not students:
                 self.write(ws, row, 0, section.__name__)
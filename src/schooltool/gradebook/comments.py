@@ -0,0 +1,137 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Comment renderings
+
+Comments are HTML.  The gradebook shows the first few characters of their
+text and report cards show them as RML, so these are computed when a
+comment is saved and stored with its score in the grade matrix, instead
+of parsing the HTML every time the comment is shown.
+"""
+__docformat__ = 'reStructuredText'
+
+from lxml import etree
+from lxml import html
+from zope.component import adapter, queryMultiAdapter
+from zope.interface import implements, implementer
+from zope.security import proxy
+
+from schooltool.requirement.interfaces import ICommentScoreSystem
+from schooltool.requirement.interfaces import IEvaluation
+
+from schooltool.gradebook import interfaces
+from schooltool.gradebook.matrix import queryIntId
+from schooltool.gradebook.snapshot import queryRequest
+
+# Paragraph style of comments in report cards
+COMMENT_PARA_CLASS = 'report_card_comment'
+
+
+def getCommentShorthand(comment):
+    """Get the first few characters of the text of a comment."""
+    result = ''
+    inside_markup = False
+    for char in comment:
+        if inside_markup:
+            if char == '>':
+                inside_markup = False
+        else:
+            if char == '<':
+                inside_markup = True
+            else:
+                result += char
+    try:
+        text = html.fromstring(result).text
+    except (etree.ParserError,):
+        return u''
+    return (text or u'').lstrip()[:4]
+
+
+def getCommentText(comment):
+    """Get the text of a comment without markup and extra whitespace."""
+    try:
+        text = html.fromstring(comment).text_content()
+    except (etree.ParserError,):
+        return u''
+    return u' '.join(text.split())
+
+
+def renderCommentRML(comment, request):
+    """Render the comment as report card RML paragraphs."""
+    html2rml = queryMultiAdapter((unicode(comment), request),
+                                 name='html2rml')
+    if html2rml is None:
+        return None
+    html2rml.para_class = COMMENT_PARA_CLASS
+    return unicode(html2rml())
+
+
+class CommentRendering(object):
+    """Stored representations of a comment."""
+    implements(interfaces.ICommentRendering)
+
+    __slots__ = ('shorthand', 'text', 'rml')
+
+    def __init__(self, shorthand, text, rml=None):
+        self.shorthand = shorthand
+        self.text = text
+        self.rml = rml
+
+    def __reduce__(self):
+        return (CommentRendering, (self.shorthand, self.text, self.rml))
+
+    def __cmp__(self, other):
+        if not isinstance(other, CommentRendering):
+            return cmp(id(self), id(other))
+        return cmp(self.__reduce__()[1], other.__reduce__()[1])
+
+
+def renderComment(comment, request=None):
+    """Compute the renderings of a comment.
+
+    RML needs a request, it is left out if there is no request.
+    """
+    if request is None:
+        request = queryRequest()
+    rml = None
+    if request is not None:
+        rml = renderCommentRML(comment, request)
+    return CommentRendering(getCommentShorthand(comment),
+                            getCommentText(comment), rml)
+
+
+@adapter(IEvaluation)
+@implementer(interfaces.ICommentRendering)
+def getEvaluationCommentRendering(evaluation):
+    if (not evaluation or
+        not ICommentScoreSystem.providedBy(evaluation.scoreSystem)):
+        return None
+    return renderComment(evaluation.value)
+
+
+def queryCommentRendering(student, activity):
+    """Get the stored rendering of the comment of a student.
+
+    Return None if the comment has no stored rendering.
+    """
+    activity = proxy.removeSecurityProxy(activity)
+    matrix = interfaces.IGradeMatrix(activity.__parent__, None)
+    if matrix is None:
+        return None
+    cell = matrix.get(queryIntId(student), queryIntId(activity))
+    return getattr(cell, 'comment', None)
@@ -22,6 +22,6 @@ Generations for database version upgrades.
 from zope.app.generations.generations import SchemaManager
 
 schemaManager = SchemaManager(
-    minimum_generation=5,
-    generation=5,
+    minimum_generation=9,
+    generation=9,
     package_name='schooltool.gradebook.generations')
@@ -0,0 +1,51 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evolve database to generation 7.
+
+Build the linked column graphs of school years from the linked columns of
+the section worksheets.
+"""
+from zope.app.generations.utility import findObjectsProviding
+from zope.app.publication.zopepublication import ZopePublication
+from zope.component.hooks import getSite, setSite
+
+from schooltool.app.interfaces import ISchoolToolApplication
+
+from schooltool.gradebook.interfaces import IActivities
+from schooltool.gradebook.interfaces import IActivityWorksheet
+from schooltool.gradebook.linkgraph import updateLinkedColumnGraph
+
+
+def buildLinkedColumnGraphs(app):
+    for sections in app['schooltool.course.section'].values():
+        for section in sections.values():
+            for worksheet in IActivities(section).values():
+                if IActivityWorksheet.providedBy(worksheet):
+                    updateLinkedColumnGraph(worksheet)
+
+
+def evolve(context):
+    root = context.connection.root().get(ZopePublication.root_name, None)
+
+    old_site = getSite()
+    apps = findObjectsProviding(root, ISchoolToolApplication)
+    for app in apps:
+        setSite(app)
+        buildLinkedColumnGraphs(app)
+    setSite(old_site)
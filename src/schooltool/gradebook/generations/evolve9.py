@@ -0,0 +1,64 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evolve database to generation 9.
+
+Store the renderings of comments with their scores in the grade matrices.
+"""
+from zope.app.generations.utility import findObjectsProviding
+from zope.app.publication.zopepublication import ZopePublication
+from zope.component.hooks import getSite, setSite
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.requirement.interfaces import ICommentScoreSystem
+
+from schooltool.gradebook.comments import renderComment
+from schooltool.gradebook.interfaces import IActivities, IGradeMatrix
+from schooltool.gradebook.matrix import GradeCell
+
+
+def renderMatrixComments(matrix):
+    for student_id, row in list(matrix.rows()):
+        for activity_id, cell in list(row.items()):
+            if not ICommentScoreSystem.providedBy(cell.scoreSystem):
+                continue
+            if cell.comment is not None:
+                continue
+            matrix.set(student_id, activity_id, GradeCell(
+                cell.scoreSystem, cell.value, cell.time, cell.evaluator,
+                renderComment(cell.value)))
+
+
+def renderComments(app):
+    for sections in app['schooltool.course.section'].values():
+        for section in sections.values():
+            for worksheet in IActivities(section).values():
+                matrix = IGradeMatrix(worksheet, None)
+                if matrix is not None:
+                    renderMatrixComments(matrix)
+
+
+def evolve(context):
+    root = context.connection.root().get(ZopePublication.root_name, None)
+
+    old_site = getSite()
+    apps = findObjectsProviding(root, ISchoolToolApplication)
+    for app in apps:
+        setSite(app)
+        renderComments(app)
+    setSite(old_site)
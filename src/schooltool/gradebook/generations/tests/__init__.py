@@ -9,6 +9,8 @@ from zope.app.publication.zopepublication import ZopePublication
 from zope.app.testing.setup import setUpAnnotations
 from zope.component import provideAdapter, provideUtility
 from zope.interface import implements
+from zope.intid import IntIds
+from zope.intid.interfaces import IIntIds
 
 from schooltool.app.app import SchoolToolApplication
 from schooltool.app.interfaces import ISchoolToolApplication
@@ -82,3 +84,4 @@ def provideAdapters():
 
 def provideUtilities():
     provideUtility(stubs.DateManagerStub(), IDateManager, '')
+    provideUtility(IntIds(), IIntIds)
@@ -0,0 +1,150 @@
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests for schooltool.gradebook.generations.evolve6
+"""
+
+import unittest, doctest
+
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.component import provideAdapter, provideUtility
+from zope.interface import alsoProvides
+from zope.intid import IntIds
+from zope.intid.interfaces import IIntIds
+from zope.site import LocalSiteManager
+
+from schooltool.course.section import Section
+from schooltool.person.person import PersonContainer, Person
+from schooltool.requirement.evaluation import Evaluation
+from schooltool.requirement.interfaces import IEvaluations
+from schooltool.requirement.interfaces import IHaveEvaluations
+from schooltool.requirement.scoresystem import HundredPointsScoreSystem
+from schooltool.requirement.scoresystem import UNSCORED
+
+from schooltool.gradebook.activity import Worksheet, Activity
+from schooltool.gradebook.generations.tests import ContextStub
+from schooltool.gradebook.generations.tests import provideAdapters
+from schooltool.gradebook.generations.tests import provideUtilities
+from schooltool.gradebook.generations.evolve6 import evolve
+from schooltool.gradebook.interfaces import IActivities, IGradeMatrix
+from schooltool.gradebook.matrix import getGradeMatrix
+
+
+def doctest_evolve6():
+    r"""Evolution to generation 6.
+
+    First, we'll set up the app object:
+
+        >>> provideAdapters()
+        >>> provideUtilities()
+        >>> provideAdapter(getGradeMatrix)
+        >>> intids = IntIds()
+        >>> provideUtility(intids, IIntIds)
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+
+    Set up a section with a worksheet of two activities.
+
+        >>> section = Section('Section')
+        >>> worksheet = IActivities(section)['1'] = Worksheet('Sheet1')
+        >>> worksheet['1'] = homework = Activity(
+        ...     'Homework', None, HundredPointsScoreSystem)
+        >>> worksheet['2'] = quiz = Activity(
+        ...     'Quiz', None, HundredPointsScoreSystem)
+
+    And a couple of students graded in them.
+
+        >>> app['persons'] = PersonContainer()
+        >>> app['persons']['john'] = john = Person('john')
+        >>> app['persons']['pete'] = pete = Person('pete')
+        >>> app['persons']['mary'] = Person('mary')
+        >>> for ob in (john, pete, homework, quiz):
+        ...     ignore = intids.register(ob)
+
+        >>> def grade(student, activity, value):
+        ...     alsoProvides(student, IHaveEvaluations)
+        ...     IEvaluations(student).addEvaluation(Evaluation(
+        ...         activity, HundredPointsScoreSystem, value, 'teacher'))
+
+        >>> grade(john, homework, 90)
+        >>> grade(john, quiz, 75)
+        >>> grade(pete, homework, 60)
+        >>> grade(pete, quiz, UNSCORED)
+
+    The grade matrix of the worksheet is empty before the evolution.
+
+        >>> matrix = IGradeMatrix(worksheet)
+        >>> list(matrix.rows())
+        []
+
+        >>> evolve(context)
+
+    Scores are now available from the matrix.  Unscored evaluations are
+    not stored.
+
+        >>> def row(student):
+        ...     result = matrix.getRow(intids.getId(student))
+        ...     return sorted([(intids.getObject(activity_id).title, cell.value)
+        ...                    for activity_id, cell in result.items()])
+
+        >>> row(john)
+        [('Homework', 90), ('Quiz', 75)]
+        >>> row(pete)
+        [('Homework', 60)]
+
+        >>> cell = matrix.get(intids.getId(john), intids.getId(quiz))
+        >>> cell.scoreSystem
+        <GlobalRangedValuesScoreSystem u'100 Points'>
+        >>> cell.evaluator
+        'teacher'
+
+    The matrix also knows which students are scored for each activity.
+
+        >>> def column(activity):
+        ...     result = matrix.getColumn(intids.getId(activity))
+        ...     return sorted([intids.getObject(student_id).username
+        ...                    for student_id in result])
+
+        >>> column(homework)
+        ['john', 'pete']
+        >>> column(quiz)
+        ['john']
+
+    """
+
+
+def setUp(test):
+    setup.placelessSetUp()
+    setup.setUpTraversal()
+
+def tearDown(test):
+    setup.placelessTearDown()
+
+
+def test_suite():
+    return unittest.TestSuite([
+        doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                             optionflags=doctest.ELLIPSIS
+                                         | doctest.NORMALIZE_WHITESPACE
+                                         | doctest.REPORT_NDIFF
+                                         | doctest.REPORT_ONLY_FIRST_FAILURE),
+        ])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
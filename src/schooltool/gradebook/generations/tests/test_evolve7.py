@@ -0,0 +1,224 @@
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests for schooltool.gradebook.generations.evolve7
+"""
+
+import unittest, doctest
+
+from zope.annotation.interfaces import IAttributeAnnotatable
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.component import provideAdapter, getUtility
+from zope.container.btree import BTreeContainer
+from zope.interface import implements
+from zope.intid.interfaces import IIntIds
+from zope.site import LocalSiteManager
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.course.interfaces import ISection
+from schooltool.course.section import Section
+from schooltool.requirement.scoresystem import HundredPointsScoreSystem
+from schooltool.schoolyear.interfaces import ISchoolYear
+
+from schooltool.gradebook.activity import Worksheet, Activity
+from schooltool.gradebook.activity import LinkedColumnActivity
+from schooltool.gradebook.activity import createSourceString
+from schooltool.gradebook.generations.tests import ContextStub
+from schooltool.gradebook.generations.tests import provideAdapters
+from schooltool.gradebook.generations.tests import provideUtilities
+from schooltool.gradebook.generations.evolve7 import evolve
+from schooltool.gradebook.gradebook import getWorksheetSection
+from schooltool.gradebook.interfaces import IActivities, IActivityWorksheet
+from schooltool.gradebook.interfaces import ILinkedColumnGraph
+from schooltool.gradebook.linkgraph import getLinkedColumnGraph
+from schooltool.gradebook.linkgraph import updateLinkedColumnGraph
+
+
+class SchoolYearStub(object):
+    implements(ISchoolYear, IAttributeAnnotatable)
+
+    def __init__(self, title):
+        self.title = title
+
+
+def getSectionSchoolYear(section):
+    return section.schoolyear
+
+
+def doctest_evolve7():
+    r"""Evolution to generation 7.
+
+    First, we'll set up the app object:
+
+        >>> provideAdapters()
+        >>> provideUtilities()
+        >>> provideAdapter(getLinkedColumnGraph)
+        >>> provideAdapter(getWorksheetSection, adapts=(IActivityWorksheet,),
+        ...                provides=ISection)
+        >>> provideAdapter(getSectionSchoolYear, adapts=(ISection,),
+        ...                provides=ISchoolYear)
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+        >>> provideAdapter(lambda ignored: app, adapts=(None,),
+        ...                provides=ISchoolToolApplication)
+        >>> intids = getUtility(IIntIds)
+
+    Set up a section with three worksheets this year, and one with a
+    worksheet last year.
+
+        >>> year = SchoolYearStub('2014')
+        >>> last_year = SchoolYearStub('2013')
+        >>> app['schooltool.course.section'] = BTreeContainer()
+        >>> def addSection(term, name, schoolyear):
+        ...     if term not in app['schooltool.course.section']:
+        ...         app['schooltool.course.section'][term] = BTreeContainer()
+        ...     sections = app['schooltool.course.section'][term]
+        ...     section = sections[name] = Section(name)
+        ...     section.schoolyear = schoolyear
+        ...     return section
+
+        >>> def addWorksheet(section, name):
+        ...     worksheet = IActivities(section)[name] = Worksheet(name)
+        ...     worksheet['homework'] = Activity(
+        ...         'Homework', None, HundredPointsScoreSystem)
+        ...     return worksheet
+
+        >>> section = addSection('2014-fall', 'math', year)
+        >>> sheet1 = addWorksheet(section, 'Sheet1')
+        >>> sheet2 = addWorksheet(section, 'Sheet2')
+        >>> sheet3 = addWorksheet(section, 'Sheet3')
+        >>> old_section = addSection('2013-fall', 'math', last_year)
+        >>> old_sheet = addWorksheet(old_section, 'Old')
+
+    The first worksheet links to the average of the second one and to an
+    activity of the third one.  The second worksheet links to the average
+    of the third one, which links to the average of last year's worksheet.
+
+        >>> def link(worksheet, name, source):
+        ...     worksheet[name] = LinkedColumnActivity(
+        ...         name, u'assignment', None, createSourceString(source))
+
+        >>> link(sheet1, 'average2', sheet2)
+        >>> link(sheet1, 'homework3', sheet3['homework'])
+        >>> link(sheet2, 'average3', sheet3)
+        >>> link(sheet3, 'old', old_sheet)
+
+    The graph of the school year is empty before the evolution.
+
+        >>> graph = ILinkedColumnGraph(year)
+        >>> graph.getLinks(intids.register(sheet1))
+        ()
+
+        >>> evolve(context)
+
+    Now the graph knows the links of the worksheets.
+
+        >>> def title(worksheet_id):
+        ...     return intids.getObject(worksheet_id).title
+
+        >>> def links(worksheet):
+        ...     return sorted([(title(source_id), average, external)
+        ...                    for source_id, average, external
+        ...                    in graph.getLinks(intids.getId(worksheet))])
+
+        >>> links(sheet1)
+        [('Sheet2', True, False), ('Sheet3', False, False)]
+        >>> links(sheet2)
+        [('Sheet3', True, False)]
+        >>> links(sheet3)
+        [('Old', True, True)]
+
+    Last year's worksheet has no links, so it's not in any graph.
+
+        >>> ILinkedColumnGraph(last_year).getLinks(intids.getId(old_sheet))
+        ()
+
+    All worksheets can be averaged.  Last year's worksheet is not part of
+    the graph, it is returned among the external sources.
+
+        >>> def canAverage(worksheet, containing=None):
+        ...     containing_id = None
+        ...     if containing is not None:
+        ...         containing_id = intids.getId(containing)
+        ...     return graph.canAverage(intids.getId(worksheet), containing_id)
+
+        >>> canAverage(sheet1), canAverage(sheet2), canAverage(sheet3)
+        (True, True, True)
+        >>> [title(source_id) for source_id in
+        ...  graph.getExternalSources(intids.getId(sheet1))]
+        ['Old']
+
+    A worksheet that the second worksheet depends on could not link to its
+    average.
+
+        >>> canAverage(sheet2, sheet1), canAverage(sheet3, sheet1)
+        (True, True)
+        >>> canAverage(sheet1, sheet2), canAverage(sheet1, sheet3)
+        (False, False)
+
+    The worksheets that depend on a worksheet are listed in the order their
+    averages can be recomputed in.
+
+        >>> def dependents(worksheet):
+        ...     return [title(worksheet_id) for worksheet_id in
+        ...             graph.getDependents(intids.getId(worksheet))]
+
+        >>> dependents(sheet3)
+        ['Sheet2', 'Sheet1']
+        >>> dependents(sheet2)
+        ['Sheet1']
+        >>> dependents(sheet1)
+        []
+
+    If the third worksheet links to the average of the first one, none of
+    them can be averaged anymore.
+
+        >>> link(sheet3, 'average1', sheet1)
+        >>> updateLinkedColumnGraph(sheet3)
+        >>> canAverage(sheet1), canAverage(sheet2), canAverage(sheet3)
+        (False, False, False)
+
+    Removed linked columns are left out.
+
+        >>> updateLinkedColumnGraph(sheet3, exclude=sheet3['average1'])
+        >>> canAverage(sheet1), canAverage(sheet2), canAverage(sheet3)
+        (True, True, True)
+
+    """
+
+
+def setUp(test):
+    setup.placelessSetUp()
+    setup.setUpTraversal()
+
+def tearDown(test):
+    setup.placelessTearDown()
+
+
+def test_suite():
+    return unittest.TestSuite([
+        doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                             optionflags=doctest.ELLIPSIS
+                                         | doctest.NORMALIZE_WHITESPACE
+                                         | doctest.REPORT_NDIFF
+                                         | doctest.REPORT_ONLY_FIRST_FAILURE),
+        ])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
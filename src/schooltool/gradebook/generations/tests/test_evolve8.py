@@ -0,0 +1,147 @@
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests for schooltool.gradebook.generations.evolve8
+"""
+
+import unittest, doctest
+
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.component import provideAdapter, getUtility
+from zope.container.btree import BTreeContainer
+from zope.intid.interfaces import IIntIds
+from zope.keyreference.interfaces import IKeyReference
+from zope.site import LocalSiteManager
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.course.section import Section
+from schooltool.requirement.scoresystem import HundredPointsScoreSystem
+
+from schooltool.gradebook.activity import Worksheet, Activity
+from schooltool.gradebook.activity import LinkedColumnActivity
+from schooltool.gradebook.activity import getSourceObj
+from schooltool.gradebook.activity import getLinkedColumnSourceIndex
+from schooltool.gradebook.generations.tests import ContextStub
+from schooltool.gradebook.generations.tests import provideAdapters
+from schooltool.gradebook.generations.tests import provideUtilities
+from schooltool.gradebook.generations.evolve8 import evolve
+from schooltool.gradebook.interfaces import IActivities
+
+
+def doctest_evolve8():
+    r"""Evolution to generation 8.
+
+    First, we'll set up the app object:
+
+        >>> provideAdapters()
+        >>> provideUtilities()
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+        >>> provideAdapter(lambda ignored: app, adapts=(None,),
+        ...                provides=ISchoolToolApplication)
+        >>> intids = getUtility(IIntIds)
+
+    Set up a section with two worksheets.
+
+        >>> app['schooltool.course.section'] = BTreeContainer()
+        >>> sections = app['schooltool.course.section']['2014-fall'] = (
+        ...     BTreeContainer())
+        >>> section = sections['math_1'] = Section('Math')
+        >>> sheet1 = IActivities(section)['Sheet1'] = Worksheet('Sheet1')
+        >>> sheet2 = IActivities(section)['Sheet2'] = Worksheet('Sheet2')
+        >>> homework = sheet2['homework'] = Activity(
+        ...     'Homework', None, HundredPointsScoreSystem)
+
+    Linked columns of the first worksheet have legacy sources, made of the
+    names of the section and hashes of the key references of the worksheet
+    and the activity.
+
+        >>> def legacySource(worksheet, activity=None):
+        ...     act_hash = 'ave'
+        ...     if activity is not None:
+        ...         act_hash = unicode(hash(IKeyReference(activity)))
+        ...     return u'2014-fall_math_1_%s_%s' % (
+        ...         hash(IKeyReference(worksheet)), act_hash)
+
+        >>> average_source = legacySource(sheet2)
+        >>> homework_source = legacySource(sheet2, homework)
+        >>> sheet1['average'] = LinkedColumnActivity(
+        ...     'Average', u'assignment', None, average_source)
+        >>> sheet1['homework'] = LinkedColumnActivity(
+        ...     'Homework', u'assignment', None, homework_source)
+        >>> sheet1['missing'] = LinkedColumnActivity(
+        ...     'Missing', u'assignment', None, u'2014-fall_math_1_1_2')
+
+        >>> getSourceObj(average_source) is sheet2
+        True
+        >>> getSourceObj(homework_source) is homework
+        True
+
+        >>> evolve(context)
+
+    The sources now refer to the int ids of the worksheet and the activity.
+
+        >>> sheet1['average'].source == u'intid_%s_ave' % intids.getId(sheet2)
+        True
+        >>> sheet1['homework'].source == u'intid_%s_%s' % (
+        ...     intids.getId(sheet2), intids.getId(homework))
+        True
+        >>> getSourceObj(sheet1['average'].source) is sheet2
+        True
+        >>> getSourceObj(sheet1['homework'].source) is homework
+        True
+
+    Sources that can't be found are left alone.
+
+        >>> sheet1['missing'].source
+        u'2014-fall_math_1_1_2'
+        >>> print getSourceObj(sheet1['missing'].source)
+        None
+
+    The legacy sources are indexed, so they are still found without looking
+    at every worksheet and activity of the section.
+
+        >>> index = getLinkedColumnSourceIndex(app)
+        >>> sorted(index.keys()) == sorted([average_source, homework_source])
+        True
+        >>> index[homework_source] == sheet1['homework'].source
+        True
+
+    """
+
+
+def setUp(test):
+    setup.placelessSetUp()
+    setup.setUpTraversal()
+
+def tearDown(test):
+    setup.placelessTearDown()
+
+
+def test_suite():
+    return unittest.TestSuite([
+        doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                             optionflags=doctest.ELLIPSIS
+                                         | doctest.NORMALIZE_WHITESPACE
+                                         | doctest.REPORT_NDIFF
+                                         | doctest.REPORT_ONLY_FIRST_FAILURE),
+        ])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
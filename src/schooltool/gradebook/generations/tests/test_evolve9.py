@@ -0,0 +1,120 @@
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests for schooltool.gradebook.generations.evolve9
+"""
+
+import unittest, doctest
+
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.component import provideAdapter
+from zope.container.btree import BTreeContainer
+from zope.site import LocalSiteManager
+
+from schooltool.course.section import Section
+from schooltool.requirement.scoresystem import CommentScoreSystem
+from schooltool.requirement.scoresystem import HundredPointsScoreSystem
+
+from schooltool.gradebook.activity import Worksheet, Activity
+from schooltool.gradebook.generations.tests import ContextStub
+from schooltool.gradebook.generations.tests import provideAdapters
+from schooltool.gradebook.generations.tests import provideUtilities
+from schooltool.gradebook.generations.evolve9 import evolve
+from schooltool.gradebook.interfaces import IActivities, IGradeMatrix
+from schooltool.gradebook.matrix import getGradeMatrix, GradeCell
+
+
+def doctest_evolve9():
+    r"""Evolution to generation 9.
+
+    First, we'll set up the app object:
+
+        >>> provideAdapters()
+        >>> provideUtilities()
+        >>> provideAdapter(getGradeMatrix)
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+
+    Set up a section with a worksheet of a comment and a graded activity.
+
+        >>> app['schooltool.course.section'] = BTreeContainer()
+        >>> sections = app['schooltool.course.section']['2014-fall'] = (
+        ...     BTreeContainer())
+        >>> section = sections['math_1'] = Section('Math')
+        >>> worksheet = IActivities(section)['Sheet1'] = Worksheet('Sheet1')
+        >>> worksheet['comment'] = Activity(
+        ...     'Comment', None, CommentScoreSystem)
+        >>> worksheet['homework'] = Activity(
+        ...     'Homework', None, HundredPointsScoreSystem)
+
+    Cells of the grade matrix were stored without comment renderings.
+
+        >>> matrix = IGradeMatrix(worksheet)
+        >>> matrix.set(1, 10, GradeCell(
+        ...     CommentScoreSystem, u'<p>Very  good\nwork.</p>',
+        ...     evaluator='teacher'))
+        >>> matrix.set(1, 20, GradeCell(HundredPointsScoreSystem, 90))
+        >>> print matrix.get(1, 10).comment
+        None
+
+        >>> evolve(context)
+
+    Comment cells now have their shorthand and text.  RML needs a request,
+    report cards render it from the comment until the comment is saved
+    again.
+
+        >>> cell = matrix.get(1, 10)
+        >>> cell.value, cell.evaluator
+        (u'<p>Very  good\nwork.</p>', 'teacher')
+        >>> print cell.comment.shorthand
+        Very
+        >>> print cell.comment.text
+        Very good work.
+        >>> print cell.comment.rml
+        None
+
+    Other cells are left alone.
+
+        >>> print matrix.get(1, 20).comment
+        None
+        >>> matrix.get(1, 20).value
+        90
+
+    """
+
+
+def setUp(test):
+    setup.placelessSetUp()
+    setup.setUpTraversal()
+
+def tearDown(test):
+    setup.placelessTearDown()
+
+
+def test_suite():
+    return unittest.TestSuite([
+        doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                             optionflags=doctest.ELLIPSIS
+                                         | doctest.NORMALIZE_WHITESPACE
+                                         | doctest.REPORT_NDIFF
+                                         | doctest.REPORT_ONLY_FIRST_FAILURE),
+        ])
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -20,6 +20,7 @@ Gradebook Implementation
 """
 __docformat__ = 'reStructuredText'
 
+from collections import OrderedDict
 from decimal import Decimal
 
 from persistent.dict import PersistentDict
@@ -45,7 +46,18 @@ from schooltool.securitypolicy.crowds import AdministratorsCrowd
 
 from schooltool.gradebook import interfaces
 from schooltool.gradebook.activity import getSourceObj
-from schooltool.gradebook.activity import ensureAtLeastOneWorksheet
+from schooltool.gradebook.linkgraph import queryLinkedColumnGraph
+from schooltool.gradebook.matrix import queryIntId
+from schooltool.gradebook.preferences import GRADEBOOK_SORTING_KEY
+from schooltool.gradebook.preferences import CURRENT_SECTION_TAUGHT_KEY
+from schooltool.gradebook.preferences import CURRENT_SECTION_ATTENDED_KEY
+from schooltool.gradebook.preferences import DUE_DATE_FILTER_KEY
+from schooltool.gradebook.preferences import CURRENT_ENROLLMENT_MODE_KEY
+from schooltool.gradebook.preferences import getGradebookPreferences
+from schooltool.gradebook.snapshot import COLUMN_PREFERENCES_KEY
+from schooltool.gradebook.snapshot import getGradebookSnapshot
+from schooltool.gradebook.snapshot import invalidateGradebookSnapshots
+from schooltool.gradebook.stamp import bumpSectionChangeStamps
 from schooltool.contact.contact import ParentOfCrowd
 from schooltool.requirement.evaluation import Score
 from schooltool.requirement.scoresystem import UNSCORED, ScoreValidationError
@@ -53,13 +65,6 @@ from schooltool.requirement.interfaces import IDiscreteValuesScoreSystem
 from schooltool.requirement.interfaces import IRangedValuesScoreSystem
 from schooltool.requirement.scoresystem import RangedValuesScoreSystem
 
-GRADEBOOK_SORTING_KEY = 'schooltool.gradebook.sorting'
-CURRENT_SECTION_TAUGHT_KEY = 'schooltool.gradebook.currentsectiontaught'
-CURRENT_SECTION_ATTENDED_KEY = 'schooltool.gradebook.currentsectionattended'
-DUE_DATE_FILTER_KEY = 'schooltool.gradebook.duedatefilter'
-COLUMN_PREFERENCES_KEY = 'schooltool.gradebook.columnpreferences'
-CURRENT_ENROLLMENT_MODE_KEY = 'schooltool.gradebook.currentenrollmentmode'
-
 
 def getInstructorSections(person):
     return list(course.interfaces.IInstructor(person).sections())
@@ -71,60 +76,52 @@ def getLearnerSections(person):
 
 def getCurrentSectionTaught(person):
     person = proxy.removeSecurityProxy(person)
-    ann = annotation.interfaces.IAnnotations(person)
-    if CURRENT_SECTION_TAUGHT_KEY not in ann:
-        ann[CURRENT_SECTION_TAUGHT_KEY] = None
-    else:
-        section = ann[CURRENT_SECTION_TAUGHT_KEY]
-        if section not in getInstructorSections(person):
-            return None
-        try:
-            interfaces.IActivities(section)
-        except:
-            ann[CURRENT_SECTION_TAUGHT_KEY] = None
-    return ann[CURRENT_SECTION_TAUGHT_KEY]
+    prefs = getGradebookPreferences(person)
+    section = prefs.getCurrentSectionTaught()
+    if section is None or section not in getInstructorSections(person):
+        return None
+    try:
+        interfaces.IActivities(section)
+    except:
+        return None
+    return section
 
 
 def setCurrentSectionTaught(person, section):
     person = proxy.removeSecurityProxy(person)
-    ann = annotation.interfaces.IAnnotations(person)
     if section in getInstructorSections(person):
-        ann[CURRENT_SECTION_TAUGHT_KEY] = section
+        prefs = getGradebookPreferences(person)
+        prefs.setCurrentSectionTaught(section)
 
 
 def getCurrentSectionAttended(person):
     person = proxy.removeSecurityProxy(person)
-    ann = annotation.interfaces.IAnnotations(person)
-    if CURRENT_SECTION_ATTENDED_KEY not in ann:
-        ann[CURRENT_SECTION_ATTENDED_KEY] = None
-    else:
-        section = ann[CURRENT_SECTION_ATTENDED_KEY]
-        if section not in getLearnerSections(person):
-            return None
-        try:
-            interfaces.IActivities(section)
-        except:
-            ann[CURRENT_SECTION_ATTENDED_KEY] = None
-    return ann[CURRENT_SECTION_ATTENDED_KEY]
+    prefs = getGradebookPreferences(person)
+    section = prefs.getCurrentSectionAttended()
+    if section is None or section not in getLearnerSections(person):
+        return None
+    try:
+        interfaces.IActivities(section)
+    except:
+        return None
+    return section
 
 
 def setCurrentSectionAttended(person, section):
     person = proxy.removeSecurityProxy(person)
-    ann = annotation.interfaces.IAnnotations(person)
     if section in getLearnerSections(person):
-        ann[CURRENT_SECTION_ATTENDED_KEY] = section
+        prefs = getGradebookPreferences(person)
+        prefs.setCurrentSectionAttended(section)
 
 
 def getCurrentEnrollmentMode(person):
-    ann = annotation.interfaces.IAnnotations(removeSecurityProxy(person))
-    if CURRENT_ENROLLMENT_MODE_KEY not in ann:
-        ann[CURRENT_ENROLLMENT_MODE_KEY] = None
-    return ann.get(CURRENT_ENROLLMENT_MODE_KEY, None)
+    prefs = getGradebookPreferences(person)
+    return prefs.getCurrentEnrollmentMode()
 
 
 def setCurrentEnrollmentMode(person, mode):
-    ann = annotation.interfaces.IAnnotations(removeSecurityProxy(person))
-    ann[CURRENT_ENROLLMENT_MODE_KEY] = mode
+    prefs = getGradebookPreferences(person)
+    prefs.setCurrentEnrollmentMode(mode)
 
 
 class WorksheetGradebookTraverser(object):
@@ -213,7 +210,7 @@ def getLinkedActivityScore(evaluatee, activity):
 @implementer(requirement.interfaces.IScore)
 def getWorksheetAverageScore(evaluatee, worksheet):
     gradebook = interfaces.IGradebook(worksheet)
-    if evaluatee not in gradebook.students:
+    if not gradebook.snapshot.hasStudent(evaluatee):
         return None
     total, value = gradebook.getWorksheetTotalAverage(worksheet, evaluatee)
     score_system = RangedValuesScoreSystem()
@@ -226,6 +223,32 @@ def getWorksheetAverageScore(evaluatee, worksheet):
 
 
 def canAverage(worksheet, containing=None):
+    """Tell whether the average of the worksheet can be computed.
+
+    The linked column graph of the school year of the worksheet is asked
+    if available, links to other school years are followed.
+    """
+    graph = queryLinkedColumnGraph(worksheet)
+    worksheet_id = queryIntId(worksheet)
+    if graph is None or worksheet_id is None:
+        return walkCanAverage(worksheet, containing)
+    if containing is None:
+        containing = worksheet
+    containing = proxy.removeSecurityProxy(containing)
+    if not graph.canAverage(worksheet_id, queryIntId(containing)):
+        return False
+    intids = getUtility(IIntIds)
+    for source_id in graph.getExternalSources(worksheet_id):
+        source = intids.queryObject(source_id)
+        if source is None:
+            continue
+        if source is containing or not walkCanAverage(source, containing):
+            return False
+    return True
+
+
+def walkCanAverage(worksheet, containing=None):
+    """Tell whether the worksheet can be averaged following linked columns."""
     if containing is None:
         containing = worksheet
     for activity in worksheet.values():
@@ -236,28 +259,46 @@ def canAverage(worksheet, containing=None):
             if linked_ws is not None:
                 linked_ws = proxy.removeSecurityProxy(linked_ws)
                 if (linked_ws is proxy.removeSecurityProxy(containing) or
-                    not canAverage(linked_ws, containing)):
+                    not walkCanAverage(linked_ws, containing)):
                     return False
     return True
 
 
+def isFailingScore(score, passing_score=None):
+    """Tell whether the score is below the passing score.
+
+    The passing score is a score of the discrete values score system of
+    the score, a number for other score systems.  The passing score of the
+    score system is used if it is None.
+    """
+    ss = score.scoreSystem
+    if passing_score is None:
+        return ss.isPassingScore(score.value) is False
+    if IDiscreteValuesScoreSystem.providedBy(ss):
+        values = ss.lookup.values
+        passing_value = values.get(passing_score)
+        this_value = values.get(score.value)
+        if ss._isMaxPassingScore:
+            return this_value > passing_value
+        return this_value < passing_value
+    return score.value < Decimal(passing_score)
+
+
 class GradebookBase(object):
     def __init__(self, context):
         self.context = context
         # To make URL creation happy
         self.__parent__ = context
         self.section = self.context.__parent__.__parent__
-        # Establish worksheets and all activities
-        worksheets = interfaces.IActivities(self.section)
-        ensureAtLeastOneWorksheet(worksheets)
-        self.worksheets = list(worksheets.values())
-        self.activities = []
-        for activity in context.values():
-            self.activities.append(activity)
-        self.students = self.section.members.all()
+        # Establish worksheets and all activities, shared by the gradebooks
+        # of the section in the request
+        self.snapshot = getGradebookSnapshot(self.section)
+        self.worksheets = list(self.snapshot.worksheets)
+        self.activities = list(self.snapshot.getActivities(context))
+        self.students = self.snapshot.students
 
     def _checkStudent(self, student):
-        if student not in self.students:
+        if not self.snapshot.hasStudent(student):
             raise ValueError(
                 'Student %r is not in this section.' %student.username)
         # Remove security proxy, so that the object can be referenced and
@@ -269,8 +310,11 @@ class GradebookBase(object):
         # Remove security proxy, so that the object can be referenced and
         # adapters are not proxied. Note that the gradebook itself has
         # sufficient tight security.
-        if activity in self.activities:
-            return proxy.removeSecurityProxy(activity)
+        unproxied = proxy.removeSecurityProxy(activity)
+        name = getattr(unproxied, '__name__', None)
+        if (name is not None and
+            self.snapshot.getActivity(self.context, name) is unproxied):
+            return unproxied
         raise ValueError(
             '%r is not part of this section.' %activity.title)
 
@@ -297,28 +341,33 @@ class GradebookBase(object):
 
     def evaluate(self, student, activity, score, evaluator=None):
         """See interfaces.IGradebook"""
-        student = self._checkStudent(student)
-        activity = self._checkActivity(activity)
-        evaluation = requirement.evaluation.Evaluation(
-            activity, activity.scoresystem, score, evaluator)
-        evaluations = requirement.interfaces.IEvaluations(student)
-        current = evaluations.get(activity)
-        if current is not None:
-            evaluation.previous = current
-        evaluations.addEvaluation(evaluation)
+        self.evaluateMany([(student, activity, score)], evaluator)
 
     def removeEvaluation(self, student, activity, evaluator=None):
         """See interfaces.IGradebook"""
-        student = self._checkStudent(student)
-        activity = self._checkActivity(activity)
-        evaluations = requirement.interfaces.IEvaluations(student)
-        unscored = requirement.evaluation.Evaluation(
-            activity, activity.scoresystem, UNSCORED, evaluator)
-        # throw KeyError here, like "del evaluations[activity]" would have
-        previous = evaluations.get(activity)
-        if previous is not None:
-            unscored.previous = evaluations[activity]
-        evaluations.addEvaluation(unscored)
+        self.evaluateMany([(student, activity, UNSCORED)], evaluator)
+
+    def evaluateMany(self, changes, evaluator=None):
+        """See interfaces.IGradebook"""
+        activities = set([proxy.removeSecurityProxy(activity)
+                          for activity in self.activities])
+        # Validate the whole batch before writing anything
+        batches = OrderedDict()
+        for student, activity, score in changes:
+            student = proxy.removeSecurityProxy(student)
+            activity = proxy.removeSecurityProxy(activity)
+            if not self.snapshot.hasStudent(student):
+                raise ValueError(
+                    'Student %r is not in this section.' %student.username)
+            if activity not in activities:
+                raise ValueError(
+                    '%r is not part of this section.' %activity.title)
+            evaluation = requirement.evaluation.Evaluation(
+                activity, activity.scoresystem, score, evaluator)
+            batches.setdefault(student, OrderedDict())[activity] = evaluation
+        for student, batch in batches.items():
+            evaluations = requirement.interfaces.IEvaluations(student)
+            evaluations.addEvaluations(batch.values())
 
     def getWorksheetActivities(self, worksheet):
         if worksheet:
@@ -326,86 +375,254 @@ class GradebookBase(object):
         else:
             return []
 
-    def getWorksheetTotalAverage(self, worksheet, student):
-        def getMinMaxValue(score):
-            ss = score.scoreSystem
-            if IDiscreteValuesScoreSystem.providedBy(ss):
-                return (ss.scores[-1][2], ss.scores[0][2],
-                    ss.getNumericalValue(score.value))
-            elif IRangedValuesScoreSystem.providedBy(ss):
-                return ss.min, ss.max, score.value
-            return None, None, None
+    def _getMatrixColumn(self, activity):
+        """Get the grade matrix and the int id to read activity scores from.
+
+        Linked columns that link to an activity are read from the matrix of
+        the linked activity.  Return (None, None) if the scores have to be
+        looked up in the evaluations of the students.
+        """
+        activity = proxy.removeSecurityProxy(activity)
+        if interfaces.ILinkedColumnActivity.providedBy(activity):
+            activity = getSourceObj(activity.source)
+            if (not interfaces.IActivity.providedBy(activity) or
+                interfaces.ILinkedColumnActivity.providedBy(activity)):
+                return None, None
+            activity = proxy.removeSecurityProxy(activity)
+        elif not interfaces.IActivity.providedBy(activity):
+            return None, None
+        matrix = interfaces.IGradeMatrix(activity.__parent__, None)
+        activity_id = queryIntId(activity)
+        if matrix is None or activity_id is None:
+            return None, None
+        return matrix, activity_id
+
+    def getWorksheetScores(self, worksheet, students):
+        """See interfaces.IGradebook"""
+        activities = [proxy.removeSecurityProxy(activity)
+                      for activity in self.getWorksheetActivities(worksheet)]
+        columns = [self._getMatrixColumn(activity) for activity in activities]
+        result = []
+        for student in students:
+            student = proxy.removeSecurityProxy(student)
+            student_id = queryIntId(student)
+            scores = {}
+            for activity, (matrix, activity_id) in zip(activities, columns):
+                if matrix is None or student_id is None:
+                    score = queryMultiAdapter(
+                        (student, activity),
+                        requirement.interfaces.IScore,
+                        default=None)
+                else:
+                    score = matrix.get(student_id, activity_id)
+                scores[activity.__name__] = score
+            result.append(scores)
+        return result
 
+    def getActivityScores(self, activity, students):
+        """See interfaces.IGradebook"""
+        activity = proxy.removeSecurityProxy(activity)
+        matrix, activity_id = self._getMatrixColumn(activity)
+        result = []
+        for student in students:
+            student = proxy.removeSecurityProxy(student)
+            student_id = queryIntId(student)
+            if matrix is None or student_id is None:
+                score = queryMultiAdapter(
+                    (student, activity),
+                    requirement.interfaces.IScore,
+                    default=None)
+            else:
+                score = matrix.get(student_id, activity_id)
+            result.append(score)
+        return result
+
+    def _getLinkedWorksheetScores(self, worksheet, students):
+        """Get the average scores of a linked worksheet for the students.
+
+        Return a mapping of the students that are in the gradebook of the
+        linked worksheet to their average scores.
+        """
+        worksheet = proxy.removeSecurityProxy(worksheet)
+        gradebook = proxy.removeSecurityProxy(interfaces.IGradebook(worksheet))
+        members = [student for student in students
+                   if gradebook.snapshot.hasStudent(student)]
+        averages = gradebook.getWorksheetTotalAverages(worksheet, members)
+        score_system = RangedValuesScoreSystem()
+        scores = {}
+        for student, (total, value) in zip(members, averages):
+            score = Score(score_system, value)
+            # Set the __parent__ for security mechanism, see
+            # getWorksheetAverageScore
+            score.__parent__ = worksheet
+            scores[student] = score
+        return scores
+
+    def _checkAverages(self, worksheet, students):
+        """Check the students and activities to average.
+
+        Return None if there is nothing to average.
+        """
         if worksheet is None or not canAverage(worksheet):
-            return 0, UNSCORED
+            return None
+        activities = self.getWorksheetActivities(worksheet)
+        if not activities:
+            return None
+        students = [self._checkStudent(student) for student in students]
+        activities = [self._checkActivity(activity)
+                      for activity in activities]
+        return students, activities
+
+    def getWorksheetTotalAverages(self, worksheet, students):
+        """See interfaces.IGradebook"""
+        checked = self._checkAverages(worksheet, students)
+        if checked is None:
+            return [(0, UNSCORED) for student in students]
+        students, activities = checked
+        matrix = interfaces.IGradeMatrix(
+            proxy.removeSecurityProxy(worksheet), None)
+        result = []
+        missing = []
+        for student in students:
+            average = None
+            if matrix is not None:
+                average = matrix.getAverage(queryIntId(student))
+            if average is None:
+                missing.append(student)
+            result.append(average)
+        if missing:
+            computed = iter(self._computeTotalAverages(
+                worksheet, missing, activities))
+            result = [average if average is not None else computed.next()
+                      for average in result]
+        return result
 
-        # XXX: move this to gradebook adapter for GenericWorksheet
-        weights = None
-        if hasattr(worksheet, 'getCategoryWeights'):
-            weights = worksheet.getCategoryWeights()
-
-        # weight by categories
-        if weights:
-            adjusted_weights = {}
-            for activity in self.getWorksheetActivities(worksheet):
-                score = self.getScore(student, activity)
-                category = activity.category
+    def computeWorksheetTotalAverages(self, worksheet, students):
+        """See interfaces.IGradebook"""
+        checked = self._checkAverages(worksheet, students)
+        if checked is None:
+            return [(0, UNSCORED) for student in students]
+        students, activities = checked
+        return self._computeTotalAverages(worksheet, students, activities)
+
+    def _computeTotalAverages(self, worksheet, students, activities):
+        weights = self.snapshot.getCategoryWeights(worksheet)
+
+        # Resolve where the scores of every activity are read from once
+        columns = []
+        for activity in activities:
+            matrix, activity_id = self._getMatrixColumn(activity)
+            linked_scores = None
+            if matrix is None:
+                source = None
+                if interfaces.ILinkedColumnActivity.providedBy(activity):
+                    source = getSourceObj(activity.source)
+                if interfaces.IActivityWorksheet.providedBy(source):
+                    linked_scores = self._getLinkedWorksheetScores(
+                        source, students)
+            columns.append((activity, activity.category,
+                            matrix, activity_id, linked_scores))
+
+        # Ranges of the score systems, by id as score systems are not
+        # necessarily hashable
+        ranges = {}
+        def getMinMaxValue(score):
+            ss = score.scoreSystem
+            try:
+                minimum, maximum, discrete = ranges[id(ss)]
+            except KeyError:
+                if IDiscreteValuesScoreSystem.providedBy(ss):
+                    minimum, maximum, discrete = (
+                        ss.lookup.minimum, ss.lookup.maximum, True)
+                elif IRangedValuesScoreSystem.providedBy(ss):
+                    minimum, maximum, discrete = ss.min, ss.max, False
+                else:
+                    minimum, maximum, discrete = None, None, False
+                ranges[id(ss)] = minimum, maximum, discrete
+            if minimum is None:
+                return None, None, None
+            if discrete:
+                return minimum, maximum, ss.getNumericalValue(score.value)
+            return minimum, maximum, score.value
+
+        result = []
+        for student in students:
+            student_id = queryIntId(student)
+            scores = []
+            for (activity, category, matrix, activity_id,
+                 linked_scores) in columns:
+                if linked_scores is not None:
+                    score = linked_scores.get(student)
+                elif matrix is None or student_id is None:
+                    score = queryMultiAdapter(
+                        (student, activity),
+                        requirement.interfaces.IScore,
+                        default=None)
+                else:
+                    score = matrix.get(student_id, activity_id)
                 if score:
-                    if category in weights and weights[category] is not None:
-                        adjusted_weights[category] = weights[category]
-            total_percentage = 0
-            for key in adjusted_weights:
-                total_percentage += adjusted_weights[key]
-            if total_percentage:
-                for key in adjusted_weights:
-                    adjusted_weights[key] /= total_percentage
-
-            totals = {}
-            average_totals = {}
-            average_counts = {}
-            for activity in self.getWorksheetActivities(worksheet):
-                score = self.getScore(student, activity)
-                if not score:
-                    continue
-
-                minimum, maximum, value = getMinMaxValue(score)
-                if minimum is None:
-                    continue
-
-                totals.setdefault(activity.category, Decimal(0))
-                totals[activity.category] += value
-                average_totals.setdefault(activity.category, Decimal(0))
-                average_totals[activity.category] += value
-                average_counts.setdefault(activity.category, Decimal(0))
-                average_counts[activity.category] += maximum
-            average = Decimal(0)
-            for category, value in average_totals.items():
-                if category in weights and weights[category] is not None:
-                    average += ((value / average_counts[category]) *
-                        adjusted_weights[category])
-            if not len(average_counts):
-                return 0, UNSCORED
+                    scores.append((category, score))
+            if weights:
+                result.append(
+                    self._getWeightedAverage(scores, weights, getMinMaxValue))
             else:
-                return sum(totals.values()), average * 100
+                result.append(self._getAverage(scores, getMinMaxValue))
+        return result
 
+    def _getWeightedAverage(self, scores, weights, getMinMaxValue):
+        adjusted_weights = {}
+        for category, score in scores:
+            if category in weights and weights[category] is not None:
+                adjusted_weights[category] = weights[category]
+        total_percentage = 0
+        for key in adjusted_weights:
+            total_percentage += adjusted_weights[key]
+        if total_percentage:
+            for key in adjusted_weights:
+                adjusted_weights[key] /= total_percentage
+
+        totals = {}
+        average_totals = {}
+        average_counts = {}
+        for category, score in scores:
+            minimum, maximum, value = getMinMaxValue(score)
+            if minimum is None:
+                continue
+
+            totals.setdefault(category, Decimal(0))
+            totals[category] += value
+            average_totals.setdefault(category, Decimal(0))
+            average_totals[category] += value
+            average_counts.setdefault(category, Decimal(0))
+            average_counts[category] += maximum
+        average = Decimal(0)
+        for category, value in average_totals.items():
+            if category in weights and weights[category] is not None:
+                average += ((value / average_counts[category]) *
+                    adjusted_weights[category])
+        if not len(average_counts):
+            return 0, UNSCORED
+        else:
+            return sum(totals.values()), average * 100
+
+    def _getAverage(self, scores, getMinMaxValue):
         # when not weighting categories, the default is to weight the
         # evaluations by activities.
+        total = 0
+        count = 0
+        for category, score in scores:
+            minimum, maximum, value = getMinMaxValue(score)
+            if minimum is None:
+                continue
+            total += value
+            count += maximum
+        if count:
+            return total, Decimal(100 * total) / Decimal(count)
         else:
-            total = 0
-            count = 0
-            for activity in self.getWorksheetActivities(worksheet):
-                score = self.getScore(student, activity)
-                if not score:
-                    continue
-                minimum, maximum, value = getMinMaxValue(score)
-                if minimum is None:
-                    continue
-                total += value
-                count += maximum
-            if count:
-                return total, Decimal(100 * total) / Decimal(count)
-            else:
-                return 0, UNSCORED
+            return 0, UNSCORED
+
+    def getWorksheetTotalAverage(self, worksheet, student):
+        return self.getWorksheetTotalAverages(worksheet, [student])[0]
 
     def getCurrentWorksheet(self, person):
         section = self.section
@@ -420,28 +637,22 @@ class GradebookBase(object):
         worksheets.setCurrentWorksheet(person, worksheet)
 
     def getDueDateFilter(self, person):
-        person = proxy.removeSecurityProxy(person)
-        ann = annotation.interfaces.IAnnotations(person)
-        if DUE_DATE_FILTER_KEY not in ann:
-            return (False, '9')
-        return ann[DUE_DATE_FILTER_KEY]
+        prefs = getGradebookPreferences(person)
+        return prefs.getDueDateFilter((False, '9'))
 
     def setDueDateFilter(self, person, flag, weeks):
-        person = proxy.removeSecurityProxy(person)
-        ann = annotation.interfaces.IAnnotations(person)
-        ann[DUE_DATE_FILTER_KEY] = (flag, weeks)
+        prefs = getGradebookPreferences(person)
+        prefs.setDueDateFilter(flag, weeks)
 
     def getColumnPreferences(self, person):
-        person = proxy.removeSecurityProxy(person)
-        ann = annotation.interfaces.IAnnotations(person)
-        if COLUMN_PREFERENCES_KEY not in ann:
-            return PersistentDict()
-        return ann[COLUMN_PREFERENCES_KEY]
+        return self.snapshot.getColumnPreferences(person)
 
     def setColumnPreferences(self, person, columnPreferences):
         person = proxy.removeSecurityProxy(person)
         ann = annotation.interfaces.IAnnotations(person)
         ann[COLUMN_PREFERENCES_KEY] = PersistentDict(columnPreferences)
+        invalidateGradebookSnapshots()
+        bumpSectionChangeStamps(self.section)
 
     def getCurrentActivities(self, person):
         worksheet = self.getCurrentWorksheet(person)
@@ -474,21 +685,62 @@ class GradebookBase(object):
             if activity in evaluations:
                 yield student, evaluations[activity]
 
+    def getGradedStudents(self, activity):
+        """See interfaces.IGradebook"""
+        activity = self._checkActivity(activity)
+        matrix, activity_id = self._getMatrixColumn(activity)
+        if matrix is None:
+            students = [proxy.removeSecurityProxy(student)
+                        for student in self.students]
+            scores = self.getActivityScores(activity, students)
+            return [(student, score)
+                    for student, score in zip(students, scores) if score]
+        # Only the scored students are looked up
+        intids = getUtility(IIntIds)
+        result = []
+        for student_id in matrix.getColumn(activity_id):
+            if student_id not in self.snapshot.student_ids:
+                continue
+            student = intids.queryObject(student_id)
+            if student is not None:
+                result.append((student, matrix.get(student_id, activity_id)))
+        return result
+
+    def getMissingStudents(self, activity):
+        """See interfaces.IGradebook"""
+        activity = self._checkActivity(activity)
+        matrix, activity_id = self._getMatrixColumn(activity)
+        if matrix is None:
+            graded = set([student for student, score
+                          in self.getGradedStudents(activity)])
+            return [proxy.removeSecurityProxy(student)
+                    for student in self.students
+                    if proxy.removeSecurityProxy(student) not in graded]
+        missing = (set(self.snapshot.student_ids) -
+                   set(matrix.getColumn(activity_id)))
+        intids = getUtility(IIntIds)
+        result = []
+        for student_id in missing:
+            student = intids.queryObject(student_id)
+            if student is not None:
+                result.append(student)
+        return result
+
+    def getFailingStudents(self, activity, passing_score=None):
+        """See interfaces.IGradebook"""
+        return [(student, score)
+                for student, score in self.getGradedStudents(activity)
+                if isFailingScore(score, passing_score)]
+
     def getSortKey(self, person):
-        person = proxy.removeSecurityProxy(person)
-        ann = annotation.interfaces.IAnnotations(person)
-        if GRADEBOOK_SORTING_KEY not in ann:
-            ann[GRADEBOOK_SORTING_KEY] = PersistentDict()
+        prefs = getGradebookPreferences(person)
         section_id = hash(IKeyReference(self.section))
-        return ann[GRADEBOOK_SORTING_KEY].get(section_id, ('student', False))
+        return prefs.getSortKey(section_id, ('student', False))
 
     def setSortKey(self, person, value):
-        person = proxy.removeSecurityProxy(person)
-        ann = annotation.interfaces.IAnnotations(person)
-        if GRADEBOOK_SORTING_KEY not in ann:
-            ann[GRADEBOOK_SORTING_KEY] = PersistentDict()
+        prefs = getGradebookPreferences(person)
         section_id = hash(IKeyReference(self.section))
-        ann[GRADEBOOK_SORTING_KEY][section_id] = value
+        prefs.setSortKey(section_id, value)
 
 
 class Gradebook(GradebookBase):
@@ -523,6 +775,13 @@ class StudentGradebook(object):
         activities = [(str(activity.__name__), activity)
             for activity in gradebook.activities]
         self.activities = dict(activities)
+        self.changes = []
+
+    def saveChanges(self, evaluator=None):
+        """See interfaces.IStudentGradebook"""
+        changes, self.changes = self.changes, []
+        if changes:
+            self.gradebook.evaluateMany(changes, evaluator)
 
 
 class StudentGradebookFormAdapter(object):
@@ -538,16 +797,17 @@ class StudentGradebookFormAdapter(object):
         gradebook = self.context.gradebook
         student = self.context.student
         activity = self.context.activities[name]
-        # XXX: hack to receive the evaluator from the form
-        evaluator = removeSecurityProxy(self.context).evaluator
+        # The changes are queued on the student gradebook and stored in one
+        # batch by its saveChanges method
+        changes = removeSecurityProxy(self.context).changes
         try:
             if value is None or value == '':
                 score = gradebook.getScore(student, activity)
                 if score:
-                    gradebook.removeEvaluation(student, activity, evaluator=evaluator)
+                    changes.append((student, activity, UNSCORED))
             else:
                 score_value = activity.scoresystem.fromUnicode(value)
-                gradebook.evaluate(student, activity, score_value, evaluator)
+                changes.append((student, activity, score_value))
         except ScoreValidationError:
             pass
 
@@ -253,6 +253,15 @@ class IEditGradebook(Interface):
     def removeEvaluation(student, activity):
         """Remove evaluation."""
 
+    def evaluateMany(changes, evaluator=None):
+        """Evaluate students for activities in one batch.
+
+        The changes are (student, activity, score) triples, an UNSCORED
+        score removes the evaluation.  All changes are validated before
+        any of them is stored, then the evaluations of every student are
+        written once.
+        """
+
 
 class IReadGradebook(Interface):
 
@@ -268,6 +277,9 @@ class IReadGradebook(Interface):
         title=_('Students'),
         description=_('Students in this gradebook.'))
 
+    snapshot = Attribute(
+        """The IGradebookSnapshot of the section of this gradebook.""")
+
     def hasEvaluation(student, activity):
         """Check whether an evaluation exists for a student-activity pair."""
 
@@ -291,12 +303,66 @@ class IReadGradebook(Interface):
         Return iterable of 2-tuples of the form (student, evaluation).
         """
 
+    def getGradedStudents(activity):
+        """Get the students of the section scored for the activity.
+
+        Return a list of 2-tuples of the form (student, score), in no
+        particular order.  The scored students are found in the grade
+        matrix, the evaluations of the other students are not read.
+        """
+
+    def getMissingStudents(activity):
+        """Get the students of the section not scored for the activity.
+
+        Return a list of students, in no particular order.
+        """
+
+    def getFailingStudents(activity, passing_score=None):
+        """Get the students of the section failing the activity.
+
+        Return a list of 2-tuples of the form (student, score), in no
+        particular order.  The scores are compared to the passing score,
+        a score of a discrete values score system or a number, or to the
+        passing score of their score system if it is None.
+        """
+
     def getWorksheetActivities(worksheet):
         """Get the activities for the given worksheet."""
 
+    def getWorksheetScores(worksheet, students):
+        """Get the scores of the students for the worksheet activities.
+
+        Return a list with a mapping of activity names to scores for each
+        of the given students.  Scores are read from the grade matrix of
+        the worksheet.
+        """
+
+    def getActivityScores(activity, students):
+        """Get the scores of the students for the activity.
+
+        Return a list with the score, or None, of each of the given
+        students.
+        """
+
     def getWorksheetAverage(worksheet, student):
         """Calculate the average for the worksheet, student pair."""
 
+    def getWorksheetTotalAverages(worksheet, students):
+        """Calculate the totals and averages of the worksheet for students.
+
+        Return a list with a (total, average) pair for each of the given
+        students.  Averages stored in the grade matrix of the worksheet are
+        used, the others are computed.  The activities, category weights
+        and score system ranges are resolved once for all the students.
+        """
+
+    def computeWorksheetTotalAverages(worksheet, students):
+        """Compute the totals and averages of the worksheet for students.
+
+        Like getWorksheetTotalAverages, but the stored averages are not
+        used.
+        """
+
     def getCurrentWorksheet(person):
         """Get the user's currently active worksheet."""
 
@@ -350,6 +416,12 @@ class IStudentGradebook(Interface):
 
     activities = Attribute("""A dictionary of activity hash to activity""")
 
+    changes = Attribute("""List of (student, activity, score) changes
+                           waiting to be saved""")
+
+    def saveChanges(evaluator=None):
+        """Store the queued changes in the gradebook in one batch."""
+
 
 class IStudentGradebookForm(Interface):
     """Interface for fields that are stored in student gradebook."""
@@ -474,6 +546,252 @@ class ILinkedColumnActivity(IActivity):
         required=True)
 
 
+class IGradeMatrix(Interface):
+    """Student x activity matrix of the scores of a worksheet.
+
+    Students and activities are identified by their int ids.  The matrix
+    holds copies of the scores and is maintained from the evaluations of
+    the students.
+    """
+
+    def getRow(student_id):
+        """Get a mapping of activity int ids to scores of the student."""
+
+    def get(student_id, activity_id, default=None):
+        """Get the score of the student for the activity."""
+
+    def getColumn(activity_id):
+        """Get the set of int ids of the students scored for the activity."""
+
+    def set(student_id, activity_id, score):
+        """Store the score of the student for the activity.
+
+        Unscored values are not stored.
+        """
+
+    def remove(student_id, activity_id):
+        """Remove the score of the student for the activity."""
+
+    def rows():
+        """Iterate over (student id, row) pairs."""
+
+    def getAverage(student_id, default=None):
+        """Get the stored (total, average) pair of the student."""
+
+    def setAverage(student_id, average):
+        """Store the (total, average) pair of the student."""
+
+    def removeAverage(student_id):
+        """Remove the stored average of the student."""
+
+    def clearAverages():
+        """Remove the stored averages of all students."""
+
+    def clear():
+        """Remove all scores and averages."""
+
+
+class ICommentRendering(Interface):
+    """Representations of a comment computed when the comment is saved."""
+
+    shorthand = zope.schema.TextLine(
+        title=u"The first few characters of the text of the comment")
+
+    text = zope.schema.Text(
+        title=u"Plain text of the comment without markup")
+
+    rml = zope.schema.Text(
+        title=u"RML paragraphs of the comment for report cards",
+        required=False)
+
+
+class ILinkedColumnGraph(Interface):
+    """Dependencies between the worksheets of a school year.
+
+    A worksheet depends on the worksheets its linked columns link to,
+    either to their average or to one of their activities.  Worksheets are
+    identified by their int ids.  The graph is maintained when linked
+    columns are added, edited or removed.
+    """
+
+    def setLinks(worksheet_id, links):
+        """Set the links of the linked columns of a worksheet.
+
+        Links are (source worksheet id, average, external) triples, where
+        average tells whether the column links to the average of the source
+        worksheet and external whether the source worksheet is in another
+        school year.
+        """
+
+    def getLinks(worksheet_id):
+        """Get the links of the linked columns of the worksheet."""
+
+    def removeWorksheet(worksheet_id):
+        """Forget the links of the worksheet."""
+
+    def sourcesChanged():
+        """Note that a worksheet was hidden, shown or removed, or lost
+        activities, so linked columns may have to be shown or hidden."""
+
+    def getState():
+        """Get a value that changes whenever the links or the sources do."""
+
+    def canAverage(worksheet_id, containing_id=None):
+        """Tell whether the average of the worksheet can be computed.
+
+        It can't be if it depends, through linked averages, on the average
+        of the containing worksheet (by default the worksheet itself), or
+        on a cycle of linked averages.  Links to other school years are not
+        followed, see getExternalSources.
+        """
+
+    def getExternalSources(worksheet_id):
+        """Get the worksheets of other school years the average depends on.
+
+        Return the int ids of the worksheets of other school years linked to
+        by averages the average of the worksheet depends on.
+        """
+
+    def getDependents(worksheet_id):
+        """Get the worksheets that depend on the worksheet.
+
+        Return the int ids of the worksheets that depend on the worksheet,
+        directly or indirectly, in the order their averages should be
+        recomputed.
+        """
+
+
+class IGradebookSnapshot(Interface):
+    """The worksheets, activities and roster of a section.
+
+    A snapshot is shared by the gradebooks of a section built during one
+    request, and dropped when the request changes the gradebook.
+    """
+
+    section = Attribute("The section.")
+
+    worksheets = Attribute("Tuple of the worksheets of the section.")
+
+    students = Attribute("Tuple of the students of the section.")
+
+    student_ids = Attribute("Frozen set of the int ids of the students.")
+
+    def hasStudent(student):
+        """Tell whether the student is a member of the section."""
+
+    def getActivities(worksheet):
+        """Get the tuple of the activities of the worksheet."""
+
+    def getActivity(worksheet, name):
+        """Get the activity of the worksheet by name, None if not found."""
+
+    def getScoreSystem(activity):
+        """Get the score system of the activity."""
+
+    def getCategoryWeights(worksheet):
+        """Get a copy of the category weights of the worksheet."""
+
+    def getColumnPreferences(person):
+        """Get the gradebook column preferences of the person."""
+
+    journal_data = Attribute(
+        "The ISectionJournalData of the section, None if not available.")
+
+    roster = Attribute("The ISectionRoster of the section.")
+
+
+class ISectionRoster(Interface):
+    """The students of a section with their enrollment states.
+
+    A roster is built from one query of the membership relationships of
+    the section, shared during one request and dropped when the membership
+    of the section changes.
+    """
+
+    section = Attribute("The section.")
+
+    students = Attribute(
+        "Tuple of the members of the section, in any enrollment state.")
+
+    def __contains__(student):
+        """Tell whether the student is a member of the section."""
+
+    def getStudent(username):
+        """Get the member by username, None if not found."""
+
+    def getActiveStudents(date):
+        """Get the frozen set of the members active on the date."""
+
+    def getStudents(date=None):
+        """Get the tuple of the members active on the date.
+
+        All members are returned if the date is None.
+        """
+
+    def getStateTitle(student):
+        """Get the title of the enrollment state of the student today.
+
+        The date is added if the student has no state yet today.  None is
+        returned if the state is not known.
+        """
+
+    def getSortingKey(student, collator):
+        """Get the sorting key of the name of the student."""
+
+    def sorted(collator, students=None):
+        """Get the list of the students sorted by name.
+
+        All members are sorted if students is None.
+        """
+
+
+class IGradebookPreferences(Interface):
+    """Gradebook preferences of a person.
+
+    Reading preferences never writes, and preferences are only written
+    when their values change.
+    """
+
+    def getCurrentSectionTaught():
+        """Get the section last shown in the gradebook."""
+
+    def setCurrentSectionTaught(section):
+        """Set the section last shown in the gradebook."""
+
+    def getCurrentSectionAttended():
+        """Get the section last shown in the student's grades."""
+
+    def setCurrentSectionAttended(section):
+        """Set the section last shown in the student's grades."""
+
+    def getCurrentEnrollmentMode():
+        """Get the enrollment mode of the gradebook, None if not set."""
+
+    def setCurrentEnrollmentMode(mode):
+        """Set the enrollment mode of the gradebook."""
+
+    def getCurrentWorksheets(key):
+        """Get the mapping of section ids to current worksheets.
+
+        The key tells which kind of worksheets the mapping holds.
+        """
+
+    def setCurrentWorksheet(key, section_id, worksheet):
+        """Set the current worksheet of the section."""
+
+    def getSortKey(section_id, default=None):
+        """Get the sorting key of the gradebook of the section."""
+
+    def setSortKey(section_id, value):
+        """Set the sorting key of the gradebook of the section."""
+
+    def getDueDateFilter(default=None):
+        """Get the due date filter (flag, weeks)."""
+
+    def setDueDateFilter(flag, weeks):
+        """Set the due date filter."""
+
+
 class ISectionJournalData(Interface):
     """Bridge interface to remove gradebook dependency on lyceum journal."""
 
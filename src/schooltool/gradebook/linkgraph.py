@@ -0,0 +1,349 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Linked column dependency graph
+
+Linked columns make the average of a worksheet depend on the scores and
+averages of other worksheets.  The graph keeps the links of the worksheets
+of a school year, keyed by int ids, so that it can tell whether a worksheet
+can be averaged and which worksheets depend on a worksheet without loading
+and following the linked columns.  It is kept up to date by linked column
+event subscribers.
+
+The graph also counts the changes of the worksheets linked columns can use
+as sources, worksheets cache their activities until the links or the
+sources change.
+"""
+__docformat__ = 'reStructuredText'
+
+import persistent
+from BTrees.IOBTree import IOBTree
+
+from zope import annotation
+from zope.component import adapts, adapter, queryUtility
+from zope.container.contained import Contained
+from zope.interface import implements, implementer
+from zope.intid.interfaces import IIntIds
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+from zope.location import location
+from zope.security import proxy
+
+from schooltool.schoolyear.interfaces import ISchoolYear
+from schooltool.schoolyear.subscriber import ObjectEventAdapterSubscriber
+
+from schooltool.gradebook import interfaces
+from schooltool.gradebook.activity import getSourceObj
+from schooltool.gradebook.activity import queryWorksheetSchoolYear
+from schooltool.gradebook.activity import queryLinkedColumnGraph
+
+LINKED_COLUMN_GRAPH_KEY = 'schooltool.gradebook.linked_column_graph'
+
+
+class LinkedColumnGraphCache(object):
+    """Closures of a version of the links of a linked column graph."""
+
+    def __init__(self, version, links):
+        self.version = version
+        self._averages = {}
+        self._external = {}
+        self._dependents = {}
+        self._reach = {}
+        self._order = {}
+        for worksheet_id, worksheet_links in links:
+            for source_id, average, external in worksheet_links:
+                if external:
+                    if average:
+                        self._external.setdefault(
+                            worksheet_id, []).append(source_id)
+                    continue
+                if average:
+                    self._averages.setdefault(
+                        worksheet_id, []).append(source_id)
+                self._dependents.setdefault(
+                    source_id, set()).add(worksheet_id)
+
+    def reach(self, worksheet_id):
+        """Worksheets whose averages the average of the worksheet uses."""
+        try:
+            return self._reach[worksheet_id]
+        except KeyError:
+            pass
+        result = set()
+        todo = list(self._averages.get(worksheet_id, ()))
+        while todo:
+            source_id = todo.pop()
+            if source_id in result:
+                continue
+            result.add(source_id)
+            todo.extend(self._averages.get(source_id, ()))
+        self._reach[worksheet_id] = result
+        return result
+
+    def isCyclic(self, worksheet_id):
+        return worksheet_id in self.reach(worksheet_id)
+
+    def external(self, worksheet_id):
+        result = set(self._external.get(worksheet_id, ()))
+        for source_id in self.reach(worksheet_id):
+            result.update(self._external.get(source_id, ()))
+        return result
+
+    def dependents(self, worksheet_id):
+        """Dependent worksheets, sources before the worksheets using them."""
+        try:
+            return self._order[worksheet_id]
+        except KeyError:
+            pass
+        found = set()
+        todo = [worksheet_id]
+        while todo:
+            for dependent_id in self._dependents.get(todo.pop(), ()):
+                if dependent_id not in found:
+                    found.add(dependent_id)
+                    todo.append(dependent_id)
+        found.discard(worksheet_id)
+        # Sort topologically, worksheets on cycles go last
+        waiting = {}
+        for dependent_id in found:
+            for other_id in self._dependents.get(dependent_id, ()):
+                if other_id in found:
+                    waiting[other_id] = waiting.get(other_id, 0) + 1
+        ready = sorted([dependent_id for dependent_id in found
+                        if not waiting.get(dependent_id)], reverse=True)
+        result = []
+        while ready:
+            dependent_id = ready.pop()
+            result.append(dependent_id)
+            for other_id in sorted(self._dependents.get(dependent_id, ())):
+                if other_id not in waiting:
+                    continue
+                waiting[other_id] -= 1
+                if not waiting[other_id]:
+                    del waiting[other_id]
+                    ready.append(other_id)
+            ready.sort(reverse=True)
+        result.extend(sorted(waiting))
+        result = tuple(result)
+        self._order[worksheet_id] = result
+        return result
+
+
+class LinkedColumnGraph(persistent.Persistent, Contained):
+    """Graph of the linked columns of the worksheets of a school year."""
+    implements(interfaces.ILinkedColumnGraph)
+
+    # Incremented when worksheets of the school year are hidden, shown or
+    # removed, or lose activities
+    _sources_version = 0
+
+    def __init__(self):
+        self._links = IOBTree()
+        self._version = 0
+
+    def setLinks(self, worksheet_id, links):
+        """See interfaces.ILinkedColumnGraph"""
+        links = tuple(sorted(set(links)))
+        if self._links.get(worksheet_id, ()) == links:
+            return
+        if links:
+            self._links[worksheet_id] = links
+        else:
+            del self._links[worksheet_id]
+        self._version += 1
+
+    def getLinks(self, worksheet_id):
+        """See interfaces.ILinkedColumnGraph"""
+        return self._links.get(worksheet_id, ())
+
+    def removeWorksheet(self, worksheet_id):
+        """See interfaces.ILinkedColumnGraph"""
+        self.setLinks(worksheet_id, ())
+
+    def sourcesChanged(self):
+        """See interfaces.ILinkedColumnGraph"""
+        self._sources_version += 1
+
+    def getState(self):
+        """See interfaces.ILinkedColumnGraph"""
+        return (self._version, self._sources_version)
+
+    def _getCache(self):
+        cache = getattr(self, '_v_cache', None)
+        if cache is None or cache.version != self._version:
+            cache = self._v_cache = LinkedColumnGraphCache(
+                self._version, self._links.items())
+        return cache
+
+    def canAverage(self, worksheet_id, containing_id=None):
+        """See interfaces.ILinkedColumnGraph"""
+        if containing_id is None:
+            containing_id = worksheet_id
+        cache = self._getCache()
+        reach = cache.reach(worksheet_id)
+        if containing_id in reach or cache.isCyclic(worksheet_id):
+            return False
+        for source_id in reach:
+            if cache.isCyclic(source_id):
+                return False
+        return True
+
+    def getExternalSources(self, worksheet_id):
+        """See interfaces.ILinkedColumnGraph"""
+        return self._getCache().external(worksheet_id)
+
+    def getDependents(self, worksheet_id):
+        """See interfaces.ILinkedColumnGraph"""
+        return self._getCache().dependents(worksheet_id)
+
+
+@adapter(ISchoolYear)
+@implementer(interfaces.ILinkedColumnGraph)
+def getLinkedColumnGraph(schoolyear):
+    annotations = annotation.interfaces.IAnnotations(schoolyear)
+    try:
+        return annotations[LINKED_COLUMN_GRAPH_KEY]
+    except KeyError:
+        graph = LinkedColumnGraph()
+        annotations[LINKED_COLUMN_GRAPH_KEY] = graph
+        location.locate(graph, proxy.removeSecurityProxy(schoolyear),
+                        LINKED_COLUMN_GRAPH_KEY)
+        return graph
+# Convention to make adapter introspectable
+getLinkedColumnGraph.factory = LinkedColumnGraph
+
+
+def queryDependentWorksheets(worksheet):
+    """Get the worksheets that depend on the worksheet through links."""
+    worksheet = proxy.removeSecurityProxy(worksheet)
+    graph = queryLinkedColumnGraph(worksheet)
+    intids = queryUtility(IIntIds)
+    if graph is None or intids is None:
+        return []
+    worksheet_id = intids.queryId(worksheet)
+    if worksheet_id is None:
+        return []
+    worksheets = []
+    for dependent_id in graph.getDependents(worksheet_id):
+        dependent = intids.queryObject(dependent_id)
+        if dependent is not None:
+            worksheets.append(dependent)
+    return worksheets
+
+
+def getWorksheetLinks(worksheet, exclude=None):
+    """Get the links of the linked columns of the worksheet."""
+    intids = queryUtility(IIntIds)
+    schoolyear = queryWorksheetSchoolYear(worksheet)
+    exclude = proxy.removeSecurityProxy(exclude)
+    links = []
+    for name, activity in worksheet.items():
+        activity = proxy.removeSecurityProxy(activity)
+        if (activity is exclude or
+            not interfaces.ILinkedColumnActivity.providedBy(activity)):
+            continue
+        source = getSourceObj(activity.source)
+        if interfaces.IActivityWorksheet.providedBy(source):
+            average = True
+        elif interfaces.IActivity.providedBy(source):
+            source = source.__parent__
+            average = False
+        else:
+            continue
+        source = proxy.removeSecurityProxy(source)
+        external = queryWorksheetSchoolYear(source) is not schoolyear
+        links.append((intids.register(source), average, external))
+    return links
+
+
+def updateLinkedColumnGraph(worksheet, exclude=None):
+    """Record the linked columns of the worksheet in its graph.
+
+    The exclude linked column is left out, it is being removed.
+    """
+    worksheet = proxy.removeSecurityProxy(worksheet)
+    graph = queryLinkedColumnGraph(worksheet)
+    intids = queryUtility(IIntIds)
+    if graph is None or intids is None:
+        return
+    worksheet_id = intids.queryId(worksheet)
+    if worksheet_id is None:
+        return
+    graph.setLinks(worksheet_id, getWorksheetLinks(worksheet, exclude))
+
+
+class LinkedColumnAddedSubscriber(ObjectEventAdapterSubscriber):
+    """Record added linked columns in the graph."""
+    adapts(IObjectAddedEvent, interfaces.ILinkedColumnActivity)
+
+    def __call__(self):
+        worksheet = self.event.newParent
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            updateLinkedColumnGraph(worksheet)
+
+
+class LinkedColumnModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Record edited linked columns in the graph."""
+    adapts(IObjectModifiedEvent, interfaces.ILinkedColumnActivity)
+
+    def __call__(self):
+        worksheet = self.object.__parent__
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            updateLinkedColumnGraph(worksheet)
+
+
+class LinkedColumnRemovedSubscriber(ObjectEventAdapterSubscriber):
+    """Drop removed linked columns from the graph."""
+    adapts(IObjectRemovedEvent, interfaces.ILinkedColumnActivity)
+
+    def __call__(self):
+        worksheet = self.event.oldParent
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            updateLinkedColumnGraph(worksheet, exclude=self.object)
+
+
+class WorksheetRemovedSubscriber(ObjectEventAdapterSubscriber):
+    """Drop the links of removed worksheets from the graph."""
+    adapts(IObjectRemovedEvent, interfaces.IActivityWorksheet)
+
+    def __call__(self):
+        worksheet = proxy.removeSecurityProxy(self.object)
+        graph = queryLinkedColumnGraph(worksheet)
+        if graph is None:
+            return
+        graph.sourcesChanged()
+        intids = queryUtility(IIntIds)
+        if intids is None:
+            return
+        worksheet_id = intids.queryId(worksheet)
+        if worksheet_id is not None:
+            graph.removeWorksheet(worksheet_id)
+
+
+class SourceRemovedSubscriber(ObjectEventAdapterSubscriber):
+    """Linked columns of removed activities are no longer shown."""
+    adapts(IObjectRemovedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        worksheet = self.event.oldParent
+        if not interfaces.IActivityWorksheet.providedBy(worksheet):
+            return
+        graph = queryLinkedColumnGraph(proxy.removeSecurityProxy(worksheet))
+        if graph is not None:
+            graph.sourcesChanged()
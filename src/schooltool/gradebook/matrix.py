@@ -0,0 +1,264 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Worksheet grade matrix
+
+The matrix keeps a copy of the scores of every student for the activities
+of a worksheet, keyed by int ids, so that the whole worksheet can be read
+without opening the evaluations of each student.  The matrix also keeps a
+reverse index of the students that have a score for each activity, so
+that per activity queries don't have to look at every student, and the
+stored worksheet averages of the students (see the averages module).  The
+evaluations of the students remain the source of truth, the matrix is kept
+up to date by evaluation event subscribers.
+"""
+__docformat__ = 'reStructuredText'
+
+import persistent
+from BTrees.IOBTree import IOBTree
+from BTrees.IIBTree import IITreeSet
+
+from zope import annotation
+from zope.component import adapts, adapter
+from zope.container.contained import Contained
+from zope.interface import implements, implementer
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+from zope.location import location
+from zope.security import proxy
+
+from schooltool.requirement.interfaces import IEvaluation, IEvaluations
+from schooltool.requirement.interfaces import IEvaluationsModifiedEvent
+from schooltool.requirement.interfaces import IScore
+from schooltool.requirement.interfaces import ICommentScoreSystem
+from schooltool.requirement.evaluation import timestamp
+from schooltool.requirement.index import queryIntId
+from schooltool.requirement.scoresystem import UNSCORED
+from schooltool.schoolyear.subscriber import ObjectEventAdapterSubscriber
+
+from schooltool.gradebook import interfaces
+
+GRADE_MATRIX_KEY = 'schooltool.gradebook.matrix'
+
+
+class GradeCell(object):
+    """A copy of the score of an evaluation stored in the grade matrix.
+
+    Comments also keep their renderings, see the comments module.
+    """
+    implements(IScore)
+
+    comment = None
+
+    def __init__(self, scoreSystem, value, time=None, evaluator=None,
+                 comment=None):
+        self.scoreSystem = scoreSystem
+        self.value = value
+        self.time = time
+        self.evaluator = evaluator
+        if comment is not None:
+            self.comment = comment
+
+    def __nonzero__(self):
+        return self.value is not UNSCORED
+
+    def __repr__(self):
+        return '<%s value=%r>' % (self.__class__.__name__, self.value)
+
+    def _state(self):
+        time = self.time
+        if time is not None:
+            time = timestamp(time)
+        return (self.scoreSystem, self.value, time, self.evaluator,
+                self.comment)
+
+    def __cmp__(self, other):
+        # Cells are compared by value, so that BTree buckets can tell which
+        # cells concurrent transactions changed and merge them.
+        if not isinstance(other, GradeCell):
+            return cmp(id(self), id(other))
+        return cmp(self._state(), other._state())
+
+
+def cellFromEvaluation(evaluation):
+    comment = None
+    if ICommentScoreSystem.providedBy(evaluation.scoreSystem):
+        comment = interfaces.ICommentRendering(evaluation, None)
+    return GradeCell(evaluation.scoreSystem, evaluation.value,
+                     getattr(evaluation, 'time', None),
+                     getattr(evaluation, 'evaluator', None),
+                     comment)
+
+
+class GradeMatrix(persistent.Persistent, Contained):
+    """Student x activity matrix of scores of a worksheet."""
+    implements(interfaces.IGradeMatrix)
+
+    # Stored (total, average) of the students, keyed by student int id.
+    # Concurrent transactions grading different students change different
+    # keys, which BTree buckets merge.
+    _averages = None
+
+    def __init__(self):
+        self._rows = IOBTree()
+        self._columns = IOBTree()
+        self._averages = IOBTree()
+
+    def getRow(self, student_id):
+        """See interfaces.IGradeMatrix"""
+        if student_id is None:
+            return {}
+        return self._rows.get(student_id, {})
+
+    def get(self, student_id, activity_id, default=None):
+        """See interfaces.IGradeMatrix"""
+        return self.getRow(student_id).get(activity_id, default)
+
+    def getColumn(self, activity_id):
+        """See interfaces.IGradeMatrix"""
+        if activity_id is None:
+            return ()
+        return self._columns.get(activity_id, ())
+
+    def set(self, student_id, activity_id, cell):
+        """See interfaces.IGradeMatrix"""
+        if not cell:
+            self.remove(student_id, activity_id)
+            return
+        row = self._rows.get(student_id)
+        if row is None:
+            row = self._rows[student_id] = IOBTree()
+        row[activity_id] = cell
+        column = self._columns.get(activity_id)
+        if column is None:
+            column = self._columns[activity_id] = IITreeSet()
+        column.insert(student_id)
+
+    def remove(self, student_id, activity_id):
+        """See interfaces.IGradeMatrix"""
+        row = self._rows.get(student_id)
+        if row is None or activity_id not in row:
+            return
+        del row[activity_id]
+        if not row:
+            del self._rows[student_id]
+        column = self._columns.get(activity_id)
+        if column is not None:
+            column.remove(student_id)
+            if not column:
+                del self._columns[activity_id]
+
+    def rows(self):
+        """See interfaces.IGradeMatrix"""
+        return self._rows.items()
+
+    def getAverage(self, student_id, default=None):
+        """See interfaces.IGradeMatrix"""
+        if self._averages is None or student_id is None:
+            return default
+        return self._averages.get(student_id, default)
+
+    def setAverage(self, student_id, average):
+        """See interfaces.IGradeMatrix"""
+        if self._averages is None:
+            self._averages = IOBTree()
+        average = tuple(average)
+        if self._averages.get(student_id) != average:
+            self._averages[student_id] = average
+
+    def removeAverage(self, student_id):
+        """See interfaces.IGradeMatrix"""
+        if (self._averages is not None and student_id is not None and
+            self._averages.has_key(student_id)):
+            del self._averages[student_id]
+
+    def clearAverages(self):
+        """See interfaces.IGradeMatrix"""
+        if self._averages:
+            self._averages.clear()
+
+    def clear(self):
+        """See interfaces.IGradeMatrix"""
+        self._rows.clear()
+        self._columns.clear()
+        self.clearAverages()
+
+
+@adapter(interfaces.IActivityWorksheet)
+@implementer(interfaces.IGradeMatrix)
+def getGradeMatrix(worksheet):
+    annotations = annotation.interfaces.IAnnotations(worksheet)
+    try:
+        return annotations[GRADE_MATRIX_KEY]
+    except KeyError:
+        matrix = GradeMatrix()
+        annotations[GRADE_MATRIX_KEY] = matrix
+        location.locate(matrix, proxy.removeSecurityProxy(worksheet),
+                        GRADE_MATRIX_KEY)
+        return matrix
+# Convention to make adapter introspectable
+getGradeMatrix.factory = GradeMatrix
+
+
+def updateGradeMatrix(evaluatee, evaluation, remove=False):
+    """Copy the score of the evaluation to its worksheet's grade matrix."""
+    activity = evaluation.requirement
+    if not interfaces.IActivity.providedBy(activity):
+        return
+    matrix = interfaces.IGradeMatrix(activity.__parent__, None)
+    if matrix is None:
+        return
+    student_id = queryIntId(evaluatee)
+    activity_id = queryIntId(activity)
+    if student_id is None or activity_id is None:
+        return
+    if remove:
+        matrix.remove(student_id, activity_id)
+    else:
+        matrix.set(student_id, activity_id, cellFromEvaluation(evaluation))
+
+
+class EvaluationAddedSubscriber(ObjectEventAdapterSubscriber):
+    """Copy added evaluations to the grade matrix."""
+    adapts(IObjectAddedEvent, IEvaluation)
+
+    def __call__(self):
+        evaluations = self.event.newParent
+        if not IEvaluations.providedBy(evaluations):
+            return
+        updateGradeMatrix(evaluations.__parent__, self.object)
+
+
+class EvaluationRemovedSubscriber(ObjectEventAdapterSubscriber):
+    """Drop removed evaluations from the grade matrix."""
+    adapts(IObjectRemovedEvent, IEvaluation)
+
+    def __call__(self):
+        evaluations = self.event.oldParent
+        if not IEvaluations.providedBy(evaluations):
+            return
+        updateGradeMatrix(evaluations.__parent__, self.object, remove=True)
+
+
+class EvaluationsModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Copy a batch of added evaluations to the grade matrices."""
+    adapts(IEvaluationsModifiedEvent, IEvaluations)
+
+    def __call__(self):
+        for evaluation in self.event.evaluations:
+            updateGradeMatrix(self.object.__parent__, evaluation)
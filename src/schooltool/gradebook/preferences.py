@@ -0,0 +1,135 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Gradebook preferences of persons
+
+The preferences are kept in the annotations of the person.  Gradebook
+views read them on every request, so reading must never write, and
+setting a preference to the value it already has must not write either:
+writes on read requests make them conflict with each other.
+"""
+__docformat__ = 'reStructuredText'
+
+from persistent.dict import PersistentDict
+from zope.annotation.interfaces import IAnnotations
+from zope.component import adapts
+from zope.interface import implements
+from zope.security import proxy
+
+from schooltool.basicperson.interfaces import IBasicPerson
+
+from schooltool.gradebook import interfaces
+
+GRADEBOOK_SORTING_KEY = 'schooltool.gradebook.sorting'
+CURRENT_SECTION_TAUGHT_KEY = 'schooltool.gradebook.currentsectiontaught'
+CURRENT_SECTION_ATTENDED_KEY = 'schooltool.gradebook.currentsectionattended'
+DUE_DATE_FILTER_KEY = 'schooltool.gradebook.duedatefilter'
+CURRENT_ENROLLMENT_MODE_KEY = 'schooltool.gradebook.currentenrollmentmode'
+
+_marker = object()
+
+
+class GradebookPreferences(object):
+    """Gradebook preferences stored in the annotations of a person."""
+    implements(interfaces.IGradebookPreferences)
+    adapts(IBasicPerson)
+
+    def __init__(self, person):
+        self.person = proxy.removeSecurityProxy(person)
+        self.annotations = IAnnotations(self.person)
+
+    def _get(self, key, default=None):
+        return self.annotations.get(key, default)
+
+    def _set(self, key, value):
+        if self.annotations.get(key, _marker) == value:
+            return
+        self.annotations[key] = value
+
+    def _getMapping(self, key):
+        mapping = self.annotations.get(key)
+        if mapping is None:
+            return {}
+        return mapping
+
+    def _setMapped(self, key, mapped_key, value):
+        mapping = self.annotations.get(key)
+        if mapping is None:
+            mapping = self.annotations[key] = PersistentDict()
+        elif mapping.get(mapped_key, _marker) == value:
+            return
+        mapping[mapped_key] = value
+
+    def getCurrentSectionTaught(self):
+        """See interfaces.IGradebookPreferences"""
+        return self._get(CURRENT_SECTION_TAUGHT_KEY)
+
+    def setCurrentSectionTaught(self, section):
+        """See interfaces.IGradebookPreferences"""
+        self._set(CURRENT_SECTION_TAUGHT_KEY,
+                  proxy.removeSecurityProxy(section))
+
+    def getCurrentSectionAttended(self):
+        """See interfaces.IGradebookPreferences"""
+        return self._get(CURRENT_SECTION_ATTENDED_KEY)
+
+    def setCurrentSectionAttended(self, section):
+        """See interfaces.IGradebookPreferences"""
+        self._set(CURRENT_SECTION_ATTENDED_KEY,
+                  proxy.removeSecurityProxy(section))
+
+    def getCurrentEnrollmentMode(self):
+        """See interfaces.IGradebookPreferences"""
+        return self._get(CURRENT_ENROLLMENT_MODE_KEY)
+
+    def setCurrentEnrollmentMode(self, mode):
+        """See interfaces.IGradebookPreferences"""
+        self._set(CURRENT_ENROLLMENT_MODE_KEY, mode)
+
+    def getCurrentWorksheets(self, key):
+        """See interfaces.IGradebookPreferences"""
+        return self._getMapping(key)
+
+    def setCurrentWorksheet(self, key, section_id, worksheet):
+        """See interfaces.IGradebookPreferences"""
+        self._setMapped(key, section_id, proxy.removeSecurityProxy(worksheet))
+
+    def getSortKey(self, section_id, default=None):
+        """See interfaces.IGradebookPreferences"""
+        return self._getMapping(GRADEBOOK_SORTING_KEY).get(section_id, default)
+
+    def setSortKey(self, section_id, value):
+        """See interfaces.IGradebookPreferences"""
+        self._setMapped(GRADEBOOK_SORTING_KEY, section_id, value)
+
+    def getDueDateFilter(self, default=None):
+        """See interfaces.IGradebookPreferences"""
+        return self._get(DUE_DATE_FILTER_KEY, default)
+
+    def setDueDateFilter(self, flag, weeks):
+        """See interfaces.IGradebookPreferences"""
+        self._set(DUE_DATE_FILTER_KEY, (flag, weeks))
+
+
+def getGradebookPreferences(person):
+    """Get the gradebook preferences of the person.
+
+    Persons may keep their gradebook preferences in views they can't edit
+    the person in, so the preferences are not security proxied.
+    """
+    return interfaces.IGradebookPreferences(proxy.removeSecurityProxy(person))
@@ -0,0 +1,373 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Request-scoped gradebook snapshots
+
+Building a gradebook lists the worksheets, activities and students of the
+section.  A gradebook page builds several gradebooks of the same section:
+the view, its viewlets and the JSON views of the popup menus.  The snapshot
+of the section is built once per request and shared by all of them.  It is
+dropped when the request changes the activities, the worksheets or the
+column preferences, so later gradebooks of the request see the changes.
+
+The roster of the section is shared the same way by the gradebooks, the
+grading forms and the exports of the section, and dropped when the
+membership of the section changes.
+"""
+__docformat__ = 'reStructuredText'
+
+from persistent.dict import PersistentDict
+from zope.annotation.interfaces import IAnnotations
+from zope.component import adapts, getUtility
+from zope.interface import implements
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+from zope.publisher.interfaces import IRequest
+from zope.security import proxy
+from zope.security.management import queryInteraction
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.app.interfaces import IRelationshipStateContainer
+from schooltool.app.membership import URIMembership, URIGroup
+from schooltool.app.states import ACTIVE
+from schooltool.course.interfaces import ISection
+from schooltool.person.interfaces import IPersonFactory
+from schooltool.schoolyear.subscriber import ObjectEventAdapterSubscriber
+
+from schooltool.gradebook import interfaces
+from schooltool.gradebook.activity import ensureAtLeastOneWorksheet
+from schooltool.gradebook.matrix import queryIntId
+
+GRADEBOOK_SNAPSHOTS_KEY = 'schooltool.gradebook.snapshots'
+COLUMN_PREFERENCES_KEY = 'schooltool.gradebook.columnpreferences'
+SECTION_ROSTERS_KEY = 'schooltool.gradebook.rosters'
+
+_marker = object()
+
+
+class SectionRoster(object):
+    """The students of a section with their enrollment states."""
+    implements(interfaces.ISectionRoster)
+
+    def __init__(self, section):
+        self.section = section
+        self._links = {}
+        students = []
+        for link_info in section.members.all().relationships:
+            student = proxy.removeSecurityProxy(link_info.target)
+            students.append(student)
+            self._links[student] = link_info
+        self.students = tuple(students)
+        self._usernames = dict([(student.username, student)
+                                for student in students])
+        self._active = {}
+        self._state_titles = {}
+        self._sorting_keys = {}
+
+    def __contains__(self, student):
+        return proxy.removeSecurityProxy(student) in self._links
+
+    def getStudent(self, username):
+        """See interfaces.ISectionRoster"""
+        return self._usernames.get(username)
+
+    def getActiveStudents(self, date):
+        """See interfaces.ISectionRoster"""
+        try:
+            return self._active[date]
+        except KeyError:
+            active = self._active[date] = frozenset([
+                student for student, link_info in self._links.items()
+                if link_info.state.has(date=date, states=(ACTIVE,))])
+            return active
+
+    def getStudents(self, date=None):
+        """See interfaces.ISectionRoster"""
+        if date is None:
+            return self.students
+        active = self.getActiveStudents(date)
+        return tuple([student for student in self.students
+                      if student in active])
+
+    def _getAppStates(self):
+        app = ISchoolToolApplication(None)
+        return IRelationshipStateContainer(app)['section-membership']
+
+    def getStateTitle(self, student):
+        """See interfaces.ISectionRoster"""
+        student = proxy.removeSecurityProxy(student)
+        try:
+            return self._state_titles[student]
+        except KeyError:
+            pass
+        title = None
+        link_info = self._links.get(student)
+        if link_info is not None:
+            app_states = self._getAppStates()
+            today = link_info.state.today
+            if today is not None:
+                meaning, code = today
+                state = app_states.states.get(code)
+                if state is not None:
+                    title = state.title
+            else:
+                all = link_info.state.all()
+                if all:
+                    date, meaning, code = all[0]
+                    state = app_states.states.get(code)
+                    if state is not None:
+                        title = '%s - %s' % (state.title, date)
+        self._state_titles[student] = title
+        return title
+
+    def getSortingKey(self, student, collator):
+        """See interfaces.ISectionRoster"""
+        student = proxy.removeSecurityProxy(student)
+        keys = self._sorting_keys.setdefault(collator, {})
+        try:
+            return keys[student]
+        except KeyError:
+            factory = getUtility(IPersonFactory)
+            key = keys[student] = factory.getSortingKey(student, collator)
+            return key
+
+    def sorted(self, collator, students=None):
+        """See interfaces.ISectionRoster"""
+        if students is None:
+            students = self.students
+        return sorted([proxy.removeSecurityProxy(student)
+                       for student in students],
+                      key=lambda student: self.getSortingKey(student,
+                                                             collator))
+
+
+class GradebookSnapshot(object):
+    """The worksheets, activities and roster of a section."""
+    implements(interfaces.IGradebookSnapshot)
+
+    def __init__(self, section):
+        self.section = section
+        worksheets = interfaces.IActivities(section)
+        ensureAtLeastOneWorksheet(worksheets)
+        self.worksheets = tuple(worksheets.values())
+        self._activities = {}
+        for worksheet in self.worksheets:
+            self._getActivities(worksheet)
+        self.students = tuple(section.members.all())
+        self.roster = getSectionRoster(section)
+        self._students = frozenset(self.roster.students)
+        self.student_ids = frozenset(
+            [student_id for student_id in map(queryIntId, self._students)
+             if student_id is not None])
+        self._weights = {}
+        self._preferences = {}
+        self._journal_data = _marker
+
+    def _getActivities(self, worksheet):
+        worksheet = proxy.removeSecurityProxy(worksheet)
+        try:
+            return self._activities[worksheet]
+        except KeyError:
+            activities = tuple(worksheet.values())
+            names = dict([(activity.__name__, activity)
+                          for activity in activities])
+            scoresystems = dict([(activity.__name__,
+                                  getattr(activity, 'scoresystem', None))
+                                 for activity in activities])
+            result = self._activities[worksheet] = (activities, names,
+                                                    scoresystems)
+            return result
+
+    def hasStudent(self, student):
+        """See interfaces.IGradebookSnapshot"""
+        return proxy.removeSecurityProxy(student) in self._students
+
+    def getActivities(self, worksheet):
+        """See interfaces.IGradebookSnapshot"""
+        return self._getActivities(worksheet)[0]
+
+    def getActivity(self, worksheet, name):
+        """See interfaces.IGradebookSnapshot"""
+        return self._getActivities(worksheet)[1].get(name)
+
+    def getScoreSystem(self, activity):
+        """See interfaces.IGradebookSnapshot"""
+        activity = proxy.removeSecurityProxy(activity)
+        scoresystems = self._getActivities(activity.__parent__)[2]
+        return scoresystems.get(activity.__name__,
+                                getattr(activity, 'scoresystem', None))
+
+    def getCategoryWeights(self, worksheet):
+        """See interfaces.IGradebookSnapshot"""
+        worksheet = proxy.removeSecurityProxy(worksheet)
+        try:
+            weights = self._weights[worksheet]
+        except KeyError:
+            weights = {}
+            # XXX: move this to gradebook adapter for GenericWorksheet
+            if hasattr(worksheet, 'getCategoryWeights'):
+                weights = dict(worksheet.getCategoryWeights())
+            self._weights[worksheet] = weights
+        return dict(weights)
+
+    def getColumnPreferences(self, person):
+        """See interfaces.IGradebookSnapshot"""
+        person = proxy.removeSecurityProxy(person)
+        try:
+            preferences = self._preferences[person]
+        except KeyError:
+            ann = IAnnotations(person)
+            preferences = self._preferences[person] = ann.get(
+                COLUMN_PREFERENCES_KEY)
+        if preferences is None:
+            # Callers fill in and store new preferences
+            return PersistentDict()
+        return preferences
+
+    @property
+    def journal_data(self):
+        """See interfaces.IGradebookSnapshot"""
+        if self._journal_data is _marker:
+            self._journal_data = interfaces.ISectionJournalData(
+                self.section, None)
+        return self._journal_data
+
+
+def queryRequest():
+    """Get the request of the current interaction, None if there is none."""
+    interaction = queryInteraction()
+    if interaction is None:
+        return None
+    for participation in interaction.participations:
+        if IRequest.providedBy(participation):
+            return participation
+    return None
+
+
+def getRequestSnapshots(request):
+    annotations = getattr(request, 'annotations', None)
+    if annotations is None:
+        return None
+    return annotations.setdefault(GRADEBOOK_SNAPSHOTS_KEY, {})
+
+
+def getGradebookSnapshot(section):
+    """Get the snapshot of the section shared in the current request.
+
+    A new snapshot is built every time outside of requests.
+    """
+    section = proxy.removeSecurityProxy(section)
+    request = queryRequest()
+    snapshots = None
+    if request is not None:
+        snapshots = getRequestSnapshots(request)
+    if snapshots is None:
+        return GradebookSnapshot(section)
+    snapshot = snapshots.get(section)
+    if snapshot is None:
+        snapshot = snapshots[section] = GradebookSnapshot(section)
+    return snapshot
+
+
+def getSectionRoster(section):
+    """Get the roster of the section shared in the current request.
+
+    A new roster is built every time outside of requests.
+    """
+    section = proxy.removeSecurityProxy(section)
+    request = queryRequest()
+    annotations = getattr(request, 'annotations', None)
+    if annotations is None:
+        return SectionRoster(section)
+    rosters = annotations.setdefault(SECTION_ROSTERS_KEY, {})
+    roster = rosters.get(section)
+    if roster is None:
+        roster = rosters[section] = SectionRoster(section)
+    return roster
+
+
+def invalidateSectionRoster(event):
+    """Drop the roster and the snapshots of a section whose members change."""
+    if event.rel_type != URIMembership:
+        return
+    section = event[URIGroup]
+    if not ISection.providedBy(section):
+        return
+    request = queryRequest()
+    annotations = getattr(request, 'annotations', None)
+    if annotations is None:
+        return
+    rosters = annotations.get(SECTION_ROSTERS_KEY)
+    if rosters is not None:
+        rosters.pop(proxy.removeSecurityProxy(section), None)
+    snapshots = annotations.get(GRADEBOOK_SNAPSHOTS_KEY)
+    if snapshots is not None:
+        snapshots.pop(proxy.removeSecurityProxy(section), None)
+
+
+def invalidateGradebookSnapshots():
+    """Drop the snapshots of the current request."""
+    request = queryRequest()
+    if request is None:
+        return
+    annotations = getattr(request, 'annotations', None)
+    if annotations is not None:
+        annotations.pop(GRADEBOOK_SNAPSHOTS_KEY, None)
+
+
+class ActivityAddedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectAddedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        invalidateGradebookSnapshots()
+
+
+class ActivityRemovedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectRemovedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        invalidateGradebookSnapshots()
+
+
+class ActivityModifiedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectModifiedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        invalidateGradebookSnapshots()
+
+
+class WorksheetAddedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectAddedEvent, interfaces.IWorksheet)
+
+    def __call__(self):
+        invalidateGradebookSnapshots()
+
+
+class WorksheetRemovedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectRemovedEvent, interfaces.IWorksheet)
+
+    def __call__(self):
+        invalidateGradebookSnapshots()
+
+
+class WorksheetModifiedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectModifiedEvent, interfaces.IWorksheet)
+
+    def __call__(self):
+        invalidateGradebookSnapshots()
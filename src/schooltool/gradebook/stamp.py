@@ -0,0 +1,204 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Worksheet change stamps
+
+Every worksheet has a counter that goes up whenever something shown in its
+gradebook changes: grades, activities, category weights, the worksheets of
+the section, column preferences, the members of the section and their
+titles.  Custom score systems are edited without events, views add the
+versions of their records to the stamp (see getScoreSystemsVersion).  Views
+derive their ETags from it to answer conditional requests without building
+their tables.  The counter is a conflict-free Length, so that concurrent
+grading does not conflict on it.
+"""
+__docformat__ = 'reStructuredText'
+
+from BTrees.Length import Length
+
+from zope import annotation
+from zope.component import adapts
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+from zope.security import proxy
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.app.membership import URIMembership, URIGroup
+from schooltool.course.interfaces import ISection
+from schooltool.person.interfaces import IPerson
+from schooltool.requirement.interfaces import IScoreSystemContainer
+from schooltool.requirement.interfaces import IEvaluation, IEvaluations
+from schooltool.requirement.interfaces import IEvaluationsModifiedEvent
+from schooltool.schoolyear.subscriber import ObjectEventAdapterSubscriber
+
+from schooltool.gradebook import interfaces
+from schooltool.gradebook.linkgraph import queryDependentWorksheets
+
+WORKSHEET_CHANGE_STAMP_KEY = 'schooltool.gradebook.change_stamp'
+
+
+def getChangeStamp(worksheet):
+    """Return the change stamp of the worksheet, 0 if it never changed."""
+    worksheet = proxy.removeSecurityProxy(worksheet)
+    annotations = annotation.interfaces.IAnnotations(worksheet)
+    stamp = annotations.get(WORKSHEET_CHANGE_STAMP_KEY)
+    if stamp is None:
+        return 0
+    return stamp()
+
+
+def bumpChangeStamp(worksheet):
+    """Bump the change stamps of the worksheet and its dependents."""
+    worksheet = proxy.removeSecurityProxy(worksheet)
+    for worksheet in [worksheet] + queryDependentWorksheets(worksheet):
+        annotations = annotation.interfaces.IAnnotations(worksheet)
+        stamp = annotations.get(WORKSHEET_CHANGE_STAMP_KEY)
+        if stamp is None:
+            stamp = annotations[WORKSHEET_CHANGE_STAMP_KEY] = Length()
+        stamp.change(1)
+
+
+def bumpSectionChangeStamps(section):
+    """Bump the change stamps of all the worksheets of the section."""
+    activities = interfaces.IActivities(section, None)
+    if activities is None:
+        return
+    for worksheet in activities.values():
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            bumpChangeStamp(worksheet)
+
+
+def getScoreSystemsVersion():
+    """Return the versions of the records of the custom score systems."""
+    app = ISchoolToolApplication(None)
+    container = IScoreSystemContainer(app, None)
+    if container is None:
+        return ()
+    container = proxy.removeSecurityProxy(container)
+    return tuple([(name, getattr(scoresystem, '_p_serial', None))
+                  for name, scoresystem in sorted(container.items())])
+
+
+def bumpEvaluationChangeStamp(evaluation):
+    activity = evaluation.requirement
+    if interfaces.IActivity.providedBy(activity):
+        bumpChangeStamp(activity.__parent__)
+
+
+class EvaluationAddedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectAddedEvent, IEvaluation)
+
+    def __call__(self):
+        if IEvaluations.providedBy(self.event.newParent):
+            bumpEvaluationChangeStamp(self.object)
+
+
+class EvaluationRemovedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectRemovedEvent, IEvaluation)
+
+    def __call__(self):
+        if IEvaluations.providedBy(self.event.oldParent):
+            bumpEvaluationChangeStamp(self.object)
+
+
+class EvaluationsModifiedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IEvaluationsModifiedEvent, IEvaluations)
+
+    def __call__(self):
+        worksheets = set()
+        for evaluation in self.event.evaluations:
+            activity = evaluation.requirement
+            if interfaces.IActivity.providedBy(activity):
+                worksheets.add(activity.__parent__)
+        for worksheet in worksheets:
+            bumpChangeStamp(worksheet)
+
+
+class ActivityAddedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectAddedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        worksheet = self.event.newParent
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            bumpChangeStamp(worksheet)
+
+
+class ActivityRemovedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectRemovedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        worksheet = self.event.oldParent
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            bumpChangeStamp(worksheet)
+
+
+class ActivityModifiedSubscriber(ObjectEventAdapterSubscriber):
+    adapts(IObjectModifiedEvent, interfaces.IActivity)
+
+    def __call__(self):
+        worksheet = self.object.__parent__
+        if interfaces.IActivityWorksheet.providedBy(worksheet):
+            bumpChangeStamp(worksheet)
+
+
+class WorksheetSubscriberBase(ObjectEventAdapterSubscriber):
+    """Worksheets of a section show the titles of each other."""
+
+    @property
+    def container(self):
+        return self.object.__parent__
+
+    def __call__(self):
+        section = getattr(self.container, '__parent__', None)
+        if ISection.providedBy(section):
+            bumpSectionChangeStamps(section)
+
+
+class WorksheetAddedSubscriber(WorksheetSubscriberBase):
+    adapts(IObjectAddedEvent, interfaces.IActivityWorksheet)
+
+
+class WorksheetRemovedSubscriber(WorksheetSubscriberBase):
+    adapts(IObjectRemovedEvent, interfaces.IActivityWorksheet)
+
+    @property
+    def container(self):
+        return self.event.oldParent
+
+
+class WorksheetModifiedSubscriber(WorksheetSubscriberBase):
+    adapts(IObjectModifiedEvent, interfaces.IActivityWorksheet)
+
+
+def bumpMembershipChangeStamps(event):
+    if event.rel_type != URIMembership:
+        return
+    group = event[URIGroup]
+    if ISection.providedBy(group):
+        bumpSectionChangeStamps(group)
+
+
+class PersonModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Gradebooks of the sections of a student show the student's title."""
+    adapts(IObjectModifiedEvent, IPerson)
+
+    def __call__(self):
+        for group in self.object.groups:
+            if ISection.providedBy(group):
+                bumpSectionChangeStamps(group)
@@ -22,7 +22,10 @@ Stubs for Gradebook-related Tests
 from decimal import Decimal
 import datetime
 import zope.interface
+from zope.annotation.interfaces import IAttributeAnnotatable
+from zope.intid.interfaces import IIntIds
 
+from schooltool.schoolyear.interfaces import ISchoolYear
 from schooltool.term.interfaces import IDateManager
 from schooltool.gradebook import interfaces
 
@@ -129,3 +132,40 @@ class DateManagerStub(object):
     def __init__(self):
         self.current_term = None
         self.today = datetime.date(2011, 1, 23)
+
+
+class IntIdsStub(object):
+    """Int ids of objects that are not stored in a database."""
+
+    zope.interface.implements(IIntIds)
+
+    def __init__(self):
+        self.ids = {}
+        self.objects = {}
+
+    def register(self, obj):
+        uid = self.ids.get(id(obj))
+        if uid is None:
+            uid = self.ids[id(obj)] = len(self.ids) + 1
+            self.objects[uid] = obj
+        return uid
+
+    def getId(self, obj):
+        return self.ids[id(obj)]
+
+    def queryId(self, obj, default=None):
+        return self.ids.get(id(obj), default)
+
+    def getObject(self, uid):
+        return self.objects[uid]
+
+    def queryObject(self, uid, default=None):
+        return self.objects.get(uid, default)
+
+
+class SchoolYearStub(object):
+
+    zope.interface.implements(ISchoolYear, IAttributeAnnotatable)
+
+    def __init__(self, title):
+        self.title = title
@@ -27,6 +27,8 @@ from zope.component import provideAdapter, provideUtility
 from zope.container.btree import BTreeContainer
 from zope.interface import classImplements
 from zope.interface import Interface
+from zope.intid import IntIds
+from zope.intid.interfaces import IIntIds
 
 from schooltool.course.interfaces import ICourse, ISection
 from schooltool.person.person import Person
@@ -40,6 +42,7 @@ from schooltool.testing.stubs import AppStub
 
 from schooltool.gradebook import activity, gradebook, interfaces
 from schooltool.gradebook import category
+from schooltool.gradebook import preferences
 from schooltool.gradebook.tests import stubs
 
 
@@ -61,6 +64,7 @@ def setUp(test):
         (ICourse,), interfaces.ICourseDeployedWorksheets)
 
     provideAdapter(gradebook.Gradebook)
+    provideAdapter(preferences.GradebookPreferences)
 
     provideAdapter(category.getCategories)
 
@@ -81,6 +85,7 @@ def setUp(test):
     provideAdapter(gradebook.getWorksheetAverageScore)  
 
     provideUtility(stubs.DateManagerStub(), IDateManager, '')
+    provideUtility(IntIds(), IIntIds)
     zcml = getIntegrationTestZCML()
     zcml.include('schooltool.schoolyear', file='schoolyear.zcml')
     app = test.globs['app'] = AppStub()
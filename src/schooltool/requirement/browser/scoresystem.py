@@ -21,7 +21,9 @@ __docformat__ = 'reStructuredText'
 
 from decimal import Decimal
 
+import zope.event
 import zope.formlib
+import zope.lifecycleevent
 import zope.schema
 from zope.app.form import utility
 from zope.browserpage import ViewPageTemplateFile
@@ -219,6 +221,9 @@ class CustomScoreSystemAddView(BrowserView):
         target._bestScore = target.scores[0][0]
         target._minPassingScore = self.request.get('minScore')
         target._isMaxPassingScore = self.request.get('minMax') == 'max'
+        if getattr(target, '__parent__', None) is not None:
+            # Grades computed with the old scores have to be recomputed
+            zope.event.notify(zope.lifecycleevent.ObjectModifiedEvent(target))
 
     @property
     def title_value(self):
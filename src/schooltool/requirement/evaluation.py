@@ -18,18 +18,22 @@ Level-related Tests
 
 __docformat__ = 'restructuredtext'
 
+import calendar
 import datetime
+import itertools
 import persistent
-from BTrees.OOBTree import OOBTree
+from BTrees.IOBTree import IOBTree
+from BTrees.LOBTree import LOBTree
 
 import zope.event
 from zope.interface import implements
-from zope.component import adapts
+from zope.component import adapts, getUtility
 from zope.annotation.interfaces import IAnnotations
-from zope.container.contained import Contained, containedEvent
-from zope.lifecycleevent import ObjectRemovedEvent
+from zope.container.contained import Contained, contained, containedEvent
+from zope.lifecycleevent import ObjectRemovedEvent, ObjectModifiedEvent
+from zope.intid.interfaces import IIntIds
 from zope.location import location
-from zope.keyreference.interfaces import IKeyReference
+from zope.security.proxy import removeSecurityProxy
 from zope.traversing.api import getParent, getName
 
 from schooltool.requirement import interfaces
@@ -50,14 +54,131 @@ def getRequirementList(req, recurse=True):
     return result
 
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def timestamp(time):
+    """Convert a naive UTC datetime to microseconds since the epoch."""
+    return calendar.timegm(time.utctimetuple()) * 1000000 + time.microsecond
+
+
+def fromTimestamp(stamp):
+    """Convert microseconds since the epoch to a naive UTC datetime."""
+    return EPOCH + datetime.timedelta(microseconds=stamp)
+
+
+class EvaluationHistory(persistent.Persistent):
+    """Time-ordered history of evaluations of a single requirement.
+
+    Entries are kept in a ``LOBTree`` keyed by a timestamp, so the history
+    can be paged through without loading all of it.  The entries can be
+    evaluations or ``None`` for removed evaluations.
+    """
+
+    def __init__(self):
+        self._entries = LOBTree()
+
+    def append(self, evaluation, time=None):
+        if time is None:
+            time = datetime.datetime.utcnow()
+        key = timestamp(time)
+        if self._entries:
+            key = max(key, self._entries.maxKey() + 1)
+        self._entries[key] = evaluation
+
+    def __nonzero__(self):
+        return bool(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def iterNewest(self):
+        """Iterate over the entries starting with the most recent one."""
+        if not self._entries:
+            return
+        key = self._entries.maxKey()
+        while True:
+            yield self._entries[key]
+            try:
+                key = self._entries.maxKey(key - 1)
+            except ValueError:
+                return
+
+    def iterPage(self, reverse=False, start=0, count=None):
+        """Iterate over a page of the entries.
+
+        The first ``start`` entries are skipped and at most ``count``
+        entries are returned, oldest first or most recent first if
+        ``reverse`` is set.  Only the buckets holding these entries are
+        loaded.
+        """
+        if reverse:
+            entries = self.iterNewest()
+        else:
+            entries = iter(self._entries.values())
+        stop = None if count is None else start + count
+        return itertools.islice(entries, start, stop)
+
+
+class EvaluationRecord(object):
+    """Compact stored form of an evaluation.
+
+    Records are pickled as a plain tuple of the requirement, the score
+    system, the value, the evaluator and the time as an integer.  Global
+    and custom score systems are pickled by reference.
+    """
+    __slots__ = ('requirement', 'scoreSystem', 'value', 'evaluator', 'time')
+
+    def __init__(self, requirement, scoreSystem, value, evaluator, time):
+        self.requirement = requirement
+        self.scoreSystem = scoreSystem
+        self.value = value
+        self.evaluator = evaluator
+        self.time = time
+
+    def __reduce__(self):
+        return (EvaluationRecord,
+                (self.requirement, self.scoreSystem, self.value,
+                 self.evaluator, self.time))
+
+    def __cmp__(self, other):
+        # Records are compared by value, so that BTree buckets can tell
+        # which records concurrent transactions changed and merge them.
+        if not isinstance(other, EvaluationRecord):
+            return cmp(id(self), id(other))
+        return cmp(self.__reduce__()[1], other.__reduce__()[1])
+
+
+def makeRecord(evaluation):
+    """Get the record to store for an evaluation."""
+    if evaluation is None or isinstance(evaluation, EvaluationRecord):
+        return evaluation
+    if isinstance(evaluation, StoredEvaluation):
+        return evaluation._record
+    time = getattr(evaluation, 'time', None)
+    if time is not None:
+        time = timestamp(time)
+    return EvaluationRecord(evaluation.requirement, evaluation.scoreSystem,
+                            evaluation.value, evaluation.evaluator, time)
+
+
+class EvaluationsModifiedEvent(ObjectModifiedEvent):
+    """A batch of evaluations was added."""
+    implements(interfaces.IEvaluationsModifiedEvent)
+
+    def __init__(self, object, evaluations):
+        super(EvaluationsModifiedEvent, self).__init__(object)
+        self.evaluations = evaluations
+
+
 class Evaluations(persistent.Persistent, Contained):
     """Evaluations mapping.
 
-    This particular implementation uses the ``zope.keyreference`` package
-    to generate the keys of the requirements. Any key that is passed in could
-    be the requirement or the ``IKeyReference`` of the requirement. This
-    implementation will always convert the key to provide ``IKeyReference``
-    before treating it as a true key.
+    This particular implementation keys the evaluations by the int ids of
+    the requirements.  Any key that is passed in is the requirement itself,
+    it is converted to its int id before treating it as a true key.  The
+    requirement is registered in the int ids utility when an evaluation is
+    stored for it, if that was not done yet.
 
     Another feature of this implementation is that if you set an evaluation
     for a requirement that has already an evaluation, then the old evaluation
@@ -71,30 +192,56 @@ class Evaluations(persistent.Persistent, Contained):
     def __init__(self, items=None):
         super(Evaluations, self).__init__()
 
-        self._btree = OOBTree()
+        self._btree = IOBTree()
+        # Created up front, so that concurrent transactions adding history
+        # don't both write the evaluations object
+        self._history = IOBTree()
         for name, value in items or []:
             self[name] = value
 
+    def _queryKey(self, requirement):
+        intids = getUtility(IIntIds)
+        return intids.queryId(removeSecurityProxy(requirement))
+
+    def _getKey(self, requirement):
+        key = self._queryKey(requirement)
+        if key is None:
+            raise KeyError(requirement)
+        return key
+
+    def _makeKey(self, requirement):
+        intids = getUtility(IIntIds)
+        return intids.register(removeSecurityProxy(requirement))
+
+    def _wrap(self, stored):
+        # Evaluations not converted to records yet are returned as they are
+        if isinstance(stored, EvaluationRecord):
+            return StoredEvaluation(stored, self)
+        return stored
+
     def __getitem__(self, key):
         """See zope.interface.common.mapping.IItemMapping"""
-        return self._btree[IKeyReference(key)]
+        return self._wrap(self._btree[self._getKey(key)])
 
     def __delitem__(self, key):
         """See zope.interface.common.mapping.IWriteMapping"""
         value = self[key]
-        del self._btree[IKeyReference(key)]
+        del self._btree[self._getKey(key)]
         self.appendToHistory(key, value)
         event = ObjectRemovedEvent(value, self)
         zope.event.notify(event)
 
-    def __setitem__(self, requirement, value):
-        """See zope.interface.common.mapping.IWriteMapping"""
-        key = IKeyReference(requirement)
+    def _store(self, requirement, value):
+        key = self._makeKey(requirement)
         if (key in self._btree or
-            self.getHistory(requirement)):
+            self.hasHistory(requirement)):
             current = self._btree.get(key, None)
             self.appendToHistory(requirement, current)
-        self._btree[key] = value
+        self._btree[key] = makeRecord(value)
+
+    def __setitem__(self, requirement, value):
+        """See zope.interface.common.mapping.IWriteMapping"""
+        self._store(requirement, value)
         value, event = containedEvent(value, self)
         zope.event.notify(event)
 
@@ -107,13 +254,16 @@ class Evaluations(persistent.Persistent, Contained):
 
     def __contains__(self, key):
         """See zope.interface.common.mapping.IReadMapping"""
-        return IKeyReference(key) in self._btree
+        key = self._queryKey(key)
+        return key is not None and key in self._btree
 
     def keys(self):
         """See zope.interface.common.mapping.IEnumerableMapping"""
         # For now I decided to return the activities (as I think it is more
-        # natural), though they are not the true keys as we know
-        return [key() for key in self._btree.keys()]
+        # natural), though they are not the true keys as we know.  They are
+        # taken from the evaluations, so the int ids don't have to be
+        # resolved.
+        return [value.requirement for value in self._btree.values()]
 
     def __iter__(self):
         """See zope.interface.common.mapping.IEnumerableMapping"""
@@ -121,11 +271,12 @@ class Evaluations(persistent.Persistent, Contained):
 
     def values(self):
         """See zope.interface.common.mapping.IEnumerableMapping"""
-        return self._btree.values()
+        return [self._wrap(value) for value in self._btree.values()]
 
     def items(self):
         """See zope.interface.common.mapping.IEnumerableMapping"""
-        return [(key(), value) for key, value in self._btree.items()]
+        return [(value.requirement, self._wrap(value))
+                for value in self._btree.values()]
 
     def __len__(self):
         """See zope.interface.common.mapping.IEnumerableMapping"""
@@ -133,41 +284,75 @@ class Evaluations(persistent.Persistent, Contained):
 
     def appendToHistory(self, requirement, evaluation):
         if self._history is None:
-            self._history = OOBTree()
-        key = IKeyReference(requirement)
+            self._history = IOBTree()
+        key = self._makeKey(requirement)
         if key not in self._history:
-            self._history[key] = persistent.list.PersistentList()
-        self._history[key].append(evaluation)
+            self._history[key] = EvaluationHistory()
+        self._history[key].append(makeRecord(evaluation))
 
-    def getHistory(self, requirement):
+    def _getHistory(self, requirement):
         if self._history is None:
-            return []
-        key = IKeyReference(requirement)
-        history = list(self._history.get(key, []))
-        return history
+            return None
+        key = self._queryKey(requirement)
+        if key is None:
+            return None
+        return self._history.get(key)
+
+    def hasHistory(self, requirement):
+        """See interfaces.IEvaluations"""
+        return bool(self._getHistory(requirement))
+
+    def iterHistory(self, requirement, reverse=False, start=0, count=None):
+        """See interfaces.IEvaluations"""
+        history = self._getHistory(requirement)
+        if history is None:
+            return iter(())
+        entries = history.iterPage(reverse=reverse, start=start, count=count)
+        return (self._wrap(entry) for entry in entries)
+
+    def getHistory(self, requirement):
+        return list(self.iterHistory(requirement))
 
     def addEvaluation(self, evaluation):
         """See interfaces.IEvaluations"""
         self[evaluation.requirement] = evaluation
 
-    def getEvaluationsForRequirement(self, req, recurse=True):
+    def addEvaluations(self, evaluations):
         """See interfaces.IEvaluations"""
-        requirements = getRequirementList(req, recurse)
-        result = [(name, ev)
-                  for name, ev in self.items()
-                  if ev.requirement in requirements]
-        result = Evaluations(result)
+        added = []
+        for evaluation in evaluations:
+            self._store(evaluation.requirement, evaluation)
+            added.append(contained(evaluation, self))
+        if added:
+            zope.event.notify(EvaluationsModifiedEvent(self, added))
+
+    def _subset(self, items):
+        """Make evaluations of the given (key, evaluation) items.
+
+        The evaluations are not moved to the new object, so no events are
+        sent.
+        """
+        result = Evaluations()
+        for key, evaluation in items:
+            result._btree[key] = evaluation
         location.locate(result, getParent(self), getName(self))
         return result
 
+    def getEvaluationsForRequirement(self, req, recurse=True):
+        """See interfaces.IEvaluations"""
+        keys = set()
+        for requirement in getRequirementList(req, recurse):
+            key = self._queryKey(requirement)
+            if key is not None:
+                keys.add(key)
+        return self._subset([(key, self._btree[key])
+                             for key in keys if key in self._btree])
+
     def getEvaluationsOfEvaluator(self, evaluator):
         """See interfaces.IEvaluations"""
-        result = [(name, ev)
-                  for name, ev in self.items()
-                  if ev.evaluator == evaluator]
-        result = Evaluations(result)
-        location.locate(result, getParent(self), getName(self))
-        return result
+        return self._subset([(key, ev)
+                             for key, ev in self._btree.items()
+                             if ev.evaluator == evaluator])
 
     def __repr__(self):
         try:
@@ -229,6 +414,51 @@ class Evaluation(Contained, Score):
                                           self.requirement, self.value)
 
 
+class StoredEvaluation(Contained):
+    """An evaluation read from its record."""
+    implements(interfaces.IEvaluation)
+
+    def __init__(self, record, parent):
+        self._record = record
+        self.__parent__ = parent
+
+    @property
+    def requirement(self):
+        return self._record.requirement
+
+    @property
+    def scoreSystem(self):
+        return self._record.scoreSystem
+
+    @property
+    def value(self):
+        return self._record.value
+
+    @property
+    def evaluator(self):
+        return self._record.evaluator
+
+    @property
+    def time(self):
+        if self._record.time is None:
+            return None
+        return fromTimestamp(self._record.time)
+
+    @property
+    def evaluatee(self):
+        try:
+            return getParent(getParent(self))
+        except TypeError:
+            raise ValueError('Evaluation is not yet assigned to a evaluatee')
+
+    def __nonzero__(self):
+        return self.value is not UNSCORED
+
+    def __repr__(self):
+        return '<Evaluation for %r, value=%r>' % (self.requirement,
+                                                  self.value)
+
+
 class AbstractQueryAdapter(object):
 
     adapts(interfaces.IEvaluations)
@@ -22,6 +22,6 @@ Generations for database version upgrades.
 from zope.app.generations.generations import SchemaManager
 
 schemaManager = SchemaManager(
-    minimum_generation=1,
-    generation=1,
+    minimum_generation=6,
+    generation=6,
     package_name='schooltool.requirement.generations')
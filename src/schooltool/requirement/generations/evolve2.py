@@ -0,0 +1,59 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evolve database to generation 2.
+
+Store the history of evaluations in time ordered buckets.
+"""
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import findObjectsProviding, getRootFolder
+from zope.component.hooks import getSite, setSite
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+from schooltool.requirement.evaluation import EvaluationHistory
+
+
+def evolveHistory(evaluations):
+    if evaluations._history is None:
+        return
+    for key, records in list(evaluations._history.items()):
+        if isinstance(records, EvaluationHistory):
+            continue
+        history = EvaluationHistory()
+        time = None
+        for record in records:
+            time = getattr(record, 'time', None) or time
+            history.append(record, time)
+        evaluations._history[key] = history
+
+
+def evolve(context):
+    root = getRootFolder(context)
+
+    old_site = getSite()
+    apps = findObjectsProviding(root, ISchoolToolApplication)
+    for app in apps:
+        setSite(app)
+        for person in app['persons'].values():
+            evaluations = IAnnotations(person).get(EVALUATIONS_KEY)
+            if evaluations is not None:
+                evolveHistory(evaluations)
+
+    setSite(old_site)
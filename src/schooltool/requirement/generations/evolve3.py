@@ -0,0 +1,80 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evolve database to generation 3.
+
+Key the evaluations and their history by the int ids of the requirements.
+
+The evaluations are converted in batches, committing after each batch, so
+that a big database does not have to fit into memory at once.  Converted
+evaluations are skipped, so an interrupted evolution can simply be run again.
+"""
+
+import transaction
+from BTrees.IOBTree import IOBTree
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import findObjectsProviding, getRootFolder
+from zope.component import getUtility
+from zope.component.hooks import getSite, setSite
+from zope.intid.interfaces import IIntIds
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+
+
+BATCH_SIZE = 500
+
+
+def convertBTree(btree, intids):
+    result = IOBTree()
+    for keyref, value in btree.items():
+        result[intids.register(keyref())] = value
+    return result
+
+
+def evolveEvaluations(evaluations, intids):
+    """Convert the evaluations, return False if they were converted already."""
+    if isinstance(evaluations._btree, IOBTree):
+        return False
+    evaluations._btree = convertBTree(evaluations._btree, intids)
+    if evaluations._history is not None:
+        evaluations._history = convertBTree(evaluations._history, intids)
+    return True
+
+
+def evolve(context):
+    root = getRootFolder(context)
+
+    old_site = getSite()
+    apps = findObjectsProviding(root, ISchoolToolApplication)
+    for app in apps:
+        setSite(app)
+        intids = getUtility(IIntIds)
+        converted = 0
+        for person in app['persons'].values():
+            evaluations = IAnnotations(person).get(EVALUATIONS_KEY)
+            if evaluations is None:
+                continue
+            if evolveEvaluations(evaluations, intids):
+                converted += 1
+            if converted >= BATCH_SIZE:
+                transaction.commit()
+                converted = 0
+
+    setSite(old_site)
@@ -0,0 +1,56 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evolve database to generation 4.
+
+Build the evaluation index.
+"""
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import findObjectsProviding, getRootFolder
+from zope.component.hooks import getSite, setSite
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+from schooltool.requirement.index import getEvaluationIndex, queryIntId
+
+
+def buildEvaluationIndex(app):
+    index = getEvaluationIndex(app)
+    index.clear()
+    for person in app['persons'].values():
+        evaluations = IAnnotations(person).get(EVALUATIONS_KEY)
+        person_id = queryIntId(person)
+        if evaluations is None or person_id is None:
+            continue
+        for evaluation in evaluations.values():
+            requirement_id = queryIntId(evaluation.requirement)
+            if requirement_id is not None:
+                index.index(person_id, requirement_id, evaluation)
+
+
+def evolve(context):
+    root = getRootFolder(context)
+
+    old_site = getSite()
+    apps = findObjectsProviding(root, ISchoolToolApplication)
+    for app in apps:
+        setSite(app)
+        buildEvaluationIndex(app)
+
+    setSite(old_site)
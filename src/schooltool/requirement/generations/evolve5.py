@@ -0,0 +1,79 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evolve database to generation 5.
+
+Store evaluations and their history as compact evaluation records.
+
+Like generation 3, the evaluations are converted in batches and converted
+evaluations are skipped, so an interrupted evolution can be run again.
+"""
+
+import transaction
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import findObjectsProviding, getRootFolder
+from zope.component.hooks import getSite, setSite
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+from schooltool.requirement.evaluation import EvaluationRecord, makeRecord
+
+
+BATCH_SIZE = 500
+
+
+def convertValues(btree):
+    converted = False
+    for key, value in list(btree.items()):
+        if value is None or isinstance(value, EvaluationRecord):
+            continue
+        btree[key] = makeRecord(value)
+        converted = True
+    return converted
+
+
+def evolveEvaluations(evaluations):
+    """Convert the evaluations, return False if they were converted already."""
+    converted = convertValues(evaluations._btree)
+    if evaluations._history is not None:
+        for history in evaluations._history.values():
+            if convertValues(history._entries):
+                converted = True
+    return converted
+
+
+def evolve(context):
+    root = getRootFolder(context)
+
+    old_site = getSite()
+    apps = findObjectsProviding(root, ISchoolToolApplication)
+    for app in apps:
+        setSite(app)
+        converted = 0
+        for person in app['persons'].values():
+            evaluations = IAnnotations(person).get(EVALUATIONS_KEY)
+            if evaluations is None:
+                continue
+            if evolveEvaluations(evaluations):
+                converted += 1
+            if converted >= BATCH_SIZE:
+                transaction.commit()
+                converted = 0
+
+    setSite(old_site)
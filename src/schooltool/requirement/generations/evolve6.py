@@ -0,0 +1,58 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evolve database to generation 6.
+
+Create the history trees of evaluations that have none yet, so that
+concurrent transactions storing history for different requirements of a
+person don't both write the evaluations object.
+"""
+
+import transaction
+
+from BTrees.IOBTree import IOBTree
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import findObjectsProviding, getRootFolder
+from zope.component.hooks import getSite, setSite
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+
+
+BATCH_SIZE = 500
+
+
+def evolve(context):
+    root = getRootFolder(context)
+
+    old_site = getSite()
+    apps = findObjectsProviding(root, ISchoolToolApplication)
+    for app in apps:
+        setSite(app)
+        converted = 0
+        for person in app['persons'].values():
+            evaluations = IAnnotations(person).get(EVALUATIONS_KEY)
+            if evaluations is None or evaluations._history is not None:
+                continue
+            evaluations._history = IOBTree()
+            converted += 1
+            if converted >= BATCH_SIZE:
+                transaction.commit()
+                converted = 0
+
+    setSite(old_site)
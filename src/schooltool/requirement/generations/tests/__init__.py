@@ -10,6 +10,8 @@ from zope.app.publication.zopepublication import ZopePublication
 from zope.app.testing.setup import setUpAnnotations
 from zope.component import provideAdapter, provideUtility
 from zope.interface import implements
+from zope.intid import IntIds
+from zope.intid.interfaces import IIntIds
 
 from schooltool.app.app import SchoolToolApplication
 from schooltool.term.interfaces import IDateManager
@@ -67,4 +69,5 @@ def provideAdapters():
 
 def provideUtilities():
     provideUtility(DateManagerStub(), IDateManager, '')
+    provideUtility(IntIds(), IIntIds)
 
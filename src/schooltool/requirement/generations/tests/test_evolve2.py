@@ -0,0 +1,116 @@
+# coding=UTF8
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Unit tests for schooltool.requirement.generations.evolve2
+"""
+
+import datetime
+import unittest, doctest
+
+from persistent.list import PersistentList
+from BTrees.OOBTree import OOBTree
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.keyreference.interfaces import IKeyReference
+from zope.site import LocalSiteManager
+
+from schooltool.person.person import PersonContainer, Person
+from schooltool.requirement.evaluation import Evaluations, Evaluation
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+from schooltool.requirement.requirement import Requirement
+from schooltool.requirement.scoresystem import PassFail
+from schooltool.requirement.generations.tests import (
+    ContextStub, provideAdapters, provideUtilities)
+from schooltool.requirement.generations.evolve2 import evolve
+
+
+def doctest_evolve2():
+    """Evolution to generation 2.
+
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+
+    Let's set up a person with some evaluation history stored the old way,
+    in a list.
+
+        >>> app['persons'] = PersonContainer()
+        >>> person = app['persons']['student'] = Person('student')
+        >>> evaluations = IAnnotations(person)[EVALUATIONS_KEY] = Evaluations()
+
+        >>> req = Requirement(u'Essay')
+        >>> def evaluation(value, day):
+        ...     result = Evaluation(req, PassFail, value, 'teacher')
+        ...     result.time = datetime.datetime(2014, 9, day, 10, 0)
+        ...     return result
+
+        >>> evaluations[req] = evaluation('Pass', 3)
+        >>> old = [evaluation('Fail', 1), None, evaluation('Pass', 2)]
+        >>> evaluations._history = OOBTree()
+        >>> evaluations._history[IKeyReference(req)] = PersistentList(old)
+
+        >>> evolve(context)
+
+    The history is kept in time order.
+
+        >>> history = evaluations._history[IKeyReference(req)]
+        >>> history
+        <schooltool.requirement.evaluation.EvaluationHistory object at ...>
+        >>> list(history) == old
+        True
+        >>> list(history.iterNewest()) == old[::-1]
+        True
+        >>> epoch = datetime.datetime(1970, 1, 1)
+        >>> [epoch + datetime.timedelta(microseconds=key)
+        ...  for key in history._entries.keys()]
+        [datetime.datetime(2014, 9, 1, 10, 0),
+         datetime.datetime(2014, 9, 1, 10, 0, 0, 1),
+         datetime.datetime(2014, 9, 2, 10, 0)]
+
+    Running the evolution again changes nothing.
+
+        >>> evolve(context)
+        >>> evaluations._history[IKeyReference(req)] is history
+        True
+
+    """
+
+
+def setUp(test):
+    setup.placefulSetUp()
+    setup.setUpTraversal()
+    provideAdapters()
+    provideUtilities()
+
+
+def tearDown(test):
+    setup.placefulTearDown()
+
+
+def test_suite():
+    optionflags = (doctest.ELLIPSIS |
+                   doctest.NORMALIZE_WHITESPACE)
+    return doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                                optionflags=optionflags)
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
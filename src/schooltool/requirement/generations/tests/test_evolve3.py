@@ -0,0 +1,131 @@
+# coding=UTF8
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for schooltool.requirement.generations.evolve3
+"""
+
+import unittest, doctest
+
+from BTrees.OOBTree import OOBTree
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.component import getUtility
+from zope.intid.interfaces import IIntIds
+from zope.keyreference.interfaces import IKeyReference
+from zope.site import LocalSiteManager
+
+from schooltool.person.person import PersonContainer, Person
+from schooltool.requirement.evaluation import Evaluations, Evaluation
+from schooltool.requirement.evaluation import EvaluationHistory
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+from schooltool.requirement.requirement import Requirement
+from schooltool.requirement.scoresystem import PassFail
+from schooltool.requirement.generations.tests import (
+    ContextStub, provideAdapters, provideUtilities)
+from schooltool.requirement.generations import evolve3
+from schooltool.requirement.generations.evolve3 import evolve
+
+
+def doctest_evolve3():
+    """Evolution to generation 3.
+
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+
+    Let's set up a few persons with evaluations keyed by key references,
+    the old way.
+
+        >>> essay = Requirement(u'Essay')
+        >>> quiz = Requirement(u'Quiz')
+        >>> intids = getUtility(IIntIds)
+        >>> quiz_id = intids.register(quiz)
+
+        >>> def oldEvaluations(person):
+        ...     evaluations = Evaluations()
+        ...     IAnnotations(person)[EVALUATIONS_KEY] = evaluations
+        ...     evaluations._btree = OOBTree()
+        ...     for req in (essay, quiz):
+        ...         evaluations._btree[IKeyReference(req)] = Evaluation(
+        ...             req, PassFail, 'Pass', 'teacher')
+        ...     evaluations._history = OOBTree()
+        ...     history = evaluations._history[IKeyReference(quiz)] = \\
+        ...         EvaluationHistory()
+        ...     history.append(None)
+        ...     return evaluations
+
+        >>> app['persons'] = PersonContainer()
+        >>> for name in ['john', 'pete', 'mary']:
+        ...     app['persons'][name] = Person(name)
+        ...     evaluations = oldEvaluations(app['persons'][name])
+
+    We'll convert the evaluations in batches of two.
+
+        >>> evolve3.BATCH_SIZE = 2
+        >>> evolve(context)
+
+    The evaluations are now keyed by int ids.  Requirements that were
+    not registered in the int ids utility yet get registered.
+
+        >>> evaluations = IAnnotations(app['persons']['john'])[EVALUATIONS_KEY]
+        >>> essay_id = intids.getId(essay)
+        >>> sorted(evaluations._btree.keys()) == sorted([essay_id, quiz_id])
+        True
+        >>> evaluations[quiz]
+        <Evaluation for Requirement(u'Quiz'), value='Pass'>
+        >>> sorted(evaluations.keys(), key=lambda req: req.title)
+        [Requirement(u'Essay'), Requirement(u'Quiz')]
+        >>> list(evaluations._history.keys()) == [quiz_id]
+        True
+        >>> evaluations.getHistory(quiz)
+        [None]
+
+    Running the evolution again (for example, after it was interrupted)
+    skips the evaluations that are already converted.
+
+        >>> btree = evaluations._btree
+        >>> evolve(context)
+        >>> evaluations._btree is btree
+        True
+
+    """
+
+
+def setUp(test):
+    setup.placefulSetUp()
+    setup.setUpTraversal()
+    provideAdapters()
+    provideUtilities()
+
+
+def tearDown(test):
+    evolve3.BATCH_SIZE = 500
+    setup.placefulTearDown()
+
+
+def test_suite():
+    optionflags = (doctest.ELLIPSIS |
+                   doctest.NORMALIZE_WHITESPACE)
+    return doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                                optionflags=optionflags)
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
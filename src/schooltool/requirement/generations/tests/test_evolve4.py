@@ -0,0 +1,143 @@
+# coding=UTF8
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for schooltool.requirement.generations.evolve4
+"""
+
+import datetime
+import unittest, doctest
+
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.component import getUtility, provideAdapter
+from zope.interface import Interface
+from zope.intid.interfaces import IIntIds
+from zope.site import LocalSiteManager
+
+from schooltool.person.person import PersonContainer, Person
+from schooltool.requirement.evaluation import Evaluation
+from schooltool.requirement.evaluation import getEvaluations
+from schooltool.requirement.index import getEvaluationIndex
+from schooltool.requirement.interfaces import IEvaluations
+from schooltool.requirement.requirement import Requirement
+from schooltool.requirement.scoresystem import PassFail
+from schooltool.requirement.generations.tests import (
+    ContextStub, provideAdapters, provideUtilities)
+from schooltool.requirement.generations.evolve4 import evolve
+
+
+def doctest_evolve4():
+    """Evolution to generation 4.
+
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+        >>> intids = getUtility(IIntIds)
+
+    Let's set up a few persons evaluated by two teachers.
+
+        >>> essay = Requirement(u'Essay')
+        >>> quiz = Requirement(u'Quiz')
+
+        >>> app['persons'] = PersonContainer()
+        >>> def evaluate(name, requirement, evaluator, day):
+        ...     person = app['persons'].get(name)
+        ...     if person is None:
+        ...         person = app['persons'][name] = Person(name)
+        ...         ignore = intids.register(person)
+        ...     evaluation = Evaluation(requirement, PassFail, 'Pass', evaluator)
+        ...     evaluation.time = datetime.datetime(2014, 9, day, 10, 0)
+        ...     IEvaluations(person)[requirement] = evaluation
+
+        >>> evaluate('john', essay, 'smith', 1)
+        >>> evaluate('john', quiz, 'jones', 8)
+        >>> evaluate('pete', essay, 'smith', 2)
+        >>> evaluate('pete', quiz, 'smith', 9)
+        >>> evaluate('mary', quiz, 'jones', 10)
+
+        >>> evolve(context)
+
+    The evaluations can now be searched by evaluator.
+
+        >>> index = getEvaluationIndex(app)
+        >>> def names(result):
+        ...     return sorted([(evaluatee.username, evaluation.requirement.title)
+        ...                    for evaluatee, evaluation in result.items()])
+
+        >>> result = index.search(evaluator='smith')
+        >>> len(result)
+        3
+        >>> names(result)
+        [('john', u'Essay'), ('pete', u'Essay'), ('pete', u'Quiz')]
+
+    By time.
+
+        >>> names(index.search(start=datetime.datetime(2014, 9, 8),
+        ...                    end=datetime.datetime(2014, 9, 9, 23, 59)))
+        [('john', u'Quiz'), ('pete', u'Quiz')]
+
+    Or both, for example to find the grades entered by a teacher in a week.
+
+        >>> names(index.search(evaluator='jones',
+        ...                    start=datetime.datetime(2014, 9, 8),
+        ...                    end=datetime.datetime(2014, 9, 14)))
+        [('john', u'Quiz'), ('mary', u'Quiz')]
+
+    The search can also be restricted to one person.
+
+        >>> names(index.search(evaluator='smith',
+        ...                    evaluatee_id=intids.getId(app['persons']['pete'])))
+        [('pete', u'Essay'), ('pete', u'Quiz')]
+
+    Indexing an evaluation again replaces it.
+
+        >>> evaluation = Evaluation(essay, PassFail, 'Fail', 'jones')
+        >>> index.index(intids.getId(app['persons']['john']),
+        ...             intids.getId(essay), evaluation)
+        >>> names(index.search(evaluator='smith'))
+        [('pete', u'Essay'), ('pete', u'Quiz')]
+
+        >>> index.unindex(intids.getId(app['persons']['john']),
+        ...               intids.getId(essay))
+        >>> names(index.search(evaluator='jones'))
+        [('john', u'Quiz'), ('mary', u'Quiz')]
+
+    """
+
+
+def setUp(test):
+    setup.placefulSetUp()
+    setup.setUpTraversal()
+    provideAdapters()
+    provideUtilities()
+    provideAdapter(getEvaluations, (Interface,), IEvaluations)
+
+
+def tearDown(test):
+    setup.placefulTearDown()
+
+
+def test_suite():
+    optionflags = (doctest.ELLIPSIS |
+                   doctest.NORMALIZE_WHITESPACE)
+    return doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                                optionflags=optionflags)
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -0,0 +1,134 @@
+# coding=UTF8
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for schooltool.requirement.generations.evolve5
+"""
+
+import datetime
+import unittest, doctest
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.component import getUtility
+from zope.intid.interfaces import IIntIds
+from zope.site import LocalSiteManager
+
+from schooltool.person.person import PersonContainer, Person
+from schooltool.requirement.evaluation import Evaluations, Evaluation
+from schooltool.requirement.evaluation import EvaluationHistory
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+from schooltool.requirement.requirement import Requirement
+from schooltool.requirement.scoresystem import PassFail
+from schooltool.requirement.generations.tests import (
+    ContextStub, provideAdapters, provideUtilities)
+from schooltool.requirement.generations.evolve5 import evolve
+
+
+def doctest_evolve5():
+    """Evolution to generation 5.
+
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+        >>> intids = getUtility(IIntIds)
+
+    Let's set up a person with evaluations stored as full evaluation
+    objects.
+
+        >>> app['persons'] = PersonContainer()
+        >>> person = app['persons']['student'] = Person('student')
+        >>> evaluations = IAnnotations(person)[EVALUATIONS_KEY] = Evaluations()
+        >>> evaluations.__parent__ = person
+
+        >>> req = Requirement(u'Essay')
+        >>> req_id = intids.register(req)
+        >>> def evaluation(value, day):
+        ...     result = Evaluation(req, PassFail, value, 'teacher')
+        ...     result.time = datetime.datetime(2014, 9, day, 10, 0)
+        ...     return result
+
+        >>> evaluations._btree[req_id] = evaluation('Pass', 3)
+        >>> history = EvaluationHistory()
+        >>> history.append(evaluation('Fail', 1))
+        >>> history.append(None)
+        >>> evaluations._history = type(evaluations._btree)()
+        >>> evaluations._history[req_id] = history
+
+    Those are still readable before the evolution.
+
+        >>> evaluations[req]
+        <Evaluation for Requirement(u'Essay'), value='Pass'>
+
+        >>> evolve(context)
+
+    Now the evaluations are stored as records.
+
+        >>> evaluations._btree[req_id]
+        <schooltool.requirement.evaluation.EvaluationRecord object at ...>
+        >>> list(history._entries.values())
+        [<schooltool.requirement.evaluation.EvaluationRecord object at ...>,
+         None]
+
+    They are still available as evaluations.
+
+        >>> evaluation = evaluations[req]
+        >>> evaluation
+        <Evaluation for Requirement(u'Essay'), value='Pass'>
+        >>> evaluation.scoreSystem
+        <GlobalDiscreteValuesScoreSystem u'Pass/Fail'>
+        >>> evaluation.evaluator
+        'teacher'
+        >>> evaluation.time
+        datetime.datetime(2014, 9, 3, 10, 0)
+        >>> evaluation.evaluatee
+        <...Person object at ...>
+
+        >>> evaluations.getHistory(req)
+        [<Evaluation for Requirement(u'Essay'), value='Fail'>, None]
+
+    Running the evolution again changes nothing.
+
+        >>> record = evaluations._btree[req_id]
+        >>> evolve(context)
+        >>> evaluations._btree[req_id] is record
+        True
+
+    """
+
+
+def setUp(test):
+    setup.placefulSetUp()
+    setup.setUpTraversal()
+    provideAdapters()
+    provideUtilities()
+
+
+def tearDown(test):
+    setup.placefulTearDown()
+
+
+def test_suite():
+    optionflags = (doctest.ELLIPSIS |
+                   doctest.NORMALIZE_WHITESPACE)
+    return doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                                optionflags=optionflags)
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -0,0 +1,96 @@
+# coding=UTF8
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests for schooltool.requirement.generations.evolve6
+"""
+
+import unittest, doctest
+
+from zope.annotation.interfaces import IAnnotations
+from zope.app.generations.utility import getRootFolder
+from zope.app.testing import setup
+from zope.site import LocalSiteManager
+
+from schooltool.person.person import PersonContainer, Person
+from schooltool.requirement.evaluation import Evaluations
+from schooltool.requirement.evaluation import EVALUATIONS_KEY
+from schooltool.requirement.generations.tests import (
+    ContextStub, provideAdapters, provideUtilities)
+from schooltool.requirement.generations.evolve6 import evolve
+
+
+def doctest_evolve6():
+    """Evolution to generation 6.
+
+        >>> context = ContextStub()
+        >>> app = getRootFolder(context)
+        >>> app.setSiteManager(LocalSiteManager(app))
+
+    Let's set up two persons with evaluations, one of them without a
+    history tree, and a person without evaluations.
+
+        >>> app['persons'] = PersonContainer()
+        >>> def addEvaluations(name):
+        ...     person = app['persons'][name] = Person(name)
+        ...     evaluations = IAnnotations(person)[EVALUATIONS_KEY] = (
+        ...         Evaluations())
+        ...     evaluations.__parent__ = person
+        ...     return evaluations
+
+        >>> old = addEvaluations('old')
+        >>> del old._history
+        >>> print old._history
+        None
+        >>> new = addEvaluations('new')
+        >>> history = new._history
+        >>> app['persons']['other'] = Person('other')
+
+        >>> evolve(context)
+
+    Now all evaluations have a history tree.
+
+        >>> old._history
+        <BTrees.IOBTree.IOBTree object at ...>
+        >>> new._history is history
+        True
+        >>> EVALUATIONS_KEY in IAnnotations(app['persons']['other'])
+        False
+
+    """
+
+
+def setUp(test):
+    setup.placefulSetUp()
+    setup.setUpTraversal()
+    provideAdapters()
+    provideUtilities()
+
+
+def tearDown(test):
+    setup.placefulTearDown()
+
+
+def test_suite():
+    optionflags = (doctest.ELLIPSIS |
+                   doctest.NORMALIZE_WHITESPACE)
+    return doctest.DocTestSuite(setUp=setUp, tearDown=tearDown,
+                                optionflags=optionflags)
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')
@@ -0,0 +1,426 @@
+#
+# SchoolTool - common information systems platform for school administration
+# Copyright (c) 2014 Shuttleworth Foundation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evaluation index
+
+Site-wide index of the evaluations by evaluator and by time, so that audit
+queries don't have to walk the evaluations of every person.
+"""
+__docformat__ = 'reStructuredText'
+
+import persistent
+from BTrees.LLBTree import LLTreeSet, multiunion, intersection
+from BTrees.LOBTree import LOBTree
+from BTrees.OOBTree import OOBTree
+
+from zope import annotation
+from zope.component import adapts, adapter, queryUtility
+from zope.container.contained import Contained
+from zope.interface import implements, implementer
+from zope.intid.interfaces import IIntIds
+from zope.lifecycleevent.interfaces import IObjectAddedEvent
+from zope.lifecycleevent.interfaces import IObjectRemovedEvent
+from zope.location import location
+from zope.security import proxy
+
+from schooltool.app.interfaces import ISchoolToolApplication
+from schooltool.schoolyear.subscriber import ObjectEventAdapterSubscriber
+
+from schooltool.requirement import interfaces
+from schooltool.requirement.evaluation import AbstractQueryAdapter
+from schooltool.requirement.evaluation import getRequirementList
+from schooltool.requirement.evaluation import timestamp
+
+
+EVALUATION_INDEX_KEY = 'schooltool.requirement.evaluation_index'
+
+# Documents are identified by the int ids of the evaluatee and the
+# requirement packed into a single long.
+ID_RANGE = 2 ** 32
+
+
+def makeDocumentId(evaluatee_id, requirement_id):
+    return evaluatee_id * ID_RANGE + requirement_id
+
+
+def splitDocumentId(docid):
+    return divmod(docid, ID_RANGE)
+
+
+def getEvaluatorKey(evaluator):
+    """Return the username of the evaluator to index by."""
+    if evaluator is None or isinstance(evaluator, basestring):
+        return evaluator
+    return getattr(evaluator, 'username', None)
+
+
+def queryIntId(obj):
+    intids = queryUtility(IIntIds)
+    if intids is None:
+        return None
+    return intids.queryId(proxy.removeSecurityProxy(obj))
+
+
+class EvaluationIndex(persistent.Persistent, Contained):
+    """Index of evaluations by evaluator and by time."""
+    implements(interfaces.IEvaluationIndex)
+
+    def __init__(self):
+        self._evaluator = OOBTree()
+        self._time = LOBTree()
+        self._documents = LOBTree()
+
+    def _add(self, index, key, docid):
+        docids = index.get(key)
+        if docids is None:
+            docids = index[key] = LLTreeSet()
+        docids.insert(docid)
+
+    def _remove(self, index, key, docid):
+        docids = index.get(key)
+        if docids is None:
+            return
+        docids.remove(docid)
+        if not docids:
+            del index[key]
+
+    def index(self, evaluatee_id, requirement_id, evaluation):
+        """See interfaces.IEvaluationIndex"""
+        docid = makeDocumentId(evaluatee_id, requirement_id)
+        self._unindex(docid)
+        evaluator = getEvaluatorKey(evaluation.evaluator)
+        time = getattr(evaluation, 'time', None)
+        if time is not None:
+            time = timestamp(time)
+        if evaluator is not None:
+            self._add(self._evaluator, evaluator, docid)
+        if time is not None:
+            self._add(self._time, time, docid)
+        self._documents[docid] = (evaluator, time)
+
+    def _unindex(self, docid):
+        if docid not in self._documents:
+            return
+        evaluator, time = self._documents.pop(docid)
+        if evaluator is not None:
+            self._remove(self._evaluator, evaluator, docid)
+        if time is not None:
+            self._remove(self._time, time, docid)
+
+    def unindex(self, evaluatee_id, requirement_id):
+        """See interfaces.IEvaluationIndex"""
+        self._unindex(makeDocumentId(evaluatee_id, requirement_id))
+
+    def clear(self):
+        """See interfaces.IEvaluationIndex"""
+        self._evaluator.clear()
+        self._time.clear()
+        self._documents.clear()
+
+    def search(self, evaluator=None, start=None, end=None, evaluatee_id=None):
+        """See interfaces.IEvaluationIndex"""
+        min = timestamp(start) if start is not None else None
+        max = timestamp(end) if end is not None else None
+        if evaluatee_id is not None:
+            return EvaluationsResult(
+                self._searchEvaluatee(evaluatee_id, evaluator, min, max))
+        result = None
+        if evaluator is not None:
+            result = self._evaluator.get(evaluator, LLTreeSet())
+        if min is not None or max is not None:
+            docids = multiunion(list(self._time.values(min, max)))
+            result = docids if result is None else intersection(result, docids)
+        if result is None:
+            result = self._documents
+        return EvaluationsResult(result)
+
+    def _searchEvaluatee(self, evaluatee_id, evaluator, min, max):
+        # An evaluatee has few evaluations, they are filtered by their
+        # indexed values instead of merging the index of the whole school
+        first = makeDocumentId(evaluatee_id, 0)
+        docids = LLTreeSet()
+        for docid, (doc_evaluator, time) in self._documents.items(
+                first, first + ID_RANGE - 1):
+            if evaluator is not None and doc_evaluator != evaluator:
+                continue
+            if min is not None or max is not None:
+                if (time is None or
+                    (min is not None and time < min) or
+                    (max is not None and time > max)):
+                    continue
+            docids.insert(docid)
+        return docids
+
+
+class EvaluationsResult(object):
+    """Evaluations found in the index, looked up lazily."""
+    implements(interfaces.IEvaluationsResult)
+
+    def __init__(self, docids):
+        self.docids = docids
+
+    def __len__(self):
+        return len(self.docids)
+
+    def __nonzero__(self):
+        return bool(self.docids)
+
+    def items(self):
+        """See interfaces.IEvaluationsResult"""
+        intids = queryUtility(IIntIds)
+        evaluatee_id = evaluatee = evaluations = None
+        for docid in self.docids.keys():
+            next_id, requirement_id = splitDocumentId(docid)
+            if next_id != evaluatee_id:
+                evaluatee_id = next_id
+                evaluatee = intids.queryObject(evaluatee_id)
+                evaluations = interfaces.IEvaluations(evaluatee, None)
+            if evaluations is None:
+                continue
+            requirement = intids.queryObject(requirement_id)
+            if requirement is None:
+                continue
+            evaluation = evaluations.get(requirement)
+            if evaluation is not None:
+                yield evaluatee, evaluation
+
+    def __iter__(self):
+        for evaluatee, evaluation in self.items():
+            yield evaluation
+
+
+@adapter(ISchoolToolApplication)
+@implementer(interfaces.IEvaluationIndex)
+def getEvaluationIndex(app):
+    annotations = annotation.interfaces.IAnnotations(app)
+    try:
+        return annotations[EVALUATION_INDEX_KEY]
+    except KeyError:
+        index = EvaluationIndex()
+        annotations[EVALUATION_INDEX_KEY] = index
+        location.locate(index, proxy.removeSecurityProxy(app),
+                        EVALUATION_INDEX_KEY)
+        return index
+# Convention to make adapter introspectable
+getEvaluationIndex.factory = EvaluationIndex
+
+
+def queryEvaluationIndex():
+    app = ISchoolToolApplication(None, None)
+    if app is None:
+        return None
+    return interfaces.IEvaluationIndex(app, None)
+
+
+def updateEvaluationIndex(evaluatee, evaluation, remove=False):
+    """Index or unindex the evaluation in the evaluation index."""
+    index = queryEvaluationIndex()
+    if index is None:
+        return
+    evaluatee_id = queryIntId(evaluatee)
+    requirement_id = queryIntId(evaluation.requirement)
+    if evaluatee_id is None or requirement_id is None:
+        return
+    if remove:
+        index.unindex(evaluatee_id, requirement_id)
+    else:
+        index.index(evaluatee_id, requirement_id, evaluation)
+
+
+class EvaluationAddedSubscriber(ObjectEventAdapterSubscriber):
+    """Index added evaluations."""
+    adapts(IObjectAddedEvent, interfaces.IEvaluation)
+
+    def __call__(self):
+        evaluations = self.event.newParent
+        if not interfaces.IEvaluations.providedBy(evaluations):
+            return
+        updateEvaluationIndex(evaluations.__parent__, self.object)
+
+
+class EvaluationRemovedSubscriber(ObjectEventAdapterSubscriber):
+    """Unindex removed evaluations."""
+    adapts(IObjectRemovedEvent, interfaces.IEvaluation)
+
+    def __call__(self):
+        evaluations = self.event.oldParent
+        if not interfaces.IEvaluations.providedBy(evaluations):
+            return
+        updateEvaluationIndex(evaluations.__parent__, self.object,
+                              remove=True)
+
+
+class EvaluationsModifiedSubscriber(ObjectEventAdapterSubscriber):
+    """Index a batch of added evaluations."""
+    adapts(interfaces.IEvaluationsModifiedEvent, interfaces.IEvaluations)
+
+    def __call__(self):
+        for evaluation in self.event.evaluations:
+            updateEvaluationIndex(self.object.__parent__, evaluation)
+
+
+class IndexedEvaluations(Contained):
+    """Evaluations of an evaluatee found in the evaluation index.
+
+    Nothing is copied, the evaluations are read from the evaluations of the
+    evaluatee when the result is read.  The result has the parent and name
+    of those evaluations, so that queries can be chained, but it cannot be
+    changed.
+    """
+    implements(interfaces.IEvaluations)
+
+    def __init__(self, evaluations, requirement_ids):
+        self.evaluations = evaluations
+        self.requirement_ids = requirement_ids
+        location.locate(self, evaluations.__parent__, evaluations.__name__)
+
+    def _queryKey(self, requirement):
+        return queryIntId(requirement)
+
+    def _subset(self, requirement_ids):
+        return IndexedEvaluations(self.evaluations, requirement_ids)
+
+    def _found(self, requirement):
+        requirement_id = self._queryKey(requirement)
+        return (requirement_id is not None and
+                requirement_id in self.requirement_ids)
+
+    def __getitem__(self, key):
+        """See zope.interface.common.mapping.IItemMapping"""
+        if not self._found(key):
+            raise KeyError(key)
+        return self.evaluations[key]
+
+    def get(self, key, default=None):
+        """See zope.interface.common.mapping.IReadMapping"""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        """See zope.interface.common.mapping.IReadMapping"""
+        return self._found(key) and key in self.evaluations
+
+    def items(self):
+        """See zope.interface.common.mapping.IEnumerableMapping"""
+        intids = queryUtility(IIntIds)
+        result = []
+        for requirement_id in self.requirement_ids:
+            requirement = intids.queryObject(requirement_id)
+            if requirement is None:
+                continue
+            evaluation = self.evaluations.get(requirement)
+            if evaluation is not None:
+                result.append((requirement, evaluation))
+        return result
+
+    def keys(self):
+        """See zope.interface.common.mapping.IEnumerableMapping"""
+        return [requirement for requirement, evaluation in self.items()]
+
+    def __iter__(self):
+        """See zope.interface.common.mapping.IEnumerableMapping"""
+        return iter(self.keys())
+
+    def values(self):
+        """See zope.interface.common.mapping.IEnumerableMapping"""
+        return [evaluation for requirement, evaluation in self.items()]
+
+    def __len__(self):
+        """See zope.interface.common.mapping.IEnumerableMapping"""
+        return len(self.requirement_ids)
+
+    def getHistory(self, requirement):
+        """See interfaces.IEvaluations"""
+        return self.evaluations.getHistory(requirement)
+
+    def hasHistory(self, requirement):
+        """See interfaces.IEvaluations"""
+        return self.evaluations.hasHistory(requirement)
+
+    def iterHistory(self, requirement, reverse=False, start=0, count=None):
+        """See interfaces.IEvaluations"""
+        return self.evaluations.iterHistory(
+            requirement, reverse=reverse, start=start, count=count)
+
+    def getEvaluationsForRequirement(self, req, recurse=True):
+        """See interfaces.IEvaluations"""
+        keys = set(map(self._queryKey, getRequirementList(req, recurse)))
+        return self._subset(LLTreeSet(
+            [requirement_id for requirement_id in self.requirement_ids
+             if requirement_id in keys]))
+
+    def getEvaluationsOfEvaluator(self, evaluator):
+        """See interfaces.IEvaluations"""
+        return self._subset(LLTreeSet(
+            [self._queryKey(requirement)
+             for requirement, evaluation in self.items()
+             if evaluation.evaluator == evaluator]))
+
+    def __repr__(self):
+        return '<%s for %r>' % (self.__class__.__name__, self.__parent__)
+
+    def _readOnly(self, *args, **kw):
+        raise TypeError('Evaluations found in the index cannot be changed')
+
+    __setitem__ = __delitem__ = _readOnly
+    addEvaluation = addEvaluations = appendToHistory = _readOnly
+
+
+class IndexQueryAdapter(AbstractQueryAdapter):
+    """Base of queries answered from the evaluation index.
+
+    The result is an ``IndexedEvaluations`` that reads the evaluations it
+    found from the queried evaluations, nothing is copied.
+    """
+
+    def _search(self, **kwargs):
+        index = queryEvaluationIndex()
+        evaluatee_id = queryIntId(self.context.__parent__)
+        if index is None or evaluatee_id is None:
+            return EvaluationsResult(LLTreeSet())
+        return index.search(evaluatee_id=evaluatee_id, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        """See interfaces.IEvaluationsQuery"""
+        evaluations = proxy.removeSecurityProxy(self.context)
+        found = self._query(*args, **kwargs)
+        requirement_ids = LLTreeSet([splitDocumentId(docid)[1]
+                                     for docid in found.docids.keys()])
+        if isinstance(evaluations, IndexedEvaluations):
+            # Chained queries
+            requirement_ids = LLTreeSet(intersection(
+                requirement_ids, evaluations.requirement_ids))
+            evaluations = evaluations.evaluations
+        return IndexedEvaluations(evaluations, requirement_ids)
+
+
+class EvaluatorQuery(IndexQueryAdapter):
+    """Evaluations made by the evaluator, optionally in a period of time."""
+
+    def _query(self, evaluator, start=None, end=None):
+        return self._search(evaluator=getEvaluatorKey(evaluator),
+                            start=start, end=end)
+
+
+class TimeQuery(IndexQueryAdapter):
+    """Evaluations made in a period of time."""
+
+    def _query(self, start=None, end=None):
+        return self._search(start=start, end=end)
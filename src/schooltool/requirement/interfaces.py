@@ -24,6 +24,7 @@ import zope.schema
 from zope.container.interfaces import IOrderedContainer, IContainer
 from zope.container.constraints import contains, containers
 from zope.location.interfaces import IContained
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
 
 from schooltool.requirement import RequirementMessage as _
 
@@ -88,6 +89,12 @@ class IScoreSystem(zope.interface.Interface):
         values.
         """
 
+    def fromUnicodeMany(rawScores):
+        """Convert a list of unicode scores, like a column of a worksheet.
+
+        Raises a validation error for the first invalid score.
+        """
+
 
 class ICommentScoreSystem(IScoreSystem):
     """A Score System for free-form comments."""
@@ -136,6 +143,40 @@ class IDiscreteValuesScoreSystem(IValuesScoreSystem):
         value_type=zope.schema.Tuple(),
         required=True)
 
+    lookup = zope.interface.Attribute(
+        """The ``IDiscreteScoresLookup`` of the scores.
+
+        It is cached until a new list of scores is assigned.""")
+
+    def convertAverages(averages):
+        """Convert a list of percentage averages to scores.
+
+        ``None`` is returned for averages that are ``None`` or below the
+        percents of all scores.
+        """
+
+
+class IDiscreteScoresLookup(zope.interface.Interface):
+    """Compiled lookup tables of the scores of a discrete score system."""
+
+    values = zope.interface.Attribute(
+        """Mapping of scores to their numerical values.""")
+
+    labels = zope.interface.Attribute(
+        """Mapping of lower case scores to scores.""")
+
+    minimum = zope.interface.Attribute(
+        """Numerical value of the last (worst) score.""")
+
+    maximum = zope.interface.Attribute(
+        """Numerical value of the first (best) score.""")
+
+    def fromUnicode(rawScore):
+        """Return the score matching rawScore ignoring case, or None."""
+
+    def convertPercent(percent):
+        """Return the first score whose percent is reached, or None."""
+
 
 class ICustomScoreSystem(IDiscreteValuesScoreSystem):
     """A user-created score system that consists of discrete values."""
@@ -232,12 +273,32 @@ class IEvaluations(zope.interface.common.mapping.IMapping):
     def addEvaluation(evaluation):
         """Add an evaluation."""
 
+    def addEvaluations(evaluations):
+        """Add several evaluations at once.
+
+        Previous evaluations of the requirements are appended to the history
+        and a single ``IEvaluationsModifiedEvent`` is sent for the whole
+        batch, instead of an added event for every evaluation.
+        """
+
     def appendToHistory(self, requirement, evaluation):
         """Append a historical record for the requirement."""
 
     def getHistory(self, requirement):
         """Read historical records of this requirement."""
 
+    def hasHistory(requirement):
+        """Check whether there are historical records of this requirement."""
+
+    def iterHistory(requirement, reverse=False, start=0, count=None):
+        """Iterate over historical records of this requirement.
+
+        The records are loaded lazily, oldest first, or most recent first
+        if ``reverse`` is set.  The first ``start`` records are skipped and
+        at most ``count`` records are returned, all of them if ``count`` is
+        None.
+        """
+
     def getEvaluationsForRequirement(requirement, recursive=True):
         """Match all evaluations that satisfy the requirement.
 
@@ -255,6 +316,13 @@ class IEvaluations(zope.interface.common.mapping.IMapping):
         """
 
 
+class IEvaluationsModifiedEvent(IObjectModifiedEvent):
+    """Several evaluations were added to an ``IEvaluations`` object."""
+
+    evaluations = zope.interface.Attribute(
+        """List of the added evaluations.""")
+
+
 class IEvaluationsQuery(zope.interface.Interface):
     """Evaluation Query
 
@@ -267,3 +335,46 @@ class IEvaluationsQuery(zope.interface.Interface):
         The returned ``IEvaluations`` object *must* have the same parent and
         name that the original ``IEvaluations`` object had.
         """
+
+
+class IEvaluationsResult(zope.interface.Interface):
+    """Lazy result of an evaluation index search.
+
+    Evaluations are looked up only while iterating over the result.
+    """
+
+    def __len__():
+        """Return the number of evaluations found."""
+
+    def __iter__():
+        """Iterate over the evaluations found."""
+
+    def items():
+        """Iterate over (evaluatee, evaluation) pairs."""
+
+
+class IEvaluationIndex(zope.interface.Interface):
+    """Site-wide index of evaluations by evaluator and time.
+
+    Evaluations are identified by the int ids of the evaluatee and the
+    requirement.  The index is maintained by evaluation event subscribers.
+    """
+
+    def index(evaluatee_id, requirement_id, evaluation):
+        """Index the evaluation, replacing the previous one."""
+
+    def unindex(evaluatee_id, requirement_id):
+        """Remove the evaluation from the index."""
+
+    def clear():
+        """Remove all evaluations from the index."""
+
+    def search(evaluator=None, start=None, end=None, evaluatee_id=None):
+        """Search for evaluations.
+
+        ``evaluator`` is the username of the evaluator, ``start`` and ``end``
+        are naive UTC datetimes bounding the time of the evaluations.  The
+        search can be restricted to the evaluations of one evaluatee.
+
+        Return an ``IEvaluationsResult``.
+        """
@@ -21,8 +21,9 @@
 __docformat__ = 'restructuredtext'
 
 import BTrees.OOBTree
+from BTrees.LOBTree import LOBTree
+from BTrees.OLBTree import OLBTree
 import persistent
-import persistent.list
 import zope.event
 import zope.container.contained
 import zope.lifecycleevent
@@ -37,6 +38,10 @@ from schooltool.requirement import interfaces
 
 REQUIREMENT_KEY = "schooltool.requirement"
 
+# Distance between the sort keys of consecutive requirements, leaves room
+# to move requirements around without renumbering
+ORDER_STEP = 2 ** 16
+
 
 def getRequirementKey(requirement):
     """Get the reference key for any requirement."""
@@ -47,29 +52,90 @@ class Requirement(persistent.Persistent, Contained):
     """A persistent requirement using a BTree for sub-requirements"""
     implements(interfaces.IRequirement)
 
+    # Requirements created before the order was kept in BTrees have a list
+    # of keys in _order and no _positions.  They are converted on the first
+    # change.
+    _positions = None
+    # Incremented on every change of the contained requirements
+    _version = 0
+
     def __init__(self, title):
         super(Requirement, self).__init__()
         # See interfaces.IRequirement
         self.title = title
         # Storage for contained requirements
         self._data = BTrees.OOBTree.OOBTree()
-        # List of keys that describe the order of the contained requirements
-        self._order = persistent.list.PersistentList()
+        # Keys of the contained requirements by sort key, and back
+        self._order = LOBTree()
+        self._positions = OLBTree()
+
+    def _orderedKeys(self):
+        if self._positions is None:
+            return self._order
+        return self._order.values()
+
+    def _setOrder(self, keys):
+        self._order = LOBTree()
+        self._positions = OLBTree()
+        for n, key in enumerate(keys):
+            self._order[(n + 1) * ORDER_STEP] = key
+            self._positions[key] = (n + 1) * ORDER_STEP
+
+    def _convertOrder(self):
+        if self._positions is None:
+            self._setOrder(list(self._order))
+
+    def _changed(self):
+        self._version += 1
 
     def changePosition(self, name, pos):
-        """See interfaces.IRequirement"""
-        old_pos = self._order.index(name)
-        self._order.remove(name)
-        self._order.insert(pos, name)
+        """See interfaces.IRequirement
+
+        The move itself is a couple of O(log n) tree operations, but finding
+        the neighbours at a position (``self._order.keys()[pos]``) walks the
+        buckets of the order tree up to it, so moves take time linear in the
+        number of buckets.  Renumbering, when two neighbours have no room
+        left between them, is linear in the number of requirements.
+        """
+        self._convertOrder()
+        if name not in self._positions:
+            raise ValueError('%r is not in the requirement.' % name)
+        del self._order[self._positions[name]]
+        sort_keys = self._order.keys()
+        length = len(self._order)
+        if pos < 0:
+            pos = max(pos + length, 0)
+        pos = min(pos, length)
+        before = sort_keys[pos - 1] if pos > 0 else None
+        after = sort_keys[pos] if pos < length else None
+        if before is None and after is None:
+            sort_key = ORDER_STEP
+        elif after is None:
+            sort_key = before + ORDER_STEP
+        elif before is None:
+            sort_key = after - ORDER_STEP
+        elif after - before > 1:
+            sort_key = (before + after) // 2
+        else:
+            sort_key = None
+        if sort_key is None:
+            # No room left between the neighbours, renumber everything
+            keys = list(self._order.values())
+            keys.insert(pos, name)
+            self._setOrder(keys)
+        else:
+            self._order[sort_key] = name
+            self._positions[name] = sort_key
+        self._changed()
         zope.container.contained.notifyContainerModified(self)
 
     def keys(self):
         """See interface `IReadContainer`"""
-        return self._order
+        return list(self._orderedKeys())
 
     def __iter__(self):
         """See interface `IReadContainer`"""
-        return iter(self.keys())
+        return iter(self._orderedKeys())
 
     def __getitem__(self, key):
         """See interface `IReadContainer`"""
@@ -83,21 +149,29 @@ class Requirement(persistent.Persistent, Contained):
             return default
 
     def values(self):
-        """See interface `IReadContainer`"""
-        return [value for key, value in self.items()]
+        """See interface `IReadContainer`
+
+        The values are returned as a tuple that is cached until the
+        requirement is changed, so it can be reused by callers.
+        """
+        cached = getattr(self, '_v_values', None)
+        if cached is None or cached[0] != self._version:
+            values = tuple([self._data[key] for key in self._orderedKeys()])
+            cached = self._v_values = (self._version, values)
+        return cached[1]
 
     def __len__(self):
         """See interface `IReadContainer`"""
-        return len(self.keys())
+        return len(self._data)
 
     def items(self):
         """See interface `IReadContainer`"""
-        for key in self.keys():
+        for key in self._orderedKeys():
             yield key, self[key]
 
     def __contains__(self, key):
         """See interface `IReadContainer`"""
-        return key in self.keys()
+        return key in self._data
 
     has_key = __contains__
 
@@ -106,8 +180,14 @@ class Requirement(persistent.Persistent, Contained):
         newobject, event = zope.container.contained.containedEvent(
             newobject, self, key)
         self._data[key] = newobject
-        if key not in self._order:
-            self._order.append(key)
+        self._convertOrder()
+        if key not in self._positions:
+            sort_key = ORDER_STEP
+            if self._order:
+                sort_key += self._order.maxKey()
+            self._order[sort_key] = key
+            self._positions[key] = sort_key
+        self._changed()
         if event:
             zope.event.notify(event)
             zope.lifecycleevent.modified(self)
@@ -116,14 +196,18 @@ class Requirement(persistent.Persistent, Contained):
         """See interface `IWriteContainer`"""
         zope.container.contained.uncontained(self._data[key], self, key)
         del self._data[key]
-        self._order.remove(key)
+        self._convertOrder()
+        del self._order[self._positions[key]]
+        del self._positions[key]
+        self._changed()
 
     def updateOrder(self, order):
         """See zope.container.interfaces.IOrderedContainer"""
-        if set(self._order) != set(order):
+        if set(self._orderedKeys()) != set(order):
             raise ValueError("Incompatible key set.")
 
-        self._order = persistent.list.PersistentList(order)
+        self._setOrder(order)
+        self._changed()
         zope.container.contained.notifyContainerModified(self)
 
     def __repr__(self):
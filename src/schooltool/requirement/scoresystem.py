@@ -19,6 +19,8 @@
 """
 __docformat__ = 'restructuredtext'
 
+import bisect
+import weakref
 from decimal import Decimal, InvalidOperation
 
 from persistent import Persistent
@@ -27,7 +29,6 @@ from zope.componentvocabulary.vocabulary import UtilityVocabulary
 from zope.container.btree import BTreeContainer
 from zope.container.interfaces import INameChooser
 from zope.interface import implements, Interface
-from zope.cachedescriptors.property import Lazy
 import zope.schema
 from zope.schema.vocabulary import SimpleVocabulary
 import zope.security.checker
@@ -137,6 +138,10 @@ class AbstractScoreSystem(object):
         """See interfaces.IScoreSystem"""
         raise NotImplementedError
 
+    def fromUnicodeMany(self, rawScores):
+        """See interfaces.IScoreSystem"""
+        return [self.fromUnicode(rawScore) for rawScore in rawScores]
+
 
 class GlobalCommentScoreSystem(AbstractScoreSystem):
     implements(interfaces.ICommentScoreSystem)
@@ -189,6 +194,47 @@ class AbstractValuesScoreSystem(AbstractScoreSystem):
         raise NotImplementedError
 
 
+class DiscreteScoresLookup(object):
+    """Compiled lookup tables of the scores of a discrete score system."""
+    implements(interfaces.IDiscreteScoresLookup)
+
+    def __init__(self, scores):
+        self.values = dict([(score, value)
+                            for score, abbr, value, percent in scores])
+        self.labels = {}
+        for score, abbr, value, percent in scores:
+            self.labels.setdefault(score.lower(), score)
+        self.maximum = self.minimum = None
+        if scores:
+            self.maximum = scores[0][2]
+            self.minimum = scores[-1][2]
+        # A percentage is converted to the first score it reaches, so a
+        # score can only be reached if its percent is lower than the
+        # percents of all the scores before it.
+        thresholds = []
+        for score, abbr, value, percent in scores:
+            if not thresholds or percent < thresholds[-1][0]:
+                thresholds.append((percent, score))
+        thresholds.reverse()
+        self._percents = [percent for percent, score in thresholds]
+        self._percent_scores = [score for percent, score in thresholds]
+
+    def fromUnicode(self, rawScore):
+        """See interfaces.IDiscreteScoresLookup"""
+        return self.labels.get(rawScore.lower())
+
+    def convertPercent(self, percent):
+        """See interfaces.IDiscreteScoresLookup"""
+        index = bisect.bisect_right(self._percents, percent) - 1
+        if index < 0:
+            return None
+        return self._percent_scores[index]
+
+
+# Lookups of the score systems, rebuilt when the scores are replaced
+_lookups = weakref.WeakKeyDictionary()
+
+
 class DiscreteValuesScoreSystem(AbstractValuesScoreSystem):
     """Abstract Discrete Values Score System"""
 
@@ -217,7 +263,7 @@ class DiscreteValuesScoreSystem(AbstractValuesScoreSystem):
             return None
         if self._minPassingScore is None:
             return None
-        scores = self.scoresDict
+        scores = self.lookup.values
         if self._isMaxPassingScore:
             return scores[score] <= scores[self._minPassingScore]
         else:
@@ -227,10 +273,7 @@ class DiscreteValuesScoreSystem(AbstractValuesScoreSystem):
         """See interfaces.IScoreSystem"""
         if score is UNSCORED:
             return True
-        for s in self.scoresDict.keys():
-            if s.lower() == score.lower():
-                return True
-        return False
+        return self.lookup.fromUnicode(score) is not None
 
     def getBestScore(self):
         """See interfaces.IScoreSystem"""
@@ -240,30 +283,59 @@ class DiscreteValuesScoreSystem(AbstractValuesScoreSystem):
         """See interfaces.IScoreSystem"""
         if not rawScore:
             return UNSCORED
-        for score in self.scoresDict.keys():
-            if score.lower() == rawScore.lower():
-                return score
-        raise ScoreValidationError(rawScore)
+        score = self.lookup.fromUnicode(rawScore)
+        if score is None:
+            raise ScoreValidationError(rawScore)
+        return score
+
+    def fromUnicodeMany(self, rawScores):
+        """See interfaces.IScoreSystem"""
+        lookup = self.lookup
+        result = []
+        for rawScore in rawScores:
+            if not rawScore:
+                result.append(UNSCORED)
+                continue
+            score = lookup.fromUnicode(rawScore)
+            if score is None:
+                raise ScoreValidationError(rawScore)
+            result.append(score)
+        return result
 
     def getNumericalValue(self, score):
         """See interfaces.IScoreSystem"""
         if score is UNSCORED:
             return None
-        return self.scoresDict[score]
+        return self.lookup.values[score]
 
     def getFractionalValue(self, score):
         """See interfaces.IScoreSystem"""
-        # get maximum and minimum score to determine the range
-        maximum = self.scores[0][2]
-        minimum = self.scores[-1][2]
+        lookup = self.lookup
         # normalized numerical score
-        value = self.getNumericalValue(score) - minimum
-        return value / (maximum - minimum)
-
-    @Lazy
+        value = self.getNumericalValue(score) - lookup.minimum
+        return value / (lookup.maximum - lookup.minimum)
+
+    def convertAverages(self, averages):
+        """See interfaces.IDiscreteValuesScoreSystem"""
+        convert = self.lookup.convertPercent
+        return [None if average is None else convert(average)
+                for average in averages]
+
+    @property
+    def lookup(self):
+        """See interfaces.IDiscreteValuesScoreSystem"""
+        # The lookup is kept for the list of scores it was built from, so
+        # it is rebuilt when the scores are replaced, also when the score
+        # system is edited in another transaction.
+        scores = self.scores
+        cached = _lookups.get(self)
+        if cached is None or cached[0] is not scores:
+            cached = _lookups[self] = (scores, DiscreteScoresLookup(scores))
+        return cached[1]
+
+    @property
     def scoresDict(self):
-        scores = [(score, value) for score, abbr, value, percent in self.scores]
-        return dict(scores)
+        return self.lookup.values
 
 class GlobalDiscreteValuesScoreSystem(DiscreteValuesScoreSystem):
 
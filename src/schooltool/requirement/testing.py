@@ -20,8 +20,10 @@
 __docformat__ = 'reStructuredText'
 
 from zope.interface import Interface
-from zope.component import provideAdapter
+from zope.component import provideAdapter, provideUtility
 from zope.container.interfaces import INameChooser
+from zope.intid import IntIds
+from zope.intid.interfaces import IIntIds
 from zope.keyreference.interfaces import IKeyReference
 
 from schooltool.app.interfaces import ISchoolToolApplication
@@ -68,6 +70,7 @@ def setUpEvaluation(test=None):
     provideAdapter(KeyReferenceStub,
                    (Interface,),
                    IKeyReference)
+    provideUtility(IntIds(), IIntIds)
 def fixDecimal():
     """
     Monkey patch the decimal module to get the same output on python2.6